@@ -4,45 +4,80 @@ FastAPI application for Natural Language to Pinecone Query Agent
 
 from dotenv import load_dotenv
 load_dotenv(override=True)
-from fastapi import FastAPI, HTTPException
+from fastapi import BackgroundTasks, FastAPI, HTTPException
 from pydantic import BaseModel
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime
 import os
-import requests
+import time
 from nl2pinecone_agent import NL2PineconeAgent
+from embedding_client import EmbeddingClient
+from example_bank import ExampleBank
+from llm_backends import BACKENDS
+from vector_types import Vector, to_pinecone
+from chunking import collapse_chunk_matches, collapse_chunks_by_date
+from hot_tier import HotTierCache, get_hot_tier_path
+from temporal import resolve_temporal
+from filter_compiler import FilterValidationError, compile_filter
+from relaxation import RelaxedSearch, get_relaxation_mode
+from query_router import QueryRouter, get_routing_enabled
+from conversation import SessionStore, apply_refinement, get_session_capacity, get_session_ttl
+from llm_scheduler import LLMScheduler, get_interactive_reserve, get_lane_weights, get_scheduling_enabled
+from rate_limiter import RateLimiter
+from semantic_cache import SemanticFilterCache, DEFAULT_THRESHOLD, DEFAULT_CAPACITY, DEFAULT_TTL_SECONDS
 from pinecone import Pinecone
 import json
 
 
-def is_running_in_docker() -> bool:
-    """Check if the application is running inside a Docker container"""
-    return os.path.exists('/.dockerenv')
-
-
-def get_ollama_url() -> str:
-    """Get the appropriate Ollama URL based on the environment"""
-    base_url = os.getenv("OLLAMA_EMBED_URL", "http://localhost:11434/api/embeddings")
-    
-    if is_running_in_docker():
-        # Replace localhost with host.docker.internal for Docker environment
-        base_url = base_url.replace("localhost", "host.docker.internal")
-    
-    return base_url
-
 app = FastAPI(
     title="NL2Pinecone Query Agent",
     description="Convert natural language queries to Pinecone metadata filters",
     version="1.0.0"
 )
 
-# Initialize the agent
-agent = NL2PineconeAgent()
-
 # Initialize Pinecone client
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 PINECONE_INDEX = os.getenv("PINECONE_INDEX")
-OLLAMA_EMBED_URL = get_ollama_url()
+
+# Initialize the embedding client (load-balanced across OLLAMA_EMBED_URLS)
+embedding_client = EmbeddingClient()
+embedding_client.start_health_checks(float(os.getenv("EMBED_HEALTH_CHECK_INTERVAL", 15)))
+
+# Gemini calls share the GEMINI_RPM / GEMINI_TPM quota through priority lanes (LLM_SCHEDULING=false disables)
+llm_scheduler = LLMScheduler(
+    RateLimiter(float(os.getenv("GEMINI_RPM", 15)), float(os.getenv("GEMINI_TPM", 1000000))),
+    weights=get_lane_weights(),
+    interactive_reserve=get_interactive_reserve(),
+) if get_scheduling_enabled() else None
+
+# Initialize the agent; few-shot examples are selected with the same embeddings as search
+agent = NL2PineconeAgent(example_bank=ExampleBank.default(embedding_client.embed_batch), scheduler=llm_scheduler)
+
+# Articles are indexed as several chunk vectors; over-fetch so that collapsing
+# chunks back into documents still leaves top_k distinct documents
+CHUNK_OVERFETCH = int(os.getenv("CHUNK_OVERFETCH", 3))
+CHUNK_SCORE_AGGREGATION = os.getenv("CHUNK_SCORE_AGGREGATION", "max")
+PINECONE_MAX_TOP_K = 1000
+
+# Recent articles are served from the local hot tier when the date filter allows it
+hot_tier = HotTierCache(get_hot_tier_path())
+
+# Paraphrased queries reuse previously generated filters (SEMANTIC_CACHE_SIZE=0 disables)
+semantic_cache = SemanticFilterCache(
+    threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", DEFAULT_THRESHOLD)),
+    capacity=int(os.getenv("SEMANTIC_CACHE_SIZE", DEFAULT_CAPACITY)),
+    ttl_seconds=float(os.getenv("SEMANTIC_CACHE_TTL", DEFAULT_TTL_SECONDS)),
+    audit_rate=float(os.getenv("SEMANTIC_CACHE_AUDIT_RATE", 0.05)),
+)
+
+# Filters that match fewer than top_k documents are relaxed tier by tier (RELAXATION=off disables)
+relaxed_search = RelaxedSearch(get_relaxation_mode(), int(os.getenv("RELAXATION_WORKERS", 4)))
+
+# Filter-only queries skip the embedding, semantic-only ones the LLM (QUERY_ROUTING=false disables)
+query_router = QueryRouter(get_routing_enabled())
+
+# Conversational searches keep their last filter and embedding between turns
+sessions = SessionStore(get_session_capacity(), get_session_ttl())
 
 pinecone_client = None
 pinecone_index = None
@@ -58,6 +93,7 @@ if PINECONE_API_KEY and PINECONE_INDEX:
 class QueryRequest(BaseModel):
     """Request model for natural language queries"""
     query: str
+    backend: Optional[str] = None  # "gemini", "ollama", "replay" or "distilled"; defaults to LLM_BACKEND (distilled model first)
 
 
 class SearchRequest(BaseModel):
@@ -65,6 +101,9 @@ class SearchRequest(BaseModel):
     query: str
     top_k: Optional[int] = 10
     include_metadata: Optional[bool] = True
+    chunk_aggregation: Optional[str] = None  # "max" or "sum"; defaults to CHUNK_SCORE_AGGREGATION
+    backend: Optional[str] = None  # "gemini", "ollama", "replay" or "distilled"; defaults to LLM_BACKEND (distilled model first)
+    relax: Optional[bool] = True  # Relax the filter when it matches fewer than top_k documents
 
 
 class BatchSearchRequest(BaseModel):
@@ -72,10 +111,29 @@ class BatchSearchRequest(BaseModel):
     queries: List[str]
     top_k: Optional[int] = 10
     include_metadata: Optional[bool] = True
+    chunk_aggregation: Optional[str] = None  # "max" or "sum"; defaults to CHUNK_SCORE_AGGREGATION
+    backend: Optional[str] = None  # "gemini", "ollama", "replay" or "distilled"; defaults to LLM_BACKEND (distilled model first)
+    relax: Optional[bool] = True  # Relax the filters that match fewer than top_k documents
+
+
+class RefineRequest(BaseModel):
+    """Request model for a turn of a conversational search"""
+    utterance: str  # A full query to start a session, or a follow-up ("only from May", "drop the author")
+    session_id: Optional[str] = None  # Omit (or pass an expired id) to start a new session
+    top_k: Optional[int] = 10
+    include_metadata: Optional[bool] = True
+    chunk_aggregation: Optional[str] = None  # "max" or "sum"; defaults to CHUNK_SCORE_AGGREGATION
+    backend: Optional[str] = None  # "gemini", "ollama", "replay" or "distilled"; defaults to LLM_BACKEND (distilled model first)
+    relax: Optional[bool] = True  # Relax the filter when it matches fewer than top_k documents
 
 
 class SearchResult(BaseModel):
-    """Individual search result"""
+    """
+    Individual search result: one document. For chunked articles ``metadata`` is that
+    of the best-matching chunk, so ``content`` holds that passage rather than the full
+    article (``chunk_index``, ``chunk_count`` and ``matched_chunks`` locate it; the
+    article itself is at ``pageURL``).
+    """
     id: str
     score: float
     metadata: Optional[Dict[str, Any]] = None
@@ -88,6 +146,18 @@ class SearchResponse(BaseModel):
     results: List[SearchResult]
     total_results: int
     timestamp: str
+    source: Optional[str] = None  # "hot_tier" or "pinecone"
+    filter_source: Optional[str] = None  # "semantic_cache", "distilled", "llm" or "router" (semantic-only, no filter)
+    route: Optional[str] = None  # "filter_only", "semantic_only" or "hybrid"
+    relaxation_tier: Optional[str] = None  # "strict" or the relaxation that produced the results
+    applied_filter: Optional[Dict[str, Any]] = None  # The relaxed filter, when not strict
+
+
+class RefineResponse(SearchResponse):
+    """Response model for a turn of a conversational search"""
+    session_id: str
+    turn: int
+    refinement: str  # "new" (first turn), "local" (delta applied without the LLM) or "llm"
 
 
 class QueryResponse(BaseModel):
@@ -96,25 +166,249 @@ class QueryResponse(BaseModel):
     pinecone_filter: Dict[str, Any]
     is_valid: bool
     timestamp: str
+    route: Optional[str] = None  # "filter_only", "semantic_only" or "hybrid"
 
 
-def generate_embedding(text: str) -> List[float]:
-    """Generate embedding for text using Ollama"""
+def generate_embedding(text: str) -> Vector:
+    """Generate a float32 embedding for text using Ollama"""
     try:
-        response = requests.post(
-            OLLAMA_EMBED_URL,
-            json={"model": "nomic-embed-text", "prompt": text}
-        )
-        response.raise_for_status()
-        emb_json = response.json()
-        vector = emb_json.get("embedding")
-        if not vector or not isinstance(vector, list):
-            raise ValueError(f"Ollama returned invalid embedding: {emb_json}")
-        return vector
+        return embedding_client.embed(text)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating embedding: {str(e)}")
 
 
+def check_backend(backend: Optional[str]) -> None:
+    """Reject unknown per-request LLM backends"""
+    if backend is not None and backend not in BACKENDS:
+        raise HTTPException(status_code=400, detail=f"Unknown backend '{backend}'; choose one of {sorted(BACKENDS)}")
+
+
+def current_gazetteer():
+    """The agent's gazetteer, None while there is no vocabulary"""
+    return agent.gazetteer.get() if agent.gazetteer is not None else None
+
+
+def snap_to_vocabulary(pinecone_filter: Dict[str, Any], query: str) -> Dict[str, Any]:
+    """Authors and tags of a filter snapped to the values known to exist in the index"""
+    if agent.gazetteer is None:
+        return pinecone_filter
+    return agent.gazetteer.snap_filter(pinecone_filter, query)
+
+
+def generate_symbolic(
+    query: str,
+    query_vector: Optional[Vector],
+    prompt_mode: Optional[str] = None,
+    backend: Optional[str] = None,
+    lane: str = "interactive",
+) -> Tuple[Dict[str, Any], str]:
+    """
+    Symbolic filter from the agent and its source: "distilled" when the local model
+    answered confidently, "llm" otherwise. A request ``backend`` skips the distilled model.
+    """
+    if backend is None:
+        distilled_filter = agent.distilled_filter(query)
+        if distilled_filter is not None:
+            return distilled_filter, "distilled"
+    symbolic_filter = agent.generate_symbolic_filter(
+        query, query_vector, prompt_mode=prompt_mode, backend=backend or agent.default_backend, lane=lane
+    )
+    return symbolic_filter, "distilled" if (backend or agent.default_backend) == "distilled" else "llm"
+
+
+def audit_cache_hit(query: str, hit: Dict[str, Any], query_vector: Vector) -> None:
+    """Regenerate the filter of a semantic cache hit and record whether the cached one agreed"""
+    try:
+        # The LLM is the reference: the distilled model would only grade one approximation with another
+        fresh_filter = agent.generate_symbolic_filter(
+            query, query_vector, backend=agent.default_backend, lane="background"
+        )
+    except Exception as e:
+        print(f"⚠️  Semantic cache audit failed for '{query}': {e}")
+        return
+    if not semantic_cache.record_audit(query, hit, fresh_filter):
+        print(f"⚠️  Semantic cache false hit: '{query}' reused the filter of '{hit['query']}'")
+
+
+def generate_filter(
+    query: str,
+    query_vector: Optional[Vector],
+    background_tasks: Optional[BackgroundTasks] = None,
+    backend: Optional[str] = None,
+    lane: str = "interactive",
+) -> Tuple[Dict[str, Any], str]:
+    """
+    Filter for a query from the semantic cache or the agent; returns the filter and its source.
+    The cache holds symbolic filters, so relative dates are resolved for today on every request.
+    Without a query vector (filter-only queries) the cache is skipped and the agent uses the
+    full prompt rather than embedding the query to select examples. LLM calls wait in the
+    scheduler ``lane`` of the endpoint.
+    """
+    if query_vector is None:
+        symbolic_filter, source = generate_symbolic(query, None, prompt_mode="full", backend=backend, lane=lane)
+        return compile_filter(resolve_temporal(symbolic_filter)), source
+    hit = semantic_cache.lookup(query, query_vector)
+    if hit is not None:
+        if background_tasks is not None and semantic_cache.should_audit():
+            background_tasks.add_task(audit_cache_hit, query, hit, query_vector)
+        return compile_filter(resolve_temporal(hit["filter"])), "semantic_cache"
+    symbolic_filter, source = generate_symbolic(query, query_vector, backend=backend, lane=lane)
+    semantic_cache.add(query, query_vector, symbolic_filter)
+    return compile_filter(resolve_temporal(symbolic_filter)), source
+
+
+def prepare_search(
+    query: str,
+    background_tasks: Optional[BackgroundTasks] = None,
+    backend: Optional[str] = None,
+    lane: str = "interactive",
+) -> Tuple[Optional[Vector], Dict[str, Any], str, str]:
+    """
+    Route a query and produce what its search needs: the query embedding (None for
+    filter-only queries), the filter (empty for semantic-only queries), its source and the route.
+    """
+    route = query_router.route(query, current_gazetteer())
+    query_vector = None if route == "filter_only" else generate_embedding(query)
+    if route == "semantic_only":
+        return query_vector, {}, "router", route
+    # Reuse the filter of a paraphrased query or generate it using the agent
+    pinecone_filter, filter_source = generate_filter(query, query_vector, background_tasks, backend, lane)
+    return query_vector, pinecone_filter, filter_source, route
+
+
+_listing_probe: Optional[List[float]] = None
+
+
+def listing_probe() -> List[float]:
+    """Constant unit vector of the index dimension, for Pinecone queries that only filter"""
+    global _listing_probe
+    if _listing_probe is None:
+        stats = pinecone_index.describe_index_stats()
+        dimension = getattr(stats, 'dimension', None) or stats['dimension']
+        _listing_probe = to_pinecone([dimension ** -0.5] * dimension)
+    return _listing_probe
+
+
+def list_documents(
+    pinecone_filter: Dict[str, Any],
+    top_k: int,
+    include_metadata: bool,
+) -> Tuple[List[SearchResult], str]:
+    """
+    Documents matching a filter, newest first, without a query embedding. The hot tier
+    scans its metadata; Pinecone has no metadata-only scan, so it is queried with a
+    constant probe vector for up to PINECONE_MAX_TOP_K chunks, which are then sorted by
+    date (exact whenever the filter matches no more chunks than that).
+    """
+    tier = hot_tier.get()
+    if tier is not None and tier.covers(pinecone_filter):
+        hot_tier.hits += 1
+        matches = tier.scan(pinecone_filter, PINECONE_MAX_TOP_K)
+        source = "hot_tier"
+    else:
+        hot_tier.misses += 1
+        search_kwargs = {"vector": listing_probe(), "top_k": PINECONE_MAX_TOP_K, "include_metadata": True}
+        if pinecone_filter:
+            search_kwargs["filter"] = pinecone_filter
+        matches = pinecone_index.query(**search_kwargs).get('matches', [])
+        source = "pinecone"
+
+    results = [
+        SearchResult(id=doc['id'], score=doc['score'], metadata=doc['metadata'] if include_metadata else None)
+        for doc in collapse_chunks_by_date(matches)[:top_k]
+    ]
+    return results, source
+
+
+def generate_routed_filter(
+    query: str,
+    backend: Optional[str] = None,
+    lane: str = "interactive",
+) -> Tuple[Dict[str, Any], str]:
+    """
+    Filter and route for /query and /batch-query: semantic-only queries get no filter and
+    no LLM call, filter-only ones use the full prompt instead of embedding the query.
+    """
+    route = query_router.route(query, current_gazetteer())
+    if route == "semantic_only":
+        return {}, route
+    prompt_mode = "full" if route == "filter_only" else None
+    return agent.generate_pinecone_filter(query, backend=backend, prompt_mode=prompt_mode, lane=lane), route
+
+
+def search_documents(
+    query_vector: Optional[Vector],
+    pinecone_filter: Dict[str, Any],
+    top_k: int,
+    include_metadata: bool,
+    chunk_aggregation: Optional[str] = None,
+) -> Tuple[List[SearchResult], str]:
+    """
+    Query the hot tier (when the date filter falls inside it) or Pinecone with vector
+    similarity and metadata filtering, then collapse chunk hits (ids like
+    ``<doc>#<chunk>``) into one result per document. Returns the results and their source.
+    Without a query vector, lists the matching documents newest first instead.
+    """
+    if query_vector is None:
+        return list_documents(pinecone_filter, top_k, include_metadata)
+    chunk_top_k = min(top_k * CHUNK_OVERFETCH, PINECONE_MAX_TOP_K)
+    tier = hot_tier.get()
+    if tier is not None and tier.covers(pinecone_filter):
+        hot_tier.hits += 1
+        matches = tier.query(query_vector, chunk_top_k, pinecone_filter, include_metadata)
+        source = "hot_tier"
+    else:
+        hot_tier.misses += 1
+        search_kwargs = {
+            "vector": to_pinecone(query_vector),
+            "top_k": chunk_top_k,
+            "include_metadata": include_metadata
+        }
+        
+        # Add metadata filter if it's not empty
+        if pinecone_filter:
+            search_kwargs["filter"] = pinecone_filter
+        
+        matches = pinecone_index.query(**search_kwargs).get('matches', [])
+        source = "pinecone"
+    
+    documents = collapse_chunk_matches(
+        matches,
+        aggregation=chunk_aggregation or CHUNK_SCORE_AGGREGATION
+    )
+    
+    results = [
+        SearchResult(
+            id=doc['id'],
+            score=doc['score'],
+            metadata=doc['metadata'] if include_metadata else None
+        )
+        for doc in documents[:top_k]
+    ]
+    return results, source
+
+
+def search_with_relaxation(
+    query_vector: Optional[Vector],
+    pinecone_filter: Dict[str, Any],
+    top_k: int,
+    include_metadata: bool,
+    chunk_aggregation: Optional[str] = None,
+    relax: bool = True,
+) -> Tuple[List[SearchResult], str, str, Dict[str, Any]]:
+    """
+    ``search_documents`` through the relaxation ladder; also returns the tier that answered
+    and its filter. Vocabulary counts decide whether the relaxed tiers are searched up front.
+    Listings (no query vector) are never relaxed to no filter at all.
+    """
+    def search(tier_filter: Dict[str, Any]) -> Tuple[List[SearchResult], str]:
+        return search_documents(query_vector, tier_filter, top_k, include_metadata, chunk_aggregation)
+
+    return relaxed_search.search(
+        search, pinecone_filter, top_k, current_gazetteer(), relax, allow_unfiltered=query_vector is not None
+    )
+
+
 @app.get("/")
 async def root():
     """Root endpoint"""
@@ -127,6 +421,17 @@ async def root():
             "/batch-query": "POST - Process multiple queries in batch",
             "/batch-results": "POST - Search Pinecone with multiple natural language queries",
             "/health": "GET - Health check",
+            "/embedding-endpoints": "GET - Ollama endpoint health and latency",
+            "/hot-tier": "GET - Hot tier size, window and hit rate",
+            "/semantic-cache": "GET - Semantic filter cache hit rate and false-hit audits",
+            "/prompt-stats": "GET - Gemini prompt mode and token usage",
+            "/llm-latency": "GET - Gemini time to first token and time to a valid filter",
+            "/gazetteer": "GET - Known authors/tags and how generated values were snapped to them",
+            "/relaxation": "GET - How often filters were relaxed and which tiers answered",
+            "/router": "GET - How many queries took the filter-only, semantic-only and hybrid paths",
+            "/refine": "POST - Start or refine a conversational search session",
+            "/sessions": "GET - Active conversation sessions and turn latency; DELETE /sessions/{id} ends one",
+            "/llm-scheduler": "GET - Gemini quota use, queue depth and wait time per priority lane",
             "/examples": "GET - Example queries and responses"
         }
     }
@@ -138,6 +443,64 @@ async def health_check():
     return {"status": "healthy", "service": "nl2pinecone-agent"}
 
 
+@app.get("/embedding-endpoints")
+async def get_embedding_endpoints():
+    """Per-endpoint health, load and latency of the Ollama embedding pool"""
+    return {"endpoints": embedding_client.stats()}
+
+
+@app.get("/hot-tier")
+async def get_hot_tier():
+    """Size, completeness window and hit rate of the local hot tier"""
+    hot_tier.get()
+    return hot_tier.stats()
+
+
+@app.get("/semantic-cache")
+async def get_semantic_cache():
+    """Hit rate, entity-check rejections and false-hit audits of the semantic filter cache"""
+    return semantic_cache.stats()
+
+
+@app.get("/prompt-stats")
+async def get_prompt_stats():
+    """Prompt mode, few-shot k and average prompt/output tokens per mode"""
+    return agent.get_prompt_stats()
+
+
+@app.get("/llm-latency")
+async def get_llm_latency():
+    """Time to first token and time to a valid filter of recent Gemini calls"""
+    return agent.get_latency_stats()
+
+
+@app.get("/gazetteer")
+async def get_gazetteer():
+    """Vocabulary size and exact/fuzzy/unknown counts of snapped authors and tags"""
+    if agent.gazetteer is None:
+        return {"loaded": False}
+    agent.gazetteer.get()
+    return agent.gazetteer.stats()
+
+
+@app.get("/relaxation")
+async def get_relaxation():
+    """Relaxation mode, tiers that answered searches and extra queries issued"""
+    return relaxed_search.stats()
+
+
+@app.get("/router")
+async def get_router():
+    """Queries per route and the embedding and LLM calls the router skipped"""
+    return query_router.stats()
+
+
+@app.get("/llm-scheduler")
+async def get_llm_scheduler():
+    """Gemini quota use, queue depth and wait time per priority lane"""
+    return llm_scheduler.stats() if llm_scheduler is not None else {"enabled": False}
+
+
 @app.get("/examples")
 async def get_examples():
     """Get example queries and their expected responses"""
@@ -170,7 +533,7 @@ async def get_examples():
 
 
 @app.post("/query", response_model=QueryResponse)
-async def process_query(request: QueryRequest):
+def process_query(request: QueryRequest):
     """
     Process a natural language query and return Pinecone metadata filter
     
@@ -185,25 +548,32 @@ async def process_query(request: QueryRequest):
             raise HTTPException(status_code=400, detail="Query cannot be empty")
         
 
+        check_backend(request.backend)
         query = request.query.strip()
-        pinecone_filter = agent.generate_pinecone_filter(query)
+        pinecone_filter, route = generate_routed_filter(query, request.backend)
         return QueryResponse(
             original_query=query,
             pinecone_filter=pinecone_filter,
             is_valid=True,
-            timestamp=datetime.now().isoformat()
+            timestamp=datetime.now().isoformat(),
+            route=route
         )
+    except HTTPException:
+        raise
+    except FilterValidationError as e:
+        raise HTTPException(status_code=422, detail=f"Generated filter is invalid: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing query: {str(e)}")
 
 
 @app.post("/batch-query")
-async def process_batch_queries(queries: list[str]):
+def process_batch_queries(queries: list[str], backend: Optional[str] = None):
     """
     Process multiple natural language queries in batch
     
     Args:
         queries: List of natural language query strings
+        backend: LLM backend to generate the filters with (defaults to LLM_BACKEND)
         
     Returns:
         List of processed query results
@@ -211,25 +581,39 @@ async def process_batch_queries(queries: list[str]):
     try:
         if not queries:
             raise HTTPException(status_code=400, detail="Queries list cannot be empty")
-        
+        check_backend(backend)
 
         results = []
         for query in queries:
             if query and query.strip():
-                pinecone_filter = agent.generate_pinecone_filter(query.strip())
+                try:
+                    pinecone_filter, route = generate_routed_filter(query.strip(), backend, lane="batch")
+                except FilterValidationError as e:
+                    # An invalid filter fails its query only
+                    results.append({
+                        "original_query": query.strip(),
+                        "pinecone_filter": None,
+                        "is_valid": False,
+                        "errors": e.errors,
+                        "timestamp": datetime.now().isoformat()
+                    })
+                    continue
                 results.append({
                     "original_query": query.strip(),
                     "pinecone_filter": pinecone_filter,
                     "is_valid": True,
-                    "timestamp": datetime.now().isoformat()
+                    "timestamp": datetime.now().isoformat(),
+                    "route": route
                 })
         return {"results": results, "total_processed": len(results)}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing batch queries: {str(e)}")
 
 
 @app.post("/results", response_model=SearchResponse)
-async def search_with_query(request: SearchRequest):
+def search_with_query(request: SearchRequest, background_tasks: BackgroundTasks):
     """
     Search Pinecone database using natural language query with vector similarity and metadata filtering
     
@@ -246,51 +630,45 @@ async def search_with_query(request: SearchRequest):
         if not pinecone_index:
             raise HTTPException(status_code=503, detail="Pinecone client not available. Check PINECONE_API_KEY and PINECONE_INDEX environment variables.")
         
+        check_backend(request.backend)
         query = request.query.strip()
         
-        # Generate metadata filter using the agent
-        pinecone_filter = agent.generate_pinecone_filter(query)
-        
-        # Generate embedding for the query
-        query_vector = generate_embedding(query)
+        # Embed the query and generate its filter as far as its route needs them
+        query_vector, pinecone_filter, filter_source, route = prepare_search(query, background_tasks, request.backend)
         
-        # Search Pinecone with vector similarity and metadata filtering
-        search_kwargs = {
-            "vector": query_vector,
-            "top_k": request.top_k,
-            "include_metadata": request.include_metadata
-        }
-        
-        # Add metadata filter if it's not empty
-        if pinecone_filter:
-            search_kwargs["filter"] = pinecone_filter
-        
-        search_results = pinecone_index.query(**search_kwargs)
-        
-        # Process results
-        results = []
-        for match in search_results.get('matches', []):
-            result = SearchResult(
-                id=match.get('id', ''),
-                score=match.get('score', 0.0),
-                metadata=match.get('metadata') if request.include_metadata else None
-            )
-            results.append(result)
+        # Search Pinecone with vector similarity and metadata filtering, relaxing the filter if it matches too little
+        results, source, tier, applied_filter = search_with_relaxation(
+            query_vector,
+            pinecone_filter,
+            request.top_k,
+            request.include_metadata,
+            request.chunk_aggregation,
+            request.relax
+        )
         
         return SearchResponse(
             original_query=query,
             pinecone_filter=pinecone_filter,
             results=results,
             total_results=len(results),
-            timestamp=datetime.now().isoformat()
+            timestamp=datetime.now().isoformat(),
+            source=source,
+            filter_source=filter_source,
+            relaxation_tier=tier,
+            applied_filter=applied_filter if tier != "strict" else None,
+            route=route
         )
         
+    except HTTPException:
+        raise
+    except FilterValidationError as e:
+        raise HTTPException(status_code=422, detail=f"Generated filter is invalid: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error performing search: {str(e)}")
 
 
 @app.post("/batch-results")
-async def search_with_batch_queries(request: BatchSearchRequest):
+def search_with_batch_queries(request: BatchSearchRequest, background_tasks: BackgroundTasks):
     """
     Search Pinecone database using multiple natural language queries with vector similarity and metadata filtering
     
@@ -307,6 +685,7 @@ async def search_with_batch_queries(request: BatchSearchRequest):
         if not pinecone_index:
             raise HTTPException(status_code=503, detail="Pinecone client not available. Check PINECONE_API_KEY and PINECONE_INDEX environment variables.")
         
+        check_backend(request.backend)
         batch_results = []
         
         for query in request.queries:
@@ -316,41 +695,32 @@ async def search_with_batch_queries(request: BatchSearchRequest):
             query = query.strip()
             
             try:
-                # Generate metadata filter using the agent
-                pinecone_filter = agent.generate_pinecone_filter(query)
-                
-                # Generate embedding for the query
-                query_vector = generate_embedding(query)
-                
-                # Search Pinecone with vector similarity and metadata filtering
-                search_kwargs = {
-                    "vector": query_vector,
-                    "top_k": request.top_k,
-                    "include_metadata": request.include_metadata
-                }
-                
-                # Add metadata filter if it's not empty
-                if pinecone_filter:
-                    search_kwargs["filter"] = pinecone_filter
-                
-                search_results = pinecone_index.query(**search_kwargs)
+                # Embed the query and generate its filter as far as its route needs them
+                query_vector, pinecone_filter, filter_source, route = prepare_search(
+                    query, background_tasks, request.backend, lane="batch"
+                )
                 
-                # Process results
-                results = []
-                for match in search_results.get('matches', []):
-                    result = SearchResult(
-                        id=match.get('id', ''),
-                        score=match.get('score', 0.0),
-                        metadata=match.get('metadata') if request.include_metadata else None
-                    )
-                    results.append(result)
+                # Search Pinecone with vector similarity and metadata filtering, relaxing the filter if it matches too little
+                results, source, tier, applied_filter = search_with_relaxation(
+                    query_vector,
+                    pinecone_filter,
+                    request.top_k,
+                    request.include_metadata,
+                    request.chunk_aggregation,
+                    request.relax
+                )
                 
                 search_response = SearchResponse(
                     original_query=query,
                     pinecone_filter=pinecone_filter,
                     results=results,
                     total_results=len(results),
-                    timestamp=datetime.now().isoformat()
+                    timestamp=datetime.now().isoformat(),
+                    source=source,
+                    filter_source=filter_source,
+                    relaxation_tier=tier,
+                    applied_filter=applied_filter if tier != "strict" else None,
+                    route=route
                 )
                 
                 batch_results.append(search_response)
@@ -369,10 +739,107 @@ async def search_with_batch_queries(request: BatchSearchRequest):
             "timestamp": datetime.now().isoformat()
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error performing batch search: {str(e)}")
 
 
+@app.post("/refine", response_model=RefineResponse)
+def refine_search(request: RefineRequest, background_tasks: BackgroundTasks):
+    """
+    Start or continue a conversational search
+    
+    Without a known session id the utterance is a full query and starts a session. Otherwise
+    it refines the session's last filter: locally when it is made of recognized deltas
+    ("only from May", "drop the author"), reusing the session's query embedding, and
+    through the LLM with the conversation so far otherwise.
+    
+    Args:
+        request: RefineRequest containing the utterance, the session id and search parameters
+        
+    Returns:
+        RefineResponse with the search results, the session id and how the filter was refined
+    """
+    try:
+        if not request.utterance or not request.utterance.strip():
+            raise HTTPException(status_code=400, detail="Utterance cannot be empty")
+        
+        if not pinecone_index:
+            raise HTTPException(status_code=503, detail="Pinecone client not available. Check PINECONE_API_KEY and PINECONE_INDEX environment variables.")
+        
+        check_backend(request.backend)
+        utterance = request.utterance.strip()
+        start = time.perf_counter()
+        session = sessions.get(request.session_id) if request.session_id else None
+        
+        refined = apply_refinement(session["filter"], utterance) if session is not None else None
+        if refined is not None:
+            # A local delta: the filter changes, the semantic content and its embedding do not
+            refinement = "local"
+            query = f"{session['query']}, {utterance}"
+            query_vector = session["vector"]
+            pinecone_filter = compile_filter(snap_to_vocabulary(refined, utterance))
+            filter_source = "refinement"
+            route = "filter_only" if query_vector is None else "hybrid" if pinecone_filter else "semantic_only"
+        else:
+            refinement = "new" if session is None else "llm"
+            query = utterance if session is None else f"{session['query']}, {utterance}"
+            query_vector, pinecone_filter, filter_source, route = prepare_search(query, background_tasks, request.backend)
+        
+        results, source, tier, applied_filter = search_with_relaxation(
+            query_vector,
+            pinecone_filter,
+            request.top_k,
+            request.include_metadata,
+            request.chunk_aggregation,
+            request.relax
+        )
+        
+        if session is None:
+            session = sessions.create(query, pinecone_filter, query_vector, route)
+        else:
+            sessions.update(session, query=query, filter=pinecone_filter, vector=query_vector, route=route)
+        sessions.record(refinement, time.perf_counter() - start)
+        
+        return RefineResponse(
+            original_query=query,
+            pinecone_filter=pinecone_filter,
+            results=results,
+            total_results=len(results),
+            timestamp=datetime.now().isoformat(),
+            source=source,
+            filter_source=filter_source,
+            relaxation_tier=tier,
+            applied_filter=applied_filter if tier != "strict" else None,
+            route=route,
+            session_id=session["id"],
+            turn=session["turns"],
+            refinement=refinement
+        )
+        
+    except HTTPException:
+        raise
+    except FilterValidationError as e:
+        raise HTTPException(status_code=422, detail=f"Generated filter is invalid: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error refining search: {str(e)}")
+
+
+@app.get("/sessions")
+async def get_sessions():
+    """Active conversation sessions and the latency of new, local and LLM turns"""
+    return sessions.stats()
+
+
+@app.delete("/sessions/{session_id}")
+async def end_session(session_id: str):
+    """End a conversation session"""
+    if not sessions.delete(session_id):
+        raise HTTPException(status_code=404, detail=f"Unknown session '{session_id}'")
+    return {"session_id": session_id, "deleted": True}
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,167 @@
+"""
+Benchmark tag normalization on a synthetic hashtag set.
+
+Generates a deterministic set of raw hashtags in the style of sample_data.csv
+(camelCase names, event+year tags, special compounds, abbreviations, bare years)
+with Zipfian frequencies, groups them into tags cells (JSON arrays and
+comma-separated), and times the original per-call implementation against the
+memoized TagNormalizer, per tag and per cell, checking that both produce the
+same tags.
+
+Examples:
+    python benchmark_tag_normalization.py
+    python benchmark_tag_normalization.py --count 1000000 --distinct 20000
+"""
+import argparse
+import json
+import re
+import time
+from typing import Callable, List
+
+import numpy as np
+
+from tag_normalization import TagNormalizer
+
+FIRST_NAMES = ["Rohit", "Virat", "Shubman", "Jasprit", "Hardik", "Sunil", "Vaibhav", "Sandeep", "Ryan", "Gareth"]
+LAST_NAMES = ["Sharma", "Kohli", "Gill", "Bumrah", "Pandya", "Gavaskar", "Suryavanshi", "Rickelton", "Southgate", "Singh"]
+TEAMS = ["MumbaiIndians", "RajasthanRoyals", "GujaratTitans", "ChennaiSuperKings", "DelhiCapitals", "PunjabKings"]
+EVENTS = ["IPL", "WorldCup", "Olympics", "AsiaCup", "Wimbledon", "ChampionsTrophy", "IPLRecords"]
+WORDS = ["cricket", "football", "Barcelona", "Pickleball", "health", "economy", "elections", "startups"]
+
+
+def legacy_normalize_tag(tag: str) -> List[str]:
+    """normalize_tag as it was before the rules moved to tag_rules.json (reference implementation)"""
+    if not tag:
+        return []
+    special_cases = {
+        'IPLInjuries': ['IPL', 'injuries'],
+        'IPLRecords': ['IPL', 'records'],
+        'CricketForm': ['cricket', 'form'],
+        'CricketHealth': ['cricket', 'health'],
+        'SportsPolitics': ['sports', 'politics'],
+        'IndiaSports': ['India', 'sports'],
+        'CelebrityNews': ['celebrity', 'news'],
+        'BangladeshCricket': ['Bangladesh', 'cricket'],
+        'IPLHistory': ['IPL', 'history'],
+        'RRvsMI': ['RR', 'MI']
+    }
+    no_split_terms = {
+        'BallonDor', 'RCB', 'DRS', 'IPL', 'CSK', 'MI', 'RR', 'SRH', 'KKR',
+        'GT', 'LSG', 'DC', 'PBKS', 'Barcelona', 'Pickleball', 'Chattogram'
+    }
+    if tag in special_cases:
+        return special_cases[tag]
+    if re.match(r'^20\d{2}$', tag):
+        return []
+    year_match = re.match(r'([A-Za-z]+)(20\d{2})$', tag)
+    if year_match:
+        event_name = year_match.group(1)
+        year = year_match.group(2)
+        if event_name in no_split_terms:
+            return [f"{event_name} {year}"]
+        processed_event = legacy_normalize_tag(event_name)
+        if processed_event:
+            return [f"{processed_event[0]} {year}"]
+        return [f"{event_name} {year}"]
+    if tag in no_split_terms:
+        return [tag]
+    spaced_tag = re.sub(r'([a-z])([A-Z])', r'\1 \2', tag)
+    result = spaced_tag.strip()
+    if result:
+        return [result]
+    return []
+
+
+def legacy_parse_tags(tags_str: str) -> List[str]:
+    """parse_tags as it was before the rules moved to tag_rules.json (reference implementation)"""
+    if not tags_str:
+        return []
+    if tags_str.startswith('[') and tags_str.endswith(']'):
+        try:
+            parsed_tags = json.loads(tags_str)
+            if isinstance(parsed_tags, list):
+                cleaned_tags = []
+                for tag in parsed_tags:
+                    if isinstance(tag, str):
+                        tag = tag.strip().replace('#', '').replace('"', '')
+                        if tag:
+                            cleaned_tags.extend(legacy_normalize_tag(tag))
+                return cleaned_tags
+        except json.JSONDecodeError:
+            pass
+    tags = [tag.strip().replace('#', '').replace('"', '') for tag in tags_str.split(',')]
+    normalized_tags = []
+    for tag in tags:
+        if tag:
+            normalized_tags.extend(legacy_normalize_tag(tag))
+    return normalized_tags
+
+
+def synthetic_tags(count: int, distinct: int, seed: int = 42) -> List[str]:
+    """``count`` raw tags drawn with Zipf frequencies from ``distinct`` generated values"""
+    rng = np.random.default_rng(seed)
+    pool = [f"{first}{last}" for first in FIRST_NAMES for last in LAST_NAMES] + TEAMS + WORDS
+    pool += [f"{event}{year}" for event in EVENTS for year in range(2015, 2026)]
+    pool += ["IPLInjuries", "CricketForm", "RRvsMI", "DRS", "RCB", "BallonDor", "2024", "2025"]
+    # Long tail of rare compounds, as a real tags column has
+    while len(pool) < distinct:
+        pool.append(f"{rng.choice(WORDS).capitalize()}{rng.choice(LAST_NAMES)}{int(rng.integers(0, 10 ** 6))}")
+    pool = pool[:distinct]
+    weights = 1.0 / np.arange(1, len(pool) + 1)
+    codes = rng.choice(len(pool), size=count, p=weights / weights.sum())
+    return [f"#{pool[code]}" for code in codes]
+
+
+def synthetic_cells(tags: List[str], seed: int = 42) -> List[str]:
+    """Tags grouped into cells of 1-5, two thirds JSON arrays and one third comma-separated"""
+    rng = np.random.default_rng(seed + 1)
+    cells = []
+    position = 0
+    while position < len(tags):
+        size = int(rng.integers(1, 6))
+        group = tags[position:position + size]
+        position += size
+        cells.append(json.dumps(group) if rng.random() < 2 / 3 else ", ".join(group))
+    return cells
+
+
+def timed(label: str, function: Callable[[], List[List[str]]], items: int) -> List[List[str]]:
+    start = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start
+    print(f"   {label:<34} {elapsed:>8.3f}s  {items / elapsed:>12,.0f}/s")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark tag normalization against the original implementation")
+    parser.add_argument("--count", type=int, default=1000000, help="Number of raw tags")
+    parser.add_argument("--distinct", type=int, default=20000, help="Number of distinct raw tags")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    tags = synthetic_tags(args.count, args.distinct, args.seed)
+    cells = synthetic_cells(tags, args.seed)
+    stripped = [tag.strip().replace('#', '').replace('"', '') for tag in tags]
+    print(f"🏷️  {len(tags):,} tags ({len(set(tags)):,} distinct) in {len(cells):,} cells")
+
+    print("Per tag:")
+    expected = timed("original normalize_tag", lambda: [legacy_normalize_tag(tag) for tag in stripped], len(tags))
+    normalizer = TagNormalizer.from_file()
+    actual = timed("TagNormalizer.normalize", lambda: [normalizer.normalize(tag) for tag in stripped], len(tags))
+    normalizer = TagNormalizer.from_file()
+    bulk = timed("TagNormalizer.normalize_many", lambda: normalizer.normalize_many(stripped), len(tags))
+    assert actual == expected and bulk == expected, "normalized tags differ from the original implementation"
+
+    print("Per cell:")
+    expected = timed("original parse_tags", lambda: [legacy_parse_tags(cell) for cell in cells], len(cells))
+    normalizer = TagNormalizer.from_file()
+    actual = timed("TagNormalizer.parse", lambda: [normalizer.parse(cell) for cell in cells], len(cells))
+    normalizer = TagNormalizer.from_file()
+    bulk = timed("TagNormalizer.parse_column", lambda: normalizer.parse_column(cells), len(cells))
+    assert actual == expected and bulk == expected, "parsed tags differ from the original implementation"
+    print("✅ Same tags as the original implementation")
+
+
+if __name__ == "__main__":
+    main()
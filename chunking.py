@@ -0,0 +1,170 @@
+"""
+Sentence-aware chunking of article content for multi-vector indexing.
+
+Each article is split into overlapping chunks that are embedded separately and
+stored under ids of the form ``<doc_id>#<chunk_index>``. At query time the chunk
+hits are collapsed back into one result per document.
+"""
+
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+CHUNK_ID_SEPARATOR = "#"
+DEFAULT_CHUNK_SIZE = 1500
+DEFAULT_CHUNK_OVERLAP = 200
+
+_SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+')
+
+
+def split_sentences(text: str) -> List[str]:
+    """Split text into sentences on terminal punctuation followed by whitespace"""
+    return [s.strip() for s in _SENTENCE_BOUNDARY.split(text) if s.strip()]
+
+
+def _split_long_sentence(sentence: str, max_chars: int) -> List[str]:
+    """Hard-split a sentence that is longer than a whole chunk at word boundaries"""
+    pieces = []
+    current = ""
+    for word in sentence.split():
+        if current and len(current) + 1 + len(word) > max_chars:
+            pieces.append(current)
+            current = word
+        else:
+            current = f"{current} {word}" if current else word
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_into_chunks(
+    text: str,
+    max_chars: int = DEFAULT_CHUNK_SIZE,
+    overlap_chars: int = DEFAULT_CHUNK_OVERLAP,
+) -> List[str]:
+    """
+    Split text into overlapping chunks of at most ``max_chars`` characters.
+
+    Chunks end on sentence boundaries where possible. Consecutive chunks share
+    trailing sentences of the previous chunk, up to ``overlap_chars`` characters,
+    so a passage that straddles a boundary is still embedded in one piece.
+    """
+    if not text or not text.strip():
+        return []
+    if overlap_chars >= max_chars:
+        raise ValueError("overlap_chars must be smaller than max_chars")
+
+    sentences = []
+    for sentence in split_sentences(text):
+        if len(sentence) > max_chars:
+            sentences.extend(_split_long_sentence(sentence, max_chars))
+        else:
+            sentences.append(sentence)
+
+    chunks = []
+    current: List[str] = []
+    current_len = 0
+    for sentence in sentences:
+        added_len = len(sentence) + (1 if current else 0)
+        if current and current_len + added_len > max_chars:
+            chunks.append(' '.join(current))
+            # Carry trailing sentences over as overlap for the next chunk
+            overlap: List[str] = []
+            overlap_len = 0
+            for previous in reversed(current):
+                if overlap_len + len(previous) + 1 > overlap_chars:
+                    break
+                overlap.insert(0, previous)
+                overlap_len += len(previous) + 1
+            if overlap_len + len(sentence) > max_chars:
+                overlap = []
+            current = overlap
+            current_len = len(' '.join(current))
+            added_len = len(sentence) + (1 if current else 0)
+        current.append(sentence)
+        current_len += added_len
+    if current:
+        chunks.append(' '.join(current))
+    return chunks
+
+
+def make_chunk_id(doc_id: str, chunk_index: int) -> str:
+    """Build the vector id for a chunk of a document"""
+    return f"{doc_id}{CHUNK_ID_SEPARATOR}{chunk_index}"
+
+
+def parse_chunk_id(vector_id: str) -> Tuple[str, Optional[int]]:
+    """
+    Split a vector id into its document id and chunk index.
+    Ids without a chunk suffix (single-vector documents) return ``None`` as index.
+    """
+    doc_id, sep, suffix = vector_id.rpartition(CHUNK_ID_SEPARATOR)
+    if sep and suffix.isdigit():
+        return doc_id, int(suffix)
+    return vector_id, None
+
+
+def collapse_chunk_matches(
+    matches: List[Dict[str, Any]],
+    aggregation: str = "max",
+) -> List[Dict[str, Any]]:
+    """
+    Collapse chunk-level Pinecone matches into per-document matches.
+
+    Args:
+        matches: Pinecone matches with ``id``, ``score`` and optional ``metadata``
+        aggregation: ``"max"`` keeps the best chunk score, ``"sum"`` adds the scores
+            of all matched chunks so documents matching in several passages rank higher
+
+    Returns:
+        Document-level matches sorted by score, carrying the best chunk's metadata
+        plus the list of matched chunk indices
+    """
+    if aggregation not in ("max", "sum"):
+        raise ValueError(f"Unsupported chunk aggregation: {aggregation}")
+
+    documents: Dict[str, Dict[str, Any]] = {}
+    for match in matches:
+        doc_id, chunk_index = parse_chunk_id(match.get('id', ''))
+        score = match.get('score', 0.0)
+        doc = documents.get(doc_id)
+        if doc is None:
+            doc = documents[doc_id] = {
+                'id': doc_id,
+                'score': 0.0,
+                'best_score': float('-inf'),
+                'metadata': None,
+                'matched_chunks': [],
+            }
+        if chunk_index is not None:
+            doc['matched_chunks'].append(chunk_index)
+        doc['score'] += score
+        if score > doc['best_score']:
+            doc['best_score'] = score
+            doc['metadata'] = match.get('metadata')
+
+    collapsed = []
+    for doc in documents.values():
+        metadata = dict(doc['metadata']) if doc['metadata'] else None
+        if metadata is not None and doc['matched_chunks']:
+            metadata['matched_chunks'] = sorted(doc['matched_chunks'])
+        score = doc['score'] if aggregation == "sum" else doc['best_score']
+        collapsed.append({'id': doc['id'], 'score': score, 'metadata': metadata})
+    collapsed.sort(key=lambda d: d['score'], reverse=True)
+    return collapsed
+
+
+def collapse_chunks_by_date(matches: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Collapse the chunk matches of a metadata listing (no query vector) into
+    per-document matches, newest first. Scores carry no similarity on this path
+    and are reported as 0.
+    """
+    def published(doc: Dict[str, Any]) -> Tuple[int, int, int]:
+        metadata = doc['metadata'] or {}
+        try:
+            return tuple(int(metadata.get(field) or 0) for field in ('published_year', 'published_month', 'published_day'))
+        except (TypeError, ValueError):
+            return (0, 0, 0)
+
+    documents = collapse_chunk_matches([{**match, 'score': 0.0} for match in matches])
+    return sorted(documents, key=published, reverse=True)
@@ -0,0 +1,386 @@
+"""
+Conversational refinement of search filters.
+
+A session keeps the last canonical filter of a conversation and its query embedding,
+so follow-ups like "only from May", "drop the author" or "also about injuries" are
+applied to that filter as small deltas instead of regenerating it from a rephrased
+query. ``apply_refinement`` parses the deltas locally:
+
+- dates: "from May", "May 15th 2024", "in 2023", "last month", "past 3 weeks",
+  "before 2023", "since 2021", "between 2020 and 2022". A month or day without a
+  year narrows the current year; any other date replaces the current one
+- authors: "by Jane Doe" sets the author, "not by Jane Doe" excludes one
+- tags: "about X" replaces the tags, "also about X" adds one, "not about X" excludes one
+- removals: "drop the author", "any date", "remove the tags", "clear the filters"
+
+Utterances it cannot fully parse return None and go to the LLM with the conversation
+so far. Sessions live in memory (``SessionStore``), expire after SESSION_TTL seconds
+of inactivity and are evicted least recently used beyond SESSION_CAPACITY.
+
+Examples:
+    python conversation.py '{"author": {"$eq": "Jane Doe"}, "tags": {"$in": ["IPL"]}}' "only from May"
+"""
+import argparse
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from datetime import date
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from distilled_model import NUMBER_WORDS
+from filter_compiler import FilterValidationError, compile_filter
+from relaxation import without_fields
+from semantic_cache import MONTHS
+from temporal import resolve_temporal
+
+DEFAULT_TTL_SECONDS = 1800
+DEFAULT_CAPACITY = 10000
+LATENCY_WINDOW = 500
+DATE_FIELDS = ("published_year", "published_month", "published_day", "$date")
+
+Delta = Callable[[Dict[str, Any]], Dict[str, Any]]
+
+_MONTH = "|".join(sorted(MONTHS, key=len, reverse=True))
+_ORDINAL = r"(\d{1,2})(?:st|nd|rd|th)?"
+_COUNT = r"(\d+|" + "|".join(sorted(NUMBER_WORDS, key=len, reverse=True)) + r")"
+FILLER_PATTERN = re.compile(r"^(?:ok(?:ay)?|now|actually|but|then|please|just|only|instead|and)\b[\s,]*", re.IGNORECASE)
+ADDITIVE_PATTERN = re.compile(r"^(?:also|plus|add|and also|including)\b\s*", re.IGNORECASE)
+DATE_PREFIX_PATTERN = re.compile(r"^(?:(?:published|posted|written)\s+)?(?:(?:in|from|during|on|for)\s+)?", re.IGNORECASE)
+EXPLICIT_DATE_PATTERN = re.compile(
+    rf"^(?:{_ORDINAL}\s+(?:of\s+)?)?({_MONTH})\.?(?:\s+{_ORDINAL})?(?:,?\s+(\d{{4}}))?$", re.IGNORECASE
+)
+YEAR_ONLY_PATTERN = re.compile(r"^(\d{4})$")
+YEAR_BOUND_PATTERN = re.compile(r"^(before|until|after|since)\s+(\d{4})$", re.IGNORECASE)
+YEAR_RANGE_PATTERN = re.compile(r"^(?:between|from)\s+(\d{4})\s+(?:and|to|-)\s+(\d{4})$", re.IGNORECASE)
+RELATIVE_PATTERN = re.compile(r"^(today|yesterday|(?:this|last) (?:week|month|year))$", re.IGNORECASE)
+LAST_N_PATTERN = re.compile(rf"^(?:the\s+)?(?:last|past|previous)\s+{_COUNT}\s+(day|week|month|year)s?$", re.IGNORECASE)
+REMOVAL_PATTERN = re.compile(
+    r"^(?:drop|remove|clear|forget|ignore|without|no|any|all)\s+(?:the\s+)?"
+    r"(authors?|writers?|dates?|time|years?|months?|days?|tags?|topics?|filters?|everything)(?:\s+filters?)?$",
+    re.IGNORECASE,
+)
+AUTHOR_PATTERN = re.compile(r"^(not\s+)?(?:by|written by|from author)\s+(.+)$", re.IGNORECASE)
+TAGS_PATTERN = re.compile(r"^(not\s+|except\s+|excluding\s+)?(?:about|on|tagged|regarding|covering)\s+(.+)$", re.IGNORECASE)
+EXCLUDE_PATTERN = re.compile(r"^(?:exclude|excluding|except|minus|no more)\s+(.+)$", re.IGNORECASE)
+LIST_SEPARATOR = re.compile(r"\s*(?:,|/|\bor\b|\band\b)\s*", re.IGNORECASE)
+CLAUSE_SEPARATOR = re.compile(r"(\s*(?:[,;]|\band\b)\s*)", re.IGNORECASE)
+REMOVED_FIELDS = {
+    "author": ("author",), "writer": ("author",), "date": DATE_FIELDS, "time": DATE_FIELDS,
+    "year": ("published_year", "$date"), "month": ("published_month",), "day": ("published_day",),
+    "tag": ("tags",), "topic": ("tags",),
+}
+
+
+def get_session_ttl() -> float:
+    return float(os.getenv("SESSION_TTL", DEFAULT_TTL_SECONDS))
+
+
+def get_session_capacity() -> int:
+    return int(os.getenv("SESSION_CAPACITY", DEFAULT_CAPACITY))
+
+
+def _clean_value(text: str) -> str:
+    return re.sub(r"(?:'s|’s)$", "", text.strip().strip("\"'“”.!?")).strip()
+
+
+def _values(text: str) -> List[str]:
+    return [value for value in (_clean_value(part) for part in LIST_SEPARATOR.split(text)) if value]
+
+
+def _tag_values(text: str, today: Optional[date]) -> List[str]:
+    """Tags of a list, empty when an item is a refinement clause of its own ("cricket and only from May")"""
+    values = _values(text)
+    if any(parse_clause(value, today) is not None for value in values):
+        return []
+    return values
+
+
+def parse_date(text: str, today: Optional[date] = None) -> Optional[Dict[str, Any]]:
+    """Concrete date conditions of a date phrase ("May 2024", "last month", "before 2023"), None if it is not one"""
+    text = text.strip().rstrip(".!?")
+    prefixed = bool(DATE_PREFIX_PATTERN.match(text).group(0))
+    text = DATE_PREFIX_PATTERN.sub("", text)
+    relative = RELATIVE_PATTERN.match(text)
+    if relative:
+        return resolve_temporal({"$date": "_".join(relative.group(1).lower().split())}, today)
+    last_n = LAST_N_PATTERN.match(text)
+    if last_n:
+        count = last_n.group(1).lower()
+        count = int(count) if count.isdigit() else NUMBER_WORDS[count]
+        return resolve_temporal({"$date": f"last_n_{last_n.group(2).lower()}s:{count}"}, today)
+    explicit = EXPLICIT_DATE_PATTERN.match(text)
+    if explicit:
+        day_before, month, day_after, year = explicit.groups()
+        # "may" and "mar" are words too: lowercase on their own they need "in"/"from" before them
+        if month.lower() in ("may", "mar") and month.islower() and not (prefixed or day_before or day_after or year):
+            return None
+        conditions: Dict[str, Any] = {"published_month": {"$eq": MONTHS[month.lower()]}}
+        if day_before or day_after:
+            conditions["published_day"] = {"$eq": int(day_before or day_after)}
+        if year:
+            conditions["published_year"] = {"$eq": int(year)}
+        return conditions
+    year = YEAR_ONLY_PATTERN.match(text)
+    if year:
+        return {"published_year": {"$eq": int(year.group(1))}}
+    bound = YEAR_BOUND_PATTERN.match(text)
+    if bound:
+        operator = {"before": "$lt", "until": "$lte", "after": "$gt", "since": "$gte"}[bound.group(1).lower()]
+        return {"published_year": {operator: int(bound.group(2))}}
+    span = YEAR_RANGE_PATTERN.match(text)
+    if span:
+        first, last = sorted(int(year) for year in span.groups())
+        return {"published_year": {"$gte": first, "$lte": last}}
+    return None
+
+
+def _set_date(conditions: Dict[str, Any]) -> Delta:
+    def apply(pinecone_filter: Dict[str, Any]) -> Dict[str, Any]:
+        # A month (and day) without a year narrows the current year rather than replacing it
+        narrows = not set(conditions) & {"published_year", "$or"}
+        kept = {"published_year": pinecone_filter["published_year"]} if narrows and "published_year" in pinecone_filter else {}
+        # Resolved relative dates are an $or of date-only clauses, removed with the dates
+        updated = without_fields(pinecone_filter, DATE_FIELDS)
+        return {**updated, **kept, **conditions}
+    # Kept for merging several dates of one utterance ("May and June")
+    apply.conditions = conditions
+    return apply
+
+
+def _merge_dates(conditions: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    Several dates of one utterance as one condition: the field they differ in takes all
+    their values ("May and June" → month $in [5, 6]). None when they differ in more than
+    one field or in anything but exact values ("May 2024 and June 2025", "last month and 2020").
+    """
+    fields = set(conditions[0])
+    if any(set(condition) != fields for condition in conditions):
+        return None
+    differing = [field for field in fields if any(condition[field] != conditions[0][field] for condition in conditions)]
+    if len(differing) > 1:
+        return None
+    merged = dict(conditions[0])
+    for field in differing:
+        values = [condition[field] for condition in conditions]
+        if not all(list(value) == ["$eq"] for value in values):
+            return None
+        merged[field] = {"$in": sorted({value["$eq"] for value in values})}
+    return merged
+
+
+def _remove(fields) -> Delta:
+    return lambda pinecone_filter: without_fields(pinecone_filter, fields)
+
+
+def _set_author(author: str, exclude: bool) -> Delta:
+    def apply(pinecone_filter: Dict[str, Any]) -> Dict[str, Any]:
+        if exclude:
+            return {**pinecone_filter, "author": {"$ne": author}}
+        return {**without_fields(pinecone_filter, ("author",)), "author": {"$eq": author}}
+    return apply
+
+
+def _set_tags(tags: List[str], mode: str) -> Delta:
+    def apply(pinecone_filter: Dict[str, Any]) -> Dict[str, Any]:
+        current = pinecone_filter.get("tags", {})
+        included = list(current.get("$in", []))
+        excluded = list(current.get("$nin", []))
+        if mode == "replace":
+            included, excluded = tags, [tag for tag in excluded if tag not in tags]
+        elif mode == "add":
+            included += [tag for tag in tags if tag not in included]
+            excluded = [tag for tag in excluded if tag not in tags]
+        else:
+            included = [tag for tag in included if tag not in tags]
+            excluded += [tag for tag in tags if tag not in excluded]
+        condition = {**({"$in": included} if included else {}), **({"$nin": excluded} if excluded else {})}
+        updated = without_fields(pinecone_filter, ("tags",))
+        return {**updated, "tags": condition} if condition else updated
+    return apply
+
+
+def parse_clause(clause: str, today: Optional[date] = None) -> Optional[Delta]:
+    """Filter delta of one refinement clause, None if it is not a recognized one"""
+    text = clause.strip().rstrip(".!?").strip()
+    additive = bool(ADDITIVE_PATTERN.match(text))
+    text = ADDITIVE_PATTERN.sub("", text)
+    while FILLER_PATTERN.match(text):
+        text = FILLER_PATTERN.sub("", text, count=1)
+    if not text:
+        return None
+
+    removal = REMOVAL_PATTERN.match(text)
+    if removal:
+        target = removal.group(1).lower().rstrip("s")
+        return _remove(REMOVED_FIELDS[target]) if target in REMOVED_FIELDS else (lambda pinecone_filter: {})
+    conditions = parse_date(text, today)
+    if conditions is not None:
+        return _set_date(conditions)
+    author = AUTHOR_PATTERN.match(text)
+    # An author never spans a clause separator: "by Jane Doe and only from May" is two clauses
+    if author and _clean_value(author.group(2)) and not CLAUSE_SEPARATOR.search(author.group(2)):
+        return _set_author(_clean_value(author.group(2)), bool(author.group(1)))
+    tags = TAGS_PATTERN.match(text)
+    if tags and _tag_values(tags.group(2), today):
+        mode = "exclude" if tags.group(1) else "add" if additive else "replace"
+        return _set_tags(_tag_values(tags.group(2), today), mode)
+    excluded = EXCLUDE_PATTERN.match(text)
+    if excluded and _tag_values(excluded.group(1), today):
+        return _set_tags(_tag_values(excluded.group(1), today), "exclude")
+    if additive and _tag_values(text, today):
+        # "also cricket" adds a tag
+        return _set_tags(_tag_values(text, today), "add")
+    return None
+
+
+def _parse_clauses(utterance: str, today: Optional[date] = None) -> Optional[List[Delta]]:
+    """
+    Deltas of an utterance split at commas, semicolons and "and", each taking the longest
+    run of pieces that parses as one clause ("between 2020 and 2022", "May 15th, 2024");
+    None when some piece belongs to no recognized clause.
+    """
+    parts = CLAUSE_SEPARATOR.split(utterance)
+    pieces, separators = parts[0::2], parts[1::2]
+    deltas = []
+    start = 0
+    while start < len(pieces):
+        if not pieces[start].strip():
+            start += 1
+            continue
+        for end in range(len(pieces), start, -1):
+            text = pieces[start] + "".join(separators[i] + pieces[i + 1] for i in range(start, end - 1))
+            delta = parse_clause(text, today)
+            if delta is not None:
+                break
+        else:
+            return None
+        deltas.append(delta)
+        start = end
+    return deltas
+
+
+def apply_refinement(pinecone_filter: Dict[str, Any], utterance: str, today: Optional[date] = None) -> Optional[Dict[str, Any]]:
+    """
+    Canonical filter after a follow-up utterance, or None when the utterance is not made
+    of recognized deltas (the caller then asks the LLM). Clauses are separated by commas,
+    semicolons or "and"; several dates in one utterance are combined rather than the last
+    one winning.
+    """
+    deltas = _parse_clauses(utterance, today)
+    if not deltas:
+        return None
+    dated = [index for index, delta in enumerate(deltas) if hasattr(delta, "conditions")]
+    if len(dated) > 1:
+        merged = _merge_dates([deltas[index].conditions for index in dated])
+        if merged is None:
+            return None
+        deltas = [delta for index, delta in enumerate(deltas) if index not in dated[1:]]
+        deltas[dated[0]] = _set_date(merged)
+    refined = pinecone_filter
+    for delta in deltas:
+        refined = delta(refined)
+    try:
+        return compile_filter(refined)
+    except FilterValidationError:
+        # "May 32nd" and the like: let the LLM make sense of it
+        return None
+
+
+class SessionStore:
+    """In-memory conversation sessions, expired after ``ttl_seconds`` idle, least recently used evicted first"""
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY, ttl_seconds: float = DEFAULT_TTL_SECONDS):
+        self.capacity = capacity
+        self.ttl_seconds = ttl_seconds
+        self._sessions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.latencies: Dict[str, deque] = {}
+        self.expired = 0
+
+    def create(self, query: str, pinecone_filter: Dict[str, Any], vector: Any, route: str) -> Dict[str, Any]:
+        session = {
+            "id": uuid.uuid4().hex,
+            "query": query,
+            "filter": pinecone_filter,
+            "vector": vector,
+            "route": route,
+            "turns": 1,
+            "updated": time.time(),
+        }
+        with self._lock:
+            self._sessions[session["id"]] = session
+            while len(self._sessions) > self.capacity:
+                self._sessions.popitem(last=False)
+        return session
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            if self.ttl_seconds and time.time() - session["updated"] > self.ttl_seconds:
+                del self._sessions[session_id]
+                self.expired += 1
+                return None
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def update(self, session: Dict[str, Any], **fields: Any) -> None:
+        with self._lock:
+            session.update(fields, turns=session["turns"] + 1, updated=time.time())
+            if session["id"] in self._sessions:
+                self._sessions.move_to_end(session["id"])
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def record(self, refinement: str, seconds: float) -> None:
+        """Time taken by a turn, per kind: "new", "local" or "llm\""""
+        with self._lock:
+            self.latencies.setdefault(refinement, deque(maxlen=LATENCY_WINDOW)).append(seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            latencies = {kind: list(samples) for kind, samples in self.latencies.items()}
+            sessions = len(self._sessions)
+        return {
+            "sessions": sessions,
+            "capacity": self.capacity,
+            "ttl_seconds": self.ttl_seconds,
+            "expired": self.expired,
+            "turns": {
+                kind: {
+                    "recent": len(samples),
+                    "avg_ms": float(np.mean(samples) * 1000),
+                    "p95_ms": float(np.percentile(samples, 95) * 1000),
+                }
+                for kind, samples in latencies.items() if samples
+            },
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply a follow-up utterance to a filter locally")
+    parser.add_argument("filter", help="Current filter as JSON")
+    parser.add_argument("utterances", nargs="+", help="Follow-up utterances, applied in turn")
+    args = parser.parse_args()
+
+    pinecone_filter = compile_filter(json.loads(args.filter))
+    for utterance in args.utterances:
+        refined = apply_refinement(pinecone_filter, utterance)
+        if refined is None:
+            print(f"❓ {utterance!r}: not a local refinement, would go to the LLM")
+            continue
+        pinecone_filter = refined
+        print(f"✅ {utterance!r}: {json.dumps(pinecone_filter, ensure_ascii=False)}")
+
+
+if __name__ == "__main__":
+    main()
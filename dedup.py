@@ -0,0 +1,130 @@
+"""
+Near-duplicate detection for scraped articles using MinHash and LSH banding.
+
+Wire-service and syndicated stories appear under several URLs with almost identical
+text. Each article gets a MinHash signature over word shingles; signatures are split
+into bands and hashed into buckets so that candidate duplicates are found without
+comparing every pair, then confirmed by their estimated Jaccard similarity.
+"""
+
+import hashlib
+import re
+from typing import Dict, List, Optional, Set, Tuple
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_WORD = re.compile(r'\w+')
+
+DEFAULT_NUM_PERM = 128
+DEFAULT_BANDS = 16  # 16 bands x 8 rows: candidates from roughly 0.7 Jaccard upwards
+DEFAULT_THRESHOLD = 0.8
+DEFAULT_SHINGLE_SIZE = 5
+
+
+def _permutations(num_perm: int, seed: int = 1) -> List[Tuple[int, int]]:
+    """Deterministic (a, b) coefficients for the universal hash functions"""
+    params = []
+    for i in range(num_perm):
+        digest = hashlib.sha1(f"{seed}:{i}".encode()).digest()
+        a = int.from_bytes(digest[:8], 'big') % (_MERSENNE_PRIME - 1) + 1
+        b = int.from_bytes(digest[8:16], 'big') % _MERSENNE_PRIME
+        params.append((a, b))
+    return params
+
+
+def shingles(text: str, size: int = DEFAULT_SHINGLE_SIZE) -> Set[int]:
+    """Hash overlapping word n-grams of the lowercased text to 32-bit integers"""
+    words = _WORD.findall(text.lower())
+    if len(words) < size:
+        words_iter = [' '.join(words)] if words else []
+    else:
+        words_iter = (' '.join(words[i:i + size]) for i in range(len(words) - size + 1))
+    return {
+        int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=4).digest(), 'big')
+        for shingle in words_iter
+    }
+
+
+class MinHasher:
+    """Compute fixed-length MinHash signatures"""
+
+    def __init__(self, num_perm: int = DEFAULT_NUM_PERM, shingle_size: int = DEFAULT_SHINGLE_SIZE, seed: int = 1):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self._params = _permutations(num_perm, seed)
+
+    def signature(self, text: str) -> Tuple[int, ...]:
+        hashed = shingles(text, self.shingle_size)
+        if not hashed:
+            return tuple([_MAX_HASH] * self.num_perm)
+        return tuple(
+            min(((a * x + b) % _MERSENNE_PRIME) & _MAX_HASH for x in hashed)
+            for a, b in self._params
+        )
+
+
+def estimate_jaccard(sig_a: Tuple[int, ...], sig_b: Tuple[int, ...]) -> float:
+    """Fraction of equal signature slots, an unbiased estimate of Jaccard similarity"""
+    return sum(1 for a, b in zip(sig_a, sig_b) if a == b) / len(sig_a)
+
+
+class NearDuplicateIndex:
+    """
+    LSH index of MinHash signatures that maps near-duplicate documents to the
+    first (canonical) document seen with that content.
+
+    Args:
+        threshold: Minimum estimated Jaccard similarity to treat two documents as duplicates
+        num_perm: Signature length
+        bands: Number of LSH bands; ``num_perm`` must be divisible by it
+    """
+
+    def __init__(
+        self,
+        threshold: float = DEFAULT_THRESHOLD,
+        num_perm: int = DEFAULT_NUM_PERM,
+        bands: int = DEFAULT_BANDS,
+        shingle_size: int = DEFAULT_SHINGLE_SIZE,
+    ):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.hasher = MinHasher(num_perm, shingle_size)
+        self._buckets: List[Dict[Tuple[int, ...], List[str]]] = [{} for _ in range(bands)]
+        self._signatures: Dict[str, Tuple[int, ...]] = {}
+
+    def _band_keys(self, signature: Tuple[int, ...]) -> List[Tuple[int, ...]]:
+        return [signature[i * self.rows:(i + 1) * self.rows] for i in range(self.bands)]
+
+    def find_duplicate(self, signature: Tuple[int, ...]) -> Optional[Tuple[str, float]]:
+        """Return the most similar indexed document above the threshold, if any"""
+        candidates = set()
+        for band, key in enumerate(self._band_keys(signature)):
+            candidates.update(self._buckets[band].get(key, ()))
+        best = None
+        for doc_id in candidates:
+            similarity = estimate_jaccard(signature, self._signatures[doc_id])
+            if similarity >= self.threshold and (best is None or similarity > best[1]):
+                best = (doc_id, similarity)
+        return best
+
+    def add(self, doc_id: str, signature: Tuple[int, ...]) -> None:
+        self._signatures[doc_id] = signature
+        for band, key in enumerate(self._band_keys(signature)):
+            self._buckets[band].setdefault(key, []).append(doc_id)
+
+    def add_or_match(self, doc_id: str, text: str) -> Optional[Tuple[str, float]]:
+        """
+        Fingerprint a document and either index it as canonical (returns None) or
+        return the ``(canonical_id, similarity)`` of the document it duplicates.
+        """
+        signature = self.hasher.signature(text)
+        duplicate = self.find_duplicate(signature)
+        if duplicate is None:
+            self.add(doc_id, signature)
+        return duplicate
+
+    def __len__(self) -> int:
+        return len(self._signatures)
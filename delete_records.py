@@ -1,14 +1,144 @@
+"""
+Delete records from the Pinecone index.
+
+Without arguments every record is deleted, as before. Deletes can be targeted by
+id prefix (e.g. all ``csv-`` ids), by metadata filter, or by publication year,
+and ``--dry-run`` reports what would be deleted without touching the index.
+
+Examples:
+    python delete_records.py
+    python delete_records.py --prefix csv- --dry-run
+    python delete_records.py --before-year 2024
+    python delete_records.py --filter '{"author": "Jane Doe"}'
+"""
+import argparse
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional
+
 from pinecone import Pinecone
 from dotenv import load_dotenv
-import os
 
-load_dotenv(override=True)
-PINECONE_API_KEY = os.getenv('PINECONE_API_KEY')
-PINECONE_INDEX = os.getenv('PINECONE_INDEX')
+from metadata_filter import matches_filter
+
+FETCH_BATCH_SIZE = 100   # Pinecone fetch accepts up to 100 ids per request
+DELETE_BATCH_SIZE = 1000  # Pinecone delete accepts up to 1000 ids per request
+
+
+def get_index():
+    """Connect to the Pinecone index configured in the environment"""
+    load_dotenv(override=True)
+    PINECONE_API_KEY = os.getenv('PINECONE_API_KEY')
+    PINECONE_INDEX = os.getenv('PINECONE_INDEX')
+
+    assert PINECONE_API_KEY, "PINECONE_API_KEY not set"
+    assert PINECONE_INDEX, "PINECONE_INDEX not set"
+
+    pc = Pinecone(api_key=PINECONE_API_KEY)
+    return pc.Index(PINECONE_INDEX)
+
+
+def list_ids(index, prefix: Optional[str] = None) -> List[str]:
+    """Page through all vector ids in the index, optionally restricted to a prefix"""
+    ids = []
+    kwargs = {"prefix": prefix} if prefix else {}
+    for page in index.list(**kwargs):
+        ids.extend(page)
+    return ids
+
+
+def _batched(items: List[str], size: int) -> Iterable[List[str]]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def fetch_metadata(index, ids: List[str], max_workers: int = 4) -> Dict[str, Dict[str, Any]]:
+    """Fetch metadata for the given ids, several fetch requests in parallel"""
+    def fetch(batch: List[str]) -> Dict[str, Dict[str, Any]]:
+        response = index.fetch(ids=batch)
+        return {
+            vector_id: dict(vector.metadata or {})
+            for vector_id, vector in response.vectors.items()
+        }
+
+    metadata = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for result in executor.map(fetch, _batched(ids, FETCH_BATCH_SIZE)):
+            metadata.update(result)
+    return metadata
+
+
+def find_ids_by_filter(index, pinecone_filter: Dict[str, Any], prefix: Optional[str] = None) -> List[str]:
+    """
+    Find ids whose metadata matches a filter.
+    Works on serverless indexes, which do not support delete-by-filter, by fetching
+    metadata and evaluating the filter locally.
+    """
+    ids = list_ids(index, prefix)
+    metadata = fetch_metadata(index, ids)
+    return [vector_id for vector_id in ids if matches_filter(metadata.get(vector_id, {}), pinecone_filter)]
+
+
+def delete_ids(index, ids: List[str], dry_run: bool = False) -> int:
+    """Delete ids in batches and return how many were (or would be) deleted"""
+    if dry_run:
+        return len(ids)
+    for batch_num, batch in enumerate(_batched(ids, DELETE_BATCH_SIZE), start=1):
+        index.delete(ids=batch)
+        print(f"✅ Deleted batch {batch_num} ({len(batch)} ids)")
+    return len(ids)
+
+
+def print_dry_run_report(ids: List[str], limit: int = 20) -> None:
+    """Print the ids a delete would remove"""
+    print(f"🔍 Dry run: {len(ids)} records would be deleted")
+    for vector_id in ids[:limit]:
+        print(f"   - {vector_id}")
+    if len(ids) > limit:
+        print(f"   ... and {len(ids) - limit} more")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Delete records from the Pinecone index")
+    parser.add_argument("--prefix", help="Only delete ids starting with this prefix (e.g. csv-)")
+    parser.add_argument("--filter", help="Only delete records whose metadata matches this JSON filter")
+    parser.add_argument("--before-year", type=int, help="Only delete records published before this year")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would be deleted without deleting")
+    args = parser.parse_args()
+
+    index = get_index()
+
+    pinecone_filter: Dict[str, Any] = json.loads(args.filter) if args.filter else {}
+    if args.before_year:
+        before_year = {"published_year": {"$lt": args.before_year}}
+        # Both year conditions must hold, so --before-year can only narrow a --filter
+        pinecone_filter = {"$and": [pinecone_filter, before_year]} if pinecone_filter else before_year
+
+    if not args.prefix and not pinecone_filter:
+        if args.dry_run:
+            print_dry_run_report(list_ids(index))
+            return
+        print('Deleting all existing records...')
+        index.delete(delete_all=True)
+        print('✅ All records deleted successfully!')
+        return
+
+    if pinecone_filter:
+        print(f"🔎 Finding records matching {json.dumps(pinecone_filter)}"
+              + (f" with prefix '{args.prefix}'" if args.prefix else ""))
+        ids = find_ids_by_filter(index, pinecone_filter, args.prefix)
+    else:
+        print(f"🔎 Finding records with prefix '{args.prefix}'")
+        ids = list_ids(index, args.prefix)
+
+    if args.dry_run:
+        print_dry_run_report(ids)
+        return
+
+    deleted = delete_ids(index, ids)
+    print(f'✅ Deleted {deleted} records successfully!')
 
-pc = Pinecone(api_key=PINECONE_API_KEY)
-index = pc.Index(PINECONE_INDEX)
 
-print('Deleting all existing records...')
-index.delete(delete_all=True)
-print('✅ All records deleted successfully!')
+if __name__ == "__main__":
+    main()
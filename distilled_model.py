@@ -0,0 +1,494 @@
+"""
+Distilled local filter model, trained from logged LLM filters (filter_log.py).
+
+A CPU-only NumPy model in two parts:
+
+- a token tagger (greedy left-to-right softmax over hashed lexical features and the
+  previous label) that marks author, tag, year, month and day spans with BIO labels
+- a linear classifier over query n-grams that picks the relative date expression
+  (or "unsupported" for filters the tagger cannot express, such as ranges or $nin)
+
+The training labels come from aligning each logged filter with its query. Confidence
+is the sequence probability of the tags times the date class probability, calibrated
+on a held-out split (Platt scaling) so that it reads as the chance the whole filter is
+correct. The agent serves the model's filter when the confidence clears
+DISTILLED_THRESHOLD and falls back to the LLM otherwise. A model that could not be
+calibrated (too few held-out pairs, or all of them right or all wrong) is not saved
+and never serves: its raw sequence probability is no measure of correctness.
+
+Examples:
+    python distilled_model.py train
+    python distilled_model.py train --log logs/filter_log.jsonl --epochs 15
+    python distilled_model.py predict "articles by Jane Doe about IPL from last year"
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import zlib
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from filter_parser import normalize_filter
+from semantic_cache import MONTHS, canonical_filter
+
+DEFAULT_MODEL_PATH = "models/filter_model.npz"
+DEFAULT_THRESHOLD = 0.9
+FEATURE_BITS = 18
+
+LABELS = ["O", "B-AUTHOR", "I-AUTHOR", "B-TAG", "I-TAG", "YEAR", "MONTH", "DAY"]
+UNSUPPORTED = "unsupported"
+DATE_CLASSES = [
+    "none", "today", "yesterday", "this_week", "last_week", "this_month", "last_month",
+    "this_year", "last_year", "last_n_days", "last_n_weeks", "last_n_months", "last_n_years", UNSUPPORTED,
+]
+NUMBER_WORDS = {
+    "a": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7,
+    "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12, "couple": 2, "few": 3,
+}
+TRIGGERS = {"by", "about", "on", "from", "in", "tagged", "with", "written", "covering", "regarding"}
+
+TOKEN_PATTERN = re.compile(
+    r"(?:Dr|Mr|Mrs|Ms|Prof|Jr|Sr|St)\.|\d+(?:st|nd|rd|th)?|[^\W\d_]+(?:['’][^\W\d_]+)*|[^\w\s]"
+)
+
+Token = Tuple[str, int, int]
+
+
+def tokenize(text: str) -> List[Token]:
+    """Tokens with character offsets, so spans map back to the original text"""
+    return [(match.group(0), match.start(), match.end()) for match in TOKEN_PATTERN.finditer(text)]
+
+
+def _shape(token: str) -> str:
+    if token.isdigit():
+        return f"d{len(token)}"
+    if re.fullmatch(r"\d+(?:st|nd|rd|th)", token):
+        return "ordinal"
+    if not token[0].isalnum():
+        return "punct"
+    if token.isupper() and len(token) > 1:
+        return "XX"
+    return "Xx" if token[0].isupper() else "x"
+
+
+def _hash(feature: str) -> int:
+    # crc32 rather than hash(): Python's string hash changes between processes
+    return zlib.crc32(feature.encode("utf-8")) & ((1 << FEATURE_BITS) - 1)
+
+
+def _features(features: List[str]) -> np.ndarray:
+    return np.unique(np.fromiter((_hash(feature) for feature in features), dtype=np.int64))
+
+
+def token_features(words: Sequence[str], position: int, previous_label: str) -> np.ndarray:
+    word = words[position].lower()
+    shape = _shape(words[position])
+    features = [
+        "bias", f"w={word}", f"shape={shape}", f"prefix={word[:3]}", f"suffix={word[-3:]}",
+        f"prev={previous_label}", f"prev|shape={previous_label}|{shape}",
+    ]
+    for offset in (-2, -1, 1, 2):
+        index = position + offset
+        context = words[index] if 0 <= index < len(words) else "<pad>"
+        features.append(f"w{offset}={context.lower()}")
+        features.append(f"shape{offset}={_shape(context) if context != '<pad>' else 'pad'}")
+    previous_word = words[position - 1].lower() if position else "<pad>"
+    features.append(f"bigram={previous_word}|{word}")
+    for index in range(position - 1, max(position - 5, -1), -1):
+        if words[index].lower() in TRIGGERS:
+            features.append(f"trigger={words[index].lower()}")
+            break
+    if word in MONTHS:
+        features.append("month_name")
+    return _features(features)
+
+
+def query_features(words: Sequence[str]) -> np.ndarray:
+    lowered = [word.lower() for word in words]
+    features = ["bias"] + [f"u={word}" for word in lowered]
+    features += [f"b={first}|{second}" for first, second in zip(lowered, lowered[1:])]
+    if any(word.isdigit() or word in NUMBER_WORDS for word in lowered):
+        features.append("has_number")
+    return _features(features)
+
+
+class _Softmax:
+    """Multinomial logistic regression over hashed sparse features, trained with AdaGrad"""
+
+    def __init__(self, classes: int, weights: Optional[np.ndarray] = None):
+        self.weights = weights if weights is not None else np.zeros((1 << FEATURE_BITS, classes), dtype=np.float32)
+        self._squared: Optional[np.ndarray] = None
+
+    def probabilities(self, features: np.ndarray) -> np.ndarray:
+        scores = self.weights[features].sum(axis=0)
+        scores = np.exp(scores - scores.max())
+        return scores / scores.sum()
+
+    def update(self, features: np.ndarray, label: int, learning_rate: float = 0.5) -> None:
+        if self._squared is None:
+            self._squared = np.zeros_like(self.weights)
+        gradient = self.probabilities(features)
+        gradient[label] -= 1.0
+        self._squared[features] += gradient ** 2
+        self.weights[features] -= learning_rate * gradient / np.sqrt(self._squared[features] + 1e-8)
+
+
+def _find_span(words: List[str], labels: List[str], phrase: str) -> Optional[int]:
+    """First position of ``phrase``'s tokens among still unlabelled query tokens"""
+    target = [token.lower() for token, _, _ in tokenize(phrase)]
+    if not target:
+        return None
+    lowered = [word.lower() for word in words]
+    for start in range(len(words) - len(target) + 1):
+        if lowered[start:start + len(target)] == target and all(label == "O" for label in labels[start:start + len(target)]):
+            return start
+    return None
+
+
+def _eq(condition: Any, kind: type) -> Optional[Any]:
+    if isinstance(condition, dict) and list(condition) == ["$eq"] and isinstance(condition["$eq"], kind):
+        return condition["$eq"]
+    return None
+
+
+def align(query: str, output: Dict[str, Any]) -> Tuple[List[str], Optional[List[str]], str]:
+    """
+    Token labels and date class of a (query, filter) pair. Labels are None when the
+    filter cannot be aligned with the query; the date class is "unsupported" when the
+    filter uses anything the model cannot produce.
+    """
+    words = [token for token, _, _ in tokenize(query)]
+    pinecone_filter = normalize_filter(output)
+
+    date_class = "none"
+    if "$date" in pinecone_filter:
+        date_class = str(pinecone_filter["$date"]).partition(":")[0]
+        if date_class not in DATE_CLASSES:
+            return words, None, UNSUPPORTED
+    author = _eq(pinecone_filter.get("author"), str) if "author" in pinecone_filter else None
+    tags = pinecone_filter.get("tags", {}).get("$in") if isinstance(pinecone_filter.get("tags"), dict) else None
+    dates = {field: _eq(pinecone_filter.get(field), int) for field in ("published_year", "published_month", "published_day")}
+    supported = (
+        set(pinecone_filter) <= {"author", "tags", "published_year", "published_month", "published_day", "$date"}
+        and ("author" not in pinecone_filter or author is not None)
+        and ("tags" not in pinecone_filter or (list(pinecone_filter["tags"]) == ["$in"] and tags))
+        and all(field not in pinecone_filter or value is not None for field, value in dates.items())
+    )
+    if not supported:
+        return words, None, UNSUPPORTED
+
+    labels = ["O"] * len(words)
+    for phrase, kind in ([(author, "AUTHOR")] if author else []) + [(tag, "TAG") for tag in tags or []]:
+        start = _find_span(words, labels, phrase)
+        if start is None:
+            return words, None, date_class
+        length = len(tokenize(phrase))
+        labels[start:start + length] = [f"B-{kind}"] + [f"I-{kind}"] * (length - 1)
+
+    def mark(label: str, matches) -> bool:
+        for position, word in enumerate(words):
+            if labels[position] == "O" and matches(word):
+                labels[position] = label
+                return True
+        return False
+
+    year, month, day = dates["published_year"], dates["published_month"], dates["published_day"]
+    if year is not None and not mark("YEAR", lambda word: word == str(year)):
+        return words, None, date_class
+    if month is not None and not (
+        mark("MONTH", lambda word: MONTHS.get(word.lower()) == month)
+        or mark("MONTH", lambda word: word.isdigit() and int(word) == month)
+    ):
+        return words, None, date_class
+    if day is not None and not mark("DAY", lambda word: word[:1].isdigit() and int(re.sub(r"\D", "", word)) == day):
+        return words, None, date_class
+    return words, labels, date_class
+
+
+class FilterModel:
+    """Token tagger plus date classifier; ``predict`` returns a symbolic filter and its confidence"""
+
+    def __init__(self, tagger: Optional[_Softmax] = None, dates: Optional[_Softmax] = None,
+                 calibration: Optional[Tuple[float, float]] = None, trained_on: int = 0):
+        self.tagger = tagger or _Softmax(len(LABELS))
+        self.dates = dates or _Softmax(len(DATE_CLASSES))
+        self.calibration = calibration
+        self.trained_on = trained_on
+
+    def fit(self, examples: List[Tuple[List[str], Optional[List[str]], str]], epochs: int = 10, seed: int = 42) -> "FilterModel":
+        rng = random.Random(seed)
+        order = list(examples)
+        for _ in range(epochs):
+            rng.shuffle(order)
+            for words, labels, date_class in order:
+                self.dates.update(query_features(words), DATE_CLASSES.index(date_class))
+                if labels is None:
+                    continue
+                previous = "<s>"
+                for position, label in enumerate(labels):
+                    self.tagger.update(token_features(words, position, previous), LABELS.index(label))
+                    previous = label
+        self.trained_on = len(examples)
+        return self
+
+    def _tag(self, words: List[str]) -> Tuple[List[str], float]:
+        labels: List[str] = []
+        probability = 1.0
+        previous = "<s>"
+        for position in range(len(words)):
+            probabilities = self.tagger.probabilities(token_features(words, position, previous))
+            best = int(np.argmax(probabilities))
+            probability *= float(probabilities[best])
+            previous = LABELS[best]
+            labels.append(previous)
+        return labels, probability
+
+    def raw_predict(self, query: str) -> Tuple[Dict[str, Any], float]:
+        tokens = tokenize(query)
+        words = [token for token, _, _ in tokens]
+        labels, probability = self._tag(words)
+        date_probabilities = self.dates.probabilities(query_features(words))
+        date_class = DATE_CLASSES[int(np.argmax(date_probabilities))]
+        probability *= float(date_probabilities.max())
+        if date_class == UNSUPPORTED:
+            return {}, 0.0
+
+        # Spans (a stray I- label starts a new span)
+        spans: List[Tuple[str, int, int]] = []
+        for (word, start, end), label in zip(tokens, labels):
+            kind = label.partition("-")[2] or label
+            if label.startswith("I-") and spans and spans[-1][0] == kind:
+                spans[-1] = (kind, spans[-1][1], end)
+            elif label != "O":
+                spans.append((kind, start, end))
+
+        pinecone_filter: Dict[str, Any] = {}
+        authors = [query[start:end] for kind, start, end in spans if kind == "AUTHOR"]
+        if authors:
+            pinecone_filter["author"] = {"$eq": authors[0]}
+        tags = list(dict.fromkeys(query[start:end] for kind, start, end in spans if kind == "TAG"))
+        if tags:
+            pinecone_filter["tags"] = {"$in": tags}
+        for kind, field, valid in (("YEAR", "published_year", range(1900, 2101)),
+                                   ("MONTH", "published_month", range(1, 13)),
+                                   ("DAY", "published_day", range(1, 32))):
+            values = [query[start:end] for span_kind, start, end in spans if span_kind == kind]
+            if not values:
+                continue
+            text = values[0]
+            value = MONTHS.get(text.lower()) if kind == "MONTH" and text.lower() in MONTHS else None
+            if value is None:
+                digits = re.sub(r"\D", "", text)
+                value = int(digits) if digits else None
+            if len(values) > 1 or value not in valid:
+                # Two years or an impossible date: leave it to the LLM
+                return {}, 0.0
+            pinecone_filter[field] = {"$eq": value}
+
+        if date_class != "none":
+            expression = date_class
+            if date_class.startswith("last_n_"):
+                counts = [int(word) for word, label in zip(words, labels) if word.isdigit() and label == "O"]
+                counts += [NUMBER_WORDS[word.lower()] for word in words if word.lower() in NUMBER_WORDS]
+                expression = f"{date_class}:{counts[0] if counts else 1}"
+            pinecone_filter["$date"] = expression
+        return pinecone_filter, probability
+
+    def calibrate(self, raw_confidence: float) -> float:
+        """Probability that a prediction is correct; the raw confidence itself without a calibration"""
+        if self.calibration is None or raw_confidence <= 0:
+            return raw_confidence
+        slope, intercept = self.calibration
+        return float(1.0 / (1.0 + np.exp(-(slope * np.log(raw_confidence) + intercept))))
+
+    def predict(self, query: str) -> Tuple[Dict[str, Any], float]:
+        """Symbolic filter for a query and the calibrated probability that it is correct"""
+        pinecone_filter, raw_confidence = self.raw_predict(query)
+        return pinecone_filter, self.calibrate(raw_confidence)
+
+    def save(self, path: str) -> None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary = path + ".tmp.npz"
+        np.savez_compressed(
+            temporary,
+            tagger=self.tagger.weights,
+            dates=self.dates.weights,
+            meta=np.array(json.dumps({
+                "labels": LABELS,
+                "date_classes": DATE_CLASSES,
+                "feature_bits": FEATURE_BITS,
+                "calibration": self.calibration,
+                "trained_on": self.trained_on,
+            })),
+        )
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path: str) -> "FilterModel":
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            if meta["labels"] != LABELS or meta["date_classes"] != DATE_CLASSES or meta["feature_bits"] != FEATURE_BITS:
+                raise ValueError(f"Model {path} was trained with a different feature or label set; retrain it")
+            calibration = tuple(meta["calibration"]) if meta["calibration"] else None
+            return cls(_Softmax(len(LABELS), data["tagger"]), _Softmax(len(DATE_CLASSES), data["dates"]),
+                       calibration, meta["trained_on"])
+
+
+def _fit_platt(raw_confidences: List[float], correct: List[bool], iterations: int = 100) -> Optional[Tuple[float, float]]:
+    """Logistic fit of correctness on log raw confidence (Newton's method)"""
+    x = np.log(np.clip(np.asarray(raw_confidences, dtype=np.float64), 1e-9, 1.0))
+    y = np.asarray(correct, dtype=np.float64)
+    if len(x) < 20 or y.min() == y.max():
+        return None
+    # Platt's smoothed targets keep the fit finite on separable data
+    positives, negatives = y.sum(), len(y) - y.sum()
+    y = np.where(y == 1, (positives + 1) / (positives + 2), 1 / (negatives + 2))
+    design = np.stack([x, np.ones_like(x)], axis=1)
+    params = np.array([1.0, 0.0])
+    for _ in range(iterations):
+        p = 1.0 / (1.0 + np.exp(-design @ params))
+        gradient = design.T @ (p - y)
+        hessian = design.T @ (design * (p * (1 - p))[:, None]) + 1e-6 * np.eye(2)
+        step = np.linalg.solve(hessian, gradient)
+        params -= step
+        if np.abs(step).max() < 1e-8:
+            break
+    return float(params[0]), float(params[1])
+
+
+def is_correct(predicted: Dict[str, Any], expected: Dict[str, Any]) -> bool:
+    return canonical_filter(normalize_filter(predicted)) == canonical_filter(normalize_filter(expected))
+
+
+def train(pairs: List[Dict[str, Any]], epochs: int = 10, holdout: float = 0.2, seed: int = 42) -> Tuple[FilterModel, Dict[str, Any]]:
+    """
+    Fit on a training split, calibrate confidence on the held-out split, then refit
+    on everything with that calibration. Returns the model and a held-out report.
+    """
+    shuffled = list(pairs)
+    random.Random(seed).shuffle(shuffled)
+    cut = int(len(shuffled) * (1 - holdout)) if len(shuffled) >= 10 else len(shuffled)
+    training, held_out = shuffled[:cut], shuffled[cut:]
+
+    model = FilterModel().fit([align(pair["query"], pair["output"]) for pair in training], epochs, seed)
+    raw_confidences, correct = [], []
+    for pair in held_out:
+        predicted, raw_confidence = model.raw_predict(pair["query"])
+        raw_confidences.append(raw_confidence)
+        correct.append(is_correct(predicted, pair["output"]))
+    calibration = _fit_platt(raw_confidences, correct)
+
+    final = FilterModel(calibration=calibration).fit([align(pair["query"], pair["output"]) for pair in shuffled], epochs, seed)
+    model.calibration = calibration
+    report: Dict[str, Any] = {
+        "pairs": len(pairs),
+        "aligned": sum(align(pair["query"], pair["output"])[1] is not None for pair in pairs),
+        "held_out": len(held_out),
+        "held_out_accuracy": sum(correct) / len(correct) if correct else None,
+        "calibrated": calibration is not None,
+        "thresholds": [],
+    }
+    confidences = [model.calibrate(raw) for raw in raw_confidences]
+    for threshold in (0.5, 0.7, 0.8, 0.9, 0.95):
+        served = [ok for confidence, ok in zip(confidences, correct) if confidence >= threshold]
+        report["thresholds"].append({
+            "threshold": threshold,
+            "coverage": len(served) / len(correct) if correct else 0.0,
+            "accuracy": sum(served) / len(served) if served else None,
+        })
+    return final, report
+
+
+def get_model_path() -> str:
+    return os.getenv("DISTILLED_MODEL_PATH", DEFAULT_MODEL_PATH)
+
+
+class DistilledModelCache:
+    """Holds the model loaded by the API and reloads it when the file on disk is retrained"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.model: Optional[FilterModel] = None
+        self.loaded_mtime: Optional[float] = None
+
+    def get(self) -> Optional[FilterModel]:
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return self.model
+        if mtime != self.loaded_mtime:
+            try:
+                self.model = FilterModel.load(self.path)
+                self.loaded_mtime = mtime
+                print(f"🧠 Loaded distilled filter model ({self.model.trained_on} training pairs)")
+            except Exception as e:
+                print(f"⚠️  Could not load distilled filter model from {self.path}: {e}")
+        return self.model
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train or try the distilled local filter model")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    train_parser = subparsers.add_parser("train", help="Train on logged filters (and the labelled examples)")
+    train_parser.add_argument("--log", default=None, help="Filter log (default: FILTER_LOG_PATH)")
+    train_parser.add_argument("--no-examples", action="store_true",
+                              help="Do not add the built-in examples and labelled test samples")
+    train_parser.add_argument("--epochs", type=int, default=10, help="Training passes")
+    train_parser.add_argument("--output", default=get_model_path(), help="Model file")
+
+    predict_parser = subparsers.add_parser("predict", help="Predict the filter of a query")
+    predict_parser.add_argument("query")
+    predict_parser.add_argument("--model", default=get_model_path(), help="Model file")
+    args = parser.parse_args()
+
+    if args.command == "predict":
+        model = FilterModel.load(args.model)
+        pinecone_filter, confidence = model.predict(args.query)
+        print(json.dumps({
+            "filter": pinecone_filter,
+            "confidence": round(confidence, 4),
+            "calibrated": model.calibration is not None,
+        }, indent=2))
+        return
+
+    from example_bank import BUILTIN_EXAMPLES, load_samples
+    from filter_log import get_filter_log_path, load_pairs
+
+    log_path = args.log or get_filter_log_path()
+    pairs = load_pairs(log_path) if log_path and os.path.exists(log_path) else []
+    print(f"📚 {len(pairs)} logged pairs from {log_path}")
+    if not args.no_examples:
+        pairs += list(BUILTIN_EXAMPLES)
+        try:
+            pairs += load_samples()
+        except FileNotFoundError:
+            pass
+    if not pairs:
+        print("⚠️  Nothing to train on")
+        return
+
+    model, report = train(pairs, args.epochs)
+    print(f"🧠 Trained on {report['pairs']} pairs ({report['aligned']} aligned with their query), "
+          f"held-out accuracy {report['held_out_accuracy'] if report['held_out_accuracy'] is not None else 'n/a'}")
+    if not report["calibrated"]:
+        print(f"❌ Confidence could not be calibrated ({report['held_out']} held-out pairs; at least 20 "
+              f"with both right and wrong predictions are needed). Log more LLM filters and retrain; "
+              f"the model was not saved")
+        sys.exit(1)
+    for row in report["thresholds"]:
+        accuracy = f"{row['accuracy']:.1%}" if row["accuracy"] is not None else "n/a"
+        print(f"   confidence ≥ {row['threshold']:.2f}: serves {row['coverage']:.1%} of queries at {accuracy} accuracy")
+    model.save(args.output)
+    print(f"💾 Model written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+"""
+Load-balanced Ollama embedding client.
+
+Requests are spread over one or more Ollama endpoints, each new request going to
+the healthy endpoint with the fewest outstanding requests. Endpoints that fail or
+become much slower than their peers are ejected for a cool-down period and added
+back once it expires or a health check succeeds. Per-endpoint latency is tracked
+so ingestion and serving can scale with embedding capacity.
+
+Endpoints are configured with ``OLLAMA_EMBED_URLS`` (comma-separated) or, for a
+single instance, ``OLLAMA_EMBED_URL``. ``EMBED_DIMENSION`` truncates the Matryoshka
+embeddings of nomic-embed-text (e.g. to 256 or 512) so ingestion and queries use the
+same, smaller index dimension.
+"""
+
+import os
+import statistics
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlparse
+
+import numpy as np
+import requests
+
+from vector_types import Vector, to_matrix, truncate_embeddings
+
+DEFAULT_EMBED_URL = "http://localhost:11434/api/embeddings"
+DEFAULT_MODEL = "nomic-embed-text"
+
+
+def is_running_in_docker() -> bool:
+    """Check if the application is running inside a Docker container"""
+    return os.path.exists('/.dockerenv')
+
+
+def get_ollama_url() -> str:
+    """Get the appropriate Ollama URL based on the environment"""
+    base_url = os.getenv("OLLAMA_EMBED_URL", DEFAULT_EMBED_URL)
+
+    if is_running_in_docker():
+        # Replace localhost with host.docker.internal for Docker environment
+        base_url = base_url.replace("localhost", "host.docker.internal")
+
+    return base_url
+
+
+def get_embed_dimension() -> Optional[int]:
+    """Configured output dimension, None to keep the model's full vectors"""
+    dimension = int(os.getenv("EMBED_DIMENSION") or 0)
+    return dimension or None
+
+
+def get_ollama_urls() -> List[str]:
+    """Get all configured Ollama endpoints, falling back to the single OLLAMA_EMBED_URL"""
+    urls = [url.strip() for url in os.getenv("OLLAMA_EMBED_URLS", "").split(",") if url.strip()]
+    if not urls:
+        return [get_ollama_url()]
+    if is_running_in_docker():
+        urls = [url.replace("localhost", "host.docker.internal") for url in urls]
+    return urls
+
+
+class EmbeddingEndpoint:
+    """State and latency statistics of a single Ollama endpoint"""
+
+    def __init__(self, url: str, latency_window: int = 200):
+        parsed = urlparse(url)
+        self.base_url = f"{parsed.scheme}://{parsed.netloc}"
+        self.embed_url = f"{self.base_url}/api/embed"
+        self.outstanding = 0
+        self.requests = 0
+        self.errors = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+        self.ejected_for_error = False
+        self.ewma_latency: Optional[float] = None
+        self.latencies: deque = deque(maxlen=latency_window)
+
+    def available(self, now: float) -> bool:
+        return now >= self.ejected_until
+
+    def record_latency(self, seconds: float, alpha: float = 0.2) -> None:
+        self.latencies.append(seconds)
+        self.ewma_latency = seconds if self.ewma_latency is None else (
+            alpha * seconds + (1 - alpha) * self.ewma_latency
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        latencies = sorted(self.latencies)
+        def percentile(p: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 1)
+        return {
+            "url": self.base_url,
+            "healthy": self.available(time.monotonic()),
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "errors": self.errors,
+            "ejections": self.ejections,
+            "ewma_latency_ms": round(self.ewma_latency * 1000, 1) if self.ewma_latency is not None else None,
+            "p50_latency_ms": percentile(0.50),
+            "p95_latency_ms": percentile(0.95),
+        }
+
+
+class EmbeddingClient:
+    """
+    Embedding client balancing requests across Ollama endpoints by least outstanding requests.
+
+    Args:
+        urls: Ollama URLs (only scheme and host are used); defaults to the environment
+        model: Ollama embedding model name
+        timeout: Request timeout in seconds
+        eject_seconds: Cool-down before a failed or slow endpoint is tried again
+        slow_factor: Eject an endpoint whose average latency exceeds this multiple of its peers' median
+        min_samples: Requests an endpoint must have served before it can be judged slow
+        dimension: Output dimension (Matryoshka truncation); None reads EMBED_DIMENSION, 0 keeps full vectors
+    """
+
+    def __init__(
+        self,
+        urls: Optional[List[str]] = None,
+        model: str = DEFAULT_MODEL,
+        timeout: float = 60,
+        eject_seconds: float = 30,
+        slow_factor: float = 3.0,
+        min_samples: int = 10,
+        dimension: Optional[int] = None,
+    ):
+        self.endpoints = [EmbeddingEndpoint(url) for url in (urls or get_ollama_urls())]
+        self.model = model
+        self.timeout = timeout
+        self.eject_seconds = eject_seconds
+        self.slow_factor = slow_factor
+        self.min_samples = min_samples
+        self.dimension = get_embed_dimension() if dimension is None else (dimension or None)
+        self._lock = threading.Lock()
+        self._session = requests.Session()
+        self._health_thread: Optional[threading.Thread] = None
+
+    def _acquire(self, exclude: List[EmbeddingEndpoint]) -> EmbeddingEndpoint:
+        """Pick the available endpoint with the fewest outstanding requests"""
+        now = time.monotonic()
+        with self._lock:
+            candidates = [e for e in self.endpoints if e.available(now) and e not in exclude]
+            if not candidates:
+                # Every endpoint is ejected: try the one that comes back soonest
+                remaining = [e for e in self.endpoints if e not in exclude] or self.endpoints
+                candidates = [min(remaining, key=lambda e: e.ejected_until)]
+            endpoint = min(
+                candidates,
+                key=lambda e: (e.outstanding, e.ewma_latency if e.ewma_latency is not None else 0.0)
+            )
+            endpoint.outstanding += 1
+            endpoint.requests += 1
+            return endpoint
+
+    def _eject(self, endpoint: EmbeddingEndpoint, reason: str, error: bool = True) -> None:
+        endpoint.ejected_until = time.monotonic() + self.eject_seconds
+        endpoint.ejected_for_error = error
+        endpoint.ejections += 1
+        print(f"⚠️  Ejecting embedding endpoint {endpoint.base_url} for {self.eject_seconds:.0f}s: {reason}")
+
+    def _check_slow(self, endpoint: EmbeddingEndpoint) -> None:
+        """Eject an endpoint whose latency is far above the other endpoints"""
+        peers = [
+            e.ewma_latency for e in self.endpoints
+            if e is not endpoint and e.ewma_latency is not None and len(e.latencies) >= self.min_samples
+        ]
+        if not peers or len(endpoint.latencies) < self.min_samples:
+            return
+        baseline = statistics.median(peers)
+        if endpoint.ewma_latency > baseline * self.slow_factor:
+            self._eject(endpoint, f"latency {endpoint.ewma_latency * 1000:.0f}ms vs peers {baseline * 1000:.0f}ms", error=False)
+            # Forget the latency that got it ejected so it is judged afresh when it returns
+            endpoint.latencies.clear()
+            endpoint.ewma_latency = None
+
+    def _post(self, endpoint: EmbeddingEndpoint, inputs: List[str]) -> np.ndarray:
+        response = self._session.post(
+            endpoint.embed_url,
+            json={"model": self.model, "input": inputs},
+            timeout=self.timeout
+        )
+        response.raise_for_status()
+        emb_json = response.json()
+        embeddings = emb_json.get("embeddings")
+        if not embeddings or len(embeddings) != len(inputs):
+            raise ValueError(f"Ollama returned invalid embeddings for batch of {len(inputs)}")
+        return to_matrix(embeddings)
+
+    def _embed_inputs(self, inputs: List[str]) -> np.ndarray:
+        """Embed one request's worth of inputs, failing over to other endpoints on error"""
+        tried: List[EmbeddingEndpoint] = []
+        last_error: Optional[Exception] = None
+        for _ in range(len(self.endpoints)):
+            endpoint = self._acquire(tried)
+            tried.append(endpoint)
+            start = time.perf_counter()
+            try:
+                embeddings = self._post(endpoint, inputs)
+                with self._lock:
+                    endpoint.record_latency(time.perf_counter() - start)
+                    self._check_slow(endpoint)
+                return truncate_embeddings(embeddings, self.dimension)
+            except Exception as e:
+                last_error = e
+                with self._lock:
+                    endpoint.errors += 1
+                    self._eject(endpoint, str(e))
+            finally:
+                with self._lock:
+                    endpoint.outstanding -= 1
+        raise Exception(f"Error generating embedding: {last_error}")
+
+    def embed(self, text: str) -> Vector:
+        """Embed a single text as a float32 vector"""
+        if not text.strip():
+            raise ValueError("Cannot generate embedding for empty text")
+        return self._embed_inputs([text])[0]
+
+    def embed_batch(self, texts: List[str], batch_size: int = 16, max_parallel: Optional[int] = None) -> np.ndarray:
+        """
+        Embed several texts, ``batch_size`` per request, with requests spread over
+        the endpoints in parallel. Returns a float32 matrix with one row per text, in input order.
+        """
+        if any(not text.strip() for text in texts):
+            raise ValueError("Cannot generate embedding for empty text")
+        batches = [texts[start:start + batch_size] for start in range(0, len(texts), batch_size)]
+        if not batches:
+            return to_matrix([])
+        workers = max_parallel or min(len(batches), 2 * len(self.endpoints))
+        if workers <= 1:
+            results = [self._embed_inputs(batch) for batch in batches]
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(self._embed_inputs, batches))
+        return np.concatenate(results) if len(results) > 1 else results[0]
+
+    def check_health(self) -> None:
+        """Ping every endpoint; re-admit ejected endpoints that respond and eject dead ones"""
+        for endpoint in self.endpoints:
+            try:
+                response = self._session.get(f"{endpoint.base_url}/api/tags", timeout=5)
+                response.raise_for_status()
+                with self._lock:
+                    # Endpoints ejected for being slow sit out their full cool-down
+                    if not endpoint.available(time.monotonic()) and endpoint.ejected_for_error:
+                        endpoint.ejected_until = 0.0
+            except Exception as e:
+                with self._lock:
+                    if endpoint.available(time.monotonic()):
+                        self._eject(endpoint, f"health check failed: {e}")
+
+    def start_health_checks(self, interval: float = 15) -> None:
+        """Run check_health periodically in a daemon thread"""
+        if self._health_thread is not None or len(self.endpoints) < 2:
+            return
+
+        def loop() -> None:
+            while True:
+                time.sleep(interval)
+                self.check_health()
+
+        self._health_thread = threading.Thread(target=loop, name="embedding-health", daemon=True)
+        self._health_thread.start()
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Per-endpoint health, load and latency statistics"""
+        with self._lock:
+            return [endpoint.stats() for endpoint in self.endpoints]
@@ -0,0 +1,177 @@
+"""
+Evaluate Matryoshka truncation of nomic-embed-text on our own corpus.
+
+Loads a snapshot of full-dimension vectors (see snapshot.py), truncates corpus and
+query vectors to each candidate dimension exactly as EmbeddingClient does with
+EMBED_DIMENSION, and reports recall@k of the truncated top-k against the top-k of
+the full vectors, alongside storage per vector and brute-force scan time.
+
+Queries are the natural-language samples of test_samples-queries.json (embedded
+with Ollama at full dimension) and/or vectors sampled from the corpus itself
+(``--sample-queries``, works offline; the sampled vector is excluded from its own results).
+
+Examples:
+    python evaluate_matryoshka.py --snapshot snapshots/index --dimensions 128,256,512
+    python evaluate_matryoshka.py --snapshot snapshots/synthetic --sample-queries 500 --no-text-queries
+"""
+import argparse
+import json
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from snapshot import SnapshotReader
+from vector_types import VECTOR_DTYPE, normalize, truncate_embeddings
+
+DEFAULT_DIMENSIONS = "64,128,256,512"
+
+
+def load_text_queries(path: str) -> List[str]:
+    """All query strings of a test samples file"""
+    with open(path, 'r', encoding='utf-8') as f:
+        samples = json.load(f)
+    return [sample["query"] for section in samples.values() for sample in section]
+
+
+def top_k(
+    queries: np.ndarray,
+    vectors: np.ndarray,
+    k: int,
+    dimension: Optional[int] = None,
+    exclude: Optional[np.ndarray] = None,
+    block_size: int = 50000,
+) -> Tuple[np.ndarray, float]:
+    """
+    Exact top-k row numbers by dot product, scanning the (memory-mapped) corpus in blocks.
+    Returns the (queries, k) row numbers and the seconds spent scoring.
+    """
+    if dimension:
+        queries = truncate_embeddings(queries, dimension)
+    best_scores = np.full((len(queries), k), -np.inf, dtype=VECTOR_DTYPE)
+    best_rows = np.full((len(queries), k), -1, dtype=np.int64)
+    scan_seconds = 0.0
+    for start in range(0, len(vectors), block_size):
+        block = np.asarray(vectors[start:start + block_size], dtype=VECTOR_DTYPE)
+        if dimension:
+            block = truncate_embeddings(block, dimension)
+        scan_start = time.perf_counter()
+        scores = queries @ block.T
+        if exclude is not None:
+            inside = (exclude >= start) & (exclude < start + len(block))
+            scores[np.nonzero(inside)[0], exclude[inside] - start] = -np.inf
+        rows = np.broadcast_to(np.arange(start, start + len(block)), scores.shape)
+        all_scores = np.concatenate([best_scores, scores], axis=1)
+        all_rows = np.concatenate([best_rows, rows], axis=1)
+        keep = np.argpartition(-all_scores, k - 1, axis=1)[:, :k]
+        best_scores = np.take_along_axis(all_scores, keep, axis=1)
+        best_rows = np.take_along_axis(all_rows, keep, axis=1)
+        scan_seconds += time.perf_counter() - scan_start
+    return best_rows, scan_seconds
+
+
+def recall_at_k(reference: np.ndarray, candidate: np.ndarray) -> float:
+    """Mean fraction of the reference top-k found in the candidate top-k"""
+    hits = [len(set(ref) & set(cand)) / len(ref) for ref, cand in zip(reference.tolist(), candidate.tolist())]
+    return float(np.mean(hits)) if hits else 0.0
+
+
+def build_queries(
+    reader: SnapshotReader,
+    queries_path: Optional[str],
+    sample_queries: int,
+    seed: int,
+) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """Full-dimension query matrix and, for sampled corpus queries, the row each one must not match"""
+    parts = []
+    exclude = []
+    if queries_path:
+        from embedding_client import EmbeddingClient
+
+        texts = load_text_queries(queries_path)
+        print(f"🔄 Embedding {len(texts)} queries from {queries_path} at full dimension...")
+        embedded = EmbeddingClient(dimension=0).embed_batch(texts)
+        if embedded.shape[1] != reader.dimension:
+            raise ValueError(f"Query dimension {embedded.shape[1]} does not match snapshot dimension {reader.dimension}")
+        parts.append(embedded)
+        exclude.extend([-1] * len(texts))
+    if sample_queries:
+        rng = np.random.default_rng(seed)
+        rows = np.sort(rng.choice(reader.count, size=min(sample_queries, reader.count), replace=False))
+        parts.append(np.asarray(reader.vectors[rows], dtype=VECTOR_DTYPE))
+        exclude.extend(rows.tolist())
+    if not parts:
+        raise ValueError("No queries: pass --queries and/or --sample-queries")
+    queries = normalize(np.concatenate(parts).astype(VECTOR_DTYPE))
+    exclude_rows = np.asarray(exclude, dtype=np.int64)
+    return queries, exclude_rows if (exclude_rows >= 0).any() else None
+
+
+def evaluate(
+    reader: SnapshotReader,
+    queries: np.ndarray,
+    dimensions: List[int],
+    k: int,
+    exclude: Optional[np.ndarray] = None,
+) -> List[Dict[str, Any]]:
+    """Recall@k, bytes per vector and scan time for the full dimension and each truncation"""
+    reference, full_seconds = top_k(queries, reader.vectors, k, exclude=exclude)
+    results = [{
+        "dimension": reader.dimension,
+        "recall_at_k": 1.0,
+        "bytes_per_vector": reader.dimension * np.dtype(VECTOR_DTYPE).itemsize,
+        "scan_ms_per_query": full_seconds * 1000 / len(queries),
+    }]
+    for dimension in sorted(d for d in dimensions if d < reader.dimension):
+        candidate, seconds = top_k(queries, reader.vectors, k, dimension=dimension, exclude=exclude)
+        results.append({
+            "dimension": dimension,
+            "recall_at_k": recall_at_k(reference, candidate),
+            "bytes_per_vector": dimension * np.dtype(VECTOR_DTYPE).itemsize,
+            "scan_ms_per_query": seconds * 1000 / len(queries),
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure recall@k of Matryoshka-truncated embeddings against full vectors")
+    parser.add_argument("--snapshot", required=True, help="Snapshot directory with full-dimension vectors")
+    parser.add_argument("--dimensions", default=DEFAULT_DIMENSIONS, help="Comma-separated dimensions to evaluate")
+    parser.add_argument("--k", type=int, default=10, help="Number of neighbours compared")
+    parser.add_argument("--queries", default="test_samples-queries.json", help="Natural-language queries to embed")
+    parser.add_argument("--no-text-queries", action="store_true", help="Do not embed the natural-language queries")
+    parser.add_argument("--sample-queries", type=int, default=0, help="Also use this many corpus vectors as queries")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed for sampled queries")
+    parser.add_argument("--output", default="matryoshka_eval-results.json", help="Where to write the results")
+    args = parser.parse_args()
+
+    reader = SnapshotReader(args.snapshot)
+    k = min(args.k, reader.count)
+    queries, exclude = build_queries(
+        reader, None if args.no_text_queries else args.queries, args.sample_queries, args.seed
+    )
+    print(f"🧪 Evaluating {len(queries)} queries against {reader.count} vectors "
+          f"(full dimension {reader.dimension}, k={k})")
+
+    results = evaluate(reader, queries, [int(d) for d in args.dimensions.split(",") if d.strip()], k, exclude)
+
+    print(f"\n{'Dimension':>10} {'Recall@' + str(k):>10} {'Bytes/vec':>10} {'Scan ms/query':>14}")
+    for row in results:
+        print(f"{row['dimension']:>10} {row['recall_at_k']:>10.3f} {row['bytes_per_vector']:>10} "
+              f"{row['scan_ms_per_query']:>14.2f}")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump({
+            "timestamp": datetime.now().isoformat(),
+            "snapshot": args.snapshot,
+            "vectors": reader.count,
+            "queries": len(queries),
+            "k": k,
+            "results": results,
+        }, f, indent=2)
+    print(f"\n💾 Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Compare filter accuracy and prompt size of the full and the dynamic few-shot prompt.
+
+Runs every labelled sample of test_samples-queries.json through the agent once per
+prompt mode. Generated filters have their relative dates resolved for ``--today`` and
+are compared with the expected filters; prompt tokens come from Gemini's usage
+metadata. Dynamic prompts never include the sample being evaluated as an example.
+
+Every sample goes to the LLM backend itself: the distilled model, trained on these
+same samples, is bypassed, and the generated filters are not added to the filter log
+the distilled model is trained from.
+
+The samples were labelled in July 2025 ("last month" is June 2025), hence the default
+``--today``.
+
+Examples:
+    python evaluate_prompts.py
+    python evaluate_prompts.py --k 2,4,6
+    python evaluate_prompts.py --backend ollama
+"""
+import argparse
+import json
+import os
+import time
+from datetime import date, datetime
+from typing import Any, Dict, List
+
+import numpy as np
+
+from embedding_client import EmbeddingClient
+from example_bank import DEFAULT_SAMPLES_FILE, ExampleBank
+from filter_parser import normalize_filter
+from nl2pinecone_agent import NL2PineconeAgent
+from rate_limiter import RateLimiter, estimate_tokens, is_rate_limit_error
+from semantic_cache import canonical_filter
+from temporal import resolve_temporal
+
+GEMINI_RPM = float(os.getenv("GEMINI_RPM", 15))
+GEMINI_TPM = float(os.getenv("GEMINI_TPM", 1000000))
+SAMPLES_LABELLED_ON = "2025-07-15"
+
+
+def load_labelled_samples(path: str) -> List[Dict[str, Any]]:
+    with open(path, 'r', encoding='utf-8') as f:
+        samples = json.load(f)
+    return [sample for section in samples.values() for sample in section]
+
+
+def run_mode(
+    agent: NL2PineconeAgent,
+    samples: List[Dict[str, Any]],
+    query_vectors: np.ndarray,
+    mode: str,
+    limiter: RateLimiter,
+    today: date,
+    max_attempts: int = 5,
+) -> Dict[str, Any]:
+    """Accuracy, average latency and prompt tokens of one prompt mode"""
+    agent.prompt_stats.pop(mode, None)
+    matches = 0
+    latencies = []
+    failures = []
+    for sample, query_vector in zip(samples, query_vectors):
+        query = sample["query"]
+        prompt, _ = agent.build_prompt(query, query_vector, mode, exclude_examples=[query])
+        estimate = estimate_tokens(prompt) + 50
+        generated = None
+        for attempt in range(1, max_attempts + 1):
+            limiter.acquire(estimate)
+            start = time.perf_counter()
+            try:
+                # An explicit backend skips the distilled model
+                generated = agent.generate_symbolic_filter(
+                    query, query_vector, mode, exclude_examples=[query], backend=agent.default_backend
+                )
+            except Exception as e:
+                if is_rate_limit_error(e) and attempt < max_attempts:
+                    pause = limiter.on_throttled()
+                    print(f"⏳ Rate limited (attempt {attempt}), backing off {pause:.1f}s")
+                    continue
+                print(f"❌ [{mode}] {query}: {e}")
+            else:
+                latencies.append(time.perf_counter() - start)
+                limiter.on_success()
+            break
+
+        resolved = resolve_temporal(generated, today) if generated is not None else None
+        if resolved is not None and canonical_filter(resolved) == canonical_filter(normalize_filter(sample["expected_results"])):
+            matches += 1
+            print(f"✅ [{mode}] {query}")
+        else:
+            print(f"❌ [{mode}] {query}\n    Expected:  {json.dumps(sample['expected_results'])}"
+                  f"\n    Generated: {json.dumps(resolved)}")
+            failures.append({"query": query, "expected": sample["expected_results"], "generated": resolved})
+
+    stats = agent.get_prompt_stats()["modes"].get(mode, {})
+    return {
+        "mode": mode,
+        "few_shot_k": agent.few_shot_k if mode == "dynamic" else None,
+        "accuracy": matches / len(samples) if samples else 0.0,
+        "avg_prompt_tokens": stats.get("avg_prompt_tokens", 0.0),
+        "avg_output_tokens": stats.get("avg_output_tokens", 0.0),
+        "avg_latency_ms": 1000 * sum(latencies) / len(latencies) if latencies else 0.0,
+        "failures": failures,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare accuracy and prompt tokens of the full and dynamic prompts")
+    parser.add_argument("--samples", default=DEFAULT_SAMPLES_FILE, help="Labelled test samples")
+    parser.add_argument("--k", default="4", help="Comma-separated few-shot sizes for the dynamic prompt")
+    parser.add_argument("--today", default=SAMPLES_LABELLED_ON,
+                        help="Date relative dates are resolved for (YYYY-MM-DD)")
+    parser.add_argument("--backend", default=None, help="LLM backend to evaluate (default: LLM_BACKEND)")
+    parser.add_argument("--output", default="prompt_eval-results.json", help="Where to write the results")
+    args = parser.parse_args()
+
+    samples = load_labelled_samples(args.samples)
+    today = date.fromisoformat(args.today)
+    embedding_client = EmbeddingClient()
+    example_bank = ExampleBank.default(embedding_client.embed_batch, args.samples)
+    agent = NL2PineconeAgent(
+        example_bank=example_bank,
+        distilled_model_path=None,
+        filter_log_path=None,
+        **({"backend": args.backend} if args.backend else {}),
+    )
+    limiter = RateLimiter(GEMINI_RPM, GEMINI_TPM)
+    query_vectors = embedding_client.embed_batch([sample["query"] for sample in samples])
+    print(f"🧪 Evaluating {len(samples)} samples (relative dates resolved for {today})")
+
+    results = [run_mode(agent, samples, query_vectors, "full", limiter, today)]
+    for k in [int(value) for value in args.k.split(",") if value.strip()]:
+        agent.few_shot_k = k
+        results.append(run_mode(agent, samples, query_vectors, "dynamic", limiter, today))
+
+    print(f"\n{'Prompt':>12} {'Accuracy':>9} {'Prompt tokens':>14} {'Latency ms':>11}")
+    for row in results:
+        label = row["mode"] if row["mode"] == "full" else f"dynamic k={row['few_shot_k']}"
+        print(f"{label:>12} {row['accuracy']:>9.1%} {row['avg_prompt_tokens']:>14.0f} {row['avg_latency_ms']:>11.0f}")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump({
+            "timestamp": datetime.now().isoformat(),
+            "samples": len(samples),
+            "today": today.isoformat(),
+            "backend": agent.default_backend,
+            "results": results,
+        }, f, indent=2)
+    print(f"\n💾 Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Few-shot example bank for the Gemini prompt, indexed by query embedding.
+
+Seeded from the examples that used to be embedded in the system prompt and from the
+labelled samples in test_samples-queries.json. Instead of sending every example with
+every query, the agent asks the bank for the k examples whose queries are most
+similar to the incoming one and pairs them with a condensed rule set.
+
+Samples that use relative dates ("last year", "this month") were labelled with the
+concrete dates of the day they were written; they are converted to the symbolic
+``$date`` form the agent now emits (see temporal.py).
+"""
+
+import json
+import re
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from filter_parser import to_compact
+from vector_types import VectorLike, normalize, to_matrix, to_vector
+
+DEFAULT_SAMPLES_FILE = "test_samples-queries.json"
+DEFAULT_K = 4
+
+BUILTIN_EXAMPLES: List[Dict[str, Any]] = [
+    {"query": "articles by Dr. Smith about web development from 2023",
+     "output": {"author": "Dr. Smith", "tags": {"$in": ["web development"]}, "published_year": {"$eq": 2023}}},
+    {"query": "find posts about World Cup 2022",
+     "output": {"tags": {"$in": ["World Cup 2022"]}}},
+    {"query": "show me posts about Lakers from December",
+     "output": {"tags": {"$in": ["Lakers"]}, "published_month": {"$eq": 12}}},
+    {"query": "articles about basketball training methods",
+     "output": {"tags": {"$in": ["basketball", "training", "methods"]}}},
+    {"query": "posts about business news",
+     "output": {"tags": {"$in": ["business", "news"]}}},
+    {"query": "find all articles by Sarah Wilson",
+     "output": {"author": "Sarah Wilson"}},
+    {"query": "show me articles from January 15th, 2023",
+     "output": {"published_year": {"$eq": 2023}, "published_month": {"$eq": 1}, "published_day": {"$eq": 15}}},
+    {"query": "posts about Tom Brady and Patriots history",
+     "output": {"tags": {"$in": ["Tom Brady", "Patriots", "history"]}}},
+    {"query": "articles by Alice Zhang from last year about machine learning",
+     "output": {"author": "Alice Zhang", "tags": {"$in": ["machine learning"]}, "$date": "last_year"}},
+    {"query": "IPL news from the past two weeks",
+     "output": {"tags": {"$in": ["IPL", "news"]}, "$date": "last_n_weeks:2"}},
+]
+
+# Relative phrases in labelled samples and the date fields they were resolved into
+RELATIVE_PHRASES = {
+    "last year": ("last_year", ("published_year",)),
+    "this year": ("this_year", ("published_year",)),
+    "last month": ("last_month", ("published_year", "published_month")),
+    "this month": ("this_month", ("published_year", "published_month")),
+}
+
+
+def to_symbolic(query: str, output: Dict[str, Any]) -> Dict[str, Any]:
+    """Replace concrete dates a relative phrase was resolved into with its ``$date`` expression"""
+    lowered = query.lower()
+    for phrase, (expression, fields) in RELATIVE_PHRASES.items():
+        if re.search(rf"\b{phrase}\b", lowered):
+            symbolic = {key: value for key, value in output.items() if key not in fields}
+            symbolic["$date"] = expression
+            return symbolic
+    return output
+
+
+def load_samples(path: str = DEFAULT_SAMPLES_FILE) -> List[Dict[str, Any]]:
+    """Labelled samples of a test samples file as examples"""
+    with open(path, 'r', encoding='utf-8') as f:
+        samples = json.load(f)
+    return [
+        {"query": sample["query"], "output": to_symbolic(sample["query"], sample["expected_results"])}
+        for section in samples.values()
+        for sample in section
+    ]
+
+
+def _query_key(query: str) -> str:
+    """Case- and punctuation-insensitive identity of a query"""
+    return " ".join(re.sub(r"[^\w\s]", " ", query.lower()).split())
+
+
+def format_example(example: Dict[str, Any], compact: bool = False) -> str:
+    """Example as it appears in the prompt, with its output in the compact schema if requested"""
+    output = example['output']
+    if compact:
+        output = to_compact(output)
+    return f"Query: {example['query']}\nOutput: {json.dumps(output)}"
+
+
+class ExampleBank:
+    """
+    Examples indexed by the embedding of their query.
+
+    Args:
+        examples: ``{"query", "output"}`` dicts
+        embed_batch: Function embedding a list of texts into a matrix (e.g. EmbeddingClient.embed_batch)
+    """
+
+    def __init__(self, examples: Iterable[Dict[str, Any]], embed_batch: Callable[[List[str]], Any]):
+        # Later duplicates of a query (e.g. a sample repeating a built-in example) are dropped
+        unique: Dict[str, Dict[str, Any]] = {}
+        for example in examples:
+            unique.setdefault(_query_key(example["query"]), example)
+        self.examples = list(unique.values())
+        self.embed_batch = embed_batch
+        self._vectors: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def default(cls, embed_batch: Callable[[List[str]], Any], samples_file: str = DEFAULT_SAMPLES_FILE) -> "ExampleBank":
+        """Built-in examples plus the labelled samples, when the samples file exists"""
+        examples = list(BUILTIN_EXAMPLES)
+        try:
+            examples.extend(load_samples(samples_file))
+        except FileNotFoundError:
+            pass
+        return cls(examples, embed_batch)
+
+    def _ensure_vectors(self) -> np.ndarray:
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = normalize(to_matrix(self.embed_batch([e["query"] for e in self.examples])))
+            return self._vectors
+
+    def select(
+        self,
+        query_vector: VectorLike,
+        k: int = DEFAULT_K,
+        exclude_queries: Iterable[str] = (),
+    ) -> List[Dict[str, Any]]:
+        """The k examples most similar to the query, most similar last (closest to the query in the prompt)"""
+        vectors = self._ensure_vectors()
+        query = to_vector(query_vector)
+        scores = vectors @ (query / (np.linalg.norm(query) or 1.0))
+        excluded = {_query_key(q) for q in exclude_queries}
+        ranked = [i for i in np.argsort(-scores) if _query_key(self.examples[i]["query"]) not in excluded]
+        return [self.examples[i] for i in reversed(ranked[:k])]
@@ -0,0 +1,255 @@
+"""
+Schema-aware filter compiler: validation, one canonical normal form and a stable hash.
+
+Every filter the agent produces goes through ``compile_filter`` before it is cached,
+logged or sent to Pinecone:
+
+- validation against the metadata schema: known fields, operators the field supports,
+  operand types, month/day ranges and valid ``$date`` expressions. Problems raise
+  FilterValidationError locally instead of surfacing as a rejected Pinecone query
+- a normal form: explicit operators, sorted and deduplicated ``$in``/``$nin`` lists,
+  a single-value ``$in``/``$nin`` on a scalar field as ``$eq``/``$ne``, integer bounds
+  as ``$gte``/``$lte`` (``$eq`` when they meet), bounds the schema already implies
+  (``published_month >= 1``) dropped, ``$in`` values excluded by ``$nin``/``$ne``
+  pruned, nested ``$and`` flattened and ``$and``/``$or`` clauses sorted
+- ``filter_hash``: a short hash of the normal form, so equivalent filters share
+  cache entries
+
+Filters that can never match (an empty range, ``$eq`` outside its own ``$in``) are
+rejected too: they are generation errors, not searches.
+"""
+
+import hashlib
+import json
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+from filter_parser import normalize_filter
+from temporal import DATE_KEY, expression_range
+
+SCHEMA: Dict[str, Dict[str, Any]] = {
+    "author": {"type": str},
+    "tags": {"type": str, "list": True},
+    "published_year": {"type": int, "min": 1900, "max": 2100},
+    "published_month": {"type": int, "min": 1, "max": 12},
+    "published_day": {"type": int, "min": 1, "max": 31},
+}
+SCALAR_OPERATORS = {"$eq", "$ne", "$in", "$nin", "$exists"}
+LIST_FIELD_OPERATORS = {"$in", "$nin", "$exists"}
+RANGE_OPERATORS = {"$gt", "$gte", "$lt", "$lte"}
+
+
+class FilterValidationError(ValueError):
+    """Raised for filters that do not fit the metadata schema or can never match"""
+
+    def __init__(self, errors: List[str]):
+        super().__init__("; ".join(errors))
+        self.errors = errors
+
+
+def _allowed_operators(spec: Dict[str, Any]) -> set:
+    if spec.get("list"):
+        return LIST_FIELD_OPERATORS
+    return SCALAR_OPERATORS | RANGE_OPERATORS if spec["type"] is int else SCALAR_OPERATORS
+
+
+def _is_value(spec: Dict[str, Any], value: Any) -> bool:
+    if spec["type"] is int:
+        return isinstance(value, int) and not isinstance(value, bool)
+    return isinstance(value, str) and value != ""
+
+
+def _in_schema_range(spec: Dict[str, Any], value: int) -> bool:
+    return spec["type"] is not int or spec["min"] <= value <= spec["max"]
+
+
+def _compile_field(field: str, condition: Dict[str, Any], errors: List[str]) -> Optional[Dict[str, Any]]:
+    """Normal form of one field condition; None when it is invalid (errors are appended)"""
+    spec = SCHEMA.get(field)
+    if spec is None:
+        errors.append(f"Unknown field {field!r}; expected one of {sorted(SCHEMA)}")
+        return None
+    allowed = _allowed_operators(spec)
+    expected = "an integer" if spec["type"] is int else "a non-empty string"
+    operators: Dict[str, Any] = {}
+    valid = True
+    for operator, operand in condition.items():
+        if operator not in allowed:
+            errors.append(f"{field}: operator {operator} is not supported (use {', '.join(sorted(allowed))})")
+            valid = False
+        elif operator == "$exists":
+            if not isinstance(operand, bool):
+                errors.append(f"{field}: $exists expects true or false, got {operand!r}")
+                valid = False
+            operators[operator] = operand
+        elif operator in ("$in", "$nin"):
+            if not isinstance(operand, list) or not all(_is_value(spec, item) for item in operand):
+                errors.append(f"{field}: {operator} expects a list of {expected}s, got {operand!r}")
+                valid = False
+            else:
+                operators[operator] = sorted(set(operand))
+        elif not _is_value(spec, operand):
+            errors.append(f"{field}: {operator} expects {expected}, got {operand!r}")
+            valid = False
+        else:
+            operators[operator] = operand
+    # Equality outside the schema (month 13) is a wrong filter, not an empty search
+    for value in [operators.get("$eq")] + list(operators.get("$in", [])):
+        if value is not None and not _in_schema_range(spec, value):
+            errors.append(f"{field}: {value} is outside {spec['min']}..{spec['max']}")
+            valid = False
+    if not valid:
+        return None
+    simplified = _simplify(spec, operators)
+    if simplified is None:
+        errors.append(f"{field}: conditions {condition} can never match")
+    return simplified
+
+
+def _simplify(spec: Dict[str, Any], operators: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Canonical operators of a valid field condition; None when no value can satisfy it"""
+    exists = operators.pop("$exists", None)
+    if exists is False:
+        return None if operators else {"$exists": False}
+
+    excluded = set(operators.pop("$nin", []))
+    if "$ne" in operators:
+        excluded.add(operators.pop("$ne"))
+
+    low: Optional[int] = None
+    high: Optional[int] = None
+    if spec["type"] is int:
+        low, high = spec["min"], spec["max"]
+        if "$gt" in operators:
+            low = max(low, operators.pop("$gt") + 1)
+        if "$gte" in operators:
+            low = max(low, operators.pop("$gte"))
+        if "$lt" in operators:
+            high = min(high, operators.pop("$lt") - 1)
+        if "$lte" in operators:
+            high = min(high, operators.pop("$lte"))
+        if low > high:
+            return None
+        excluded = {value for value in excluded if low <= value <= high}
+
+    def in_bounds(value: Any) -> bool:
+        return low is None or low <= value <= high
+
+    if "$eq" in operators:
+        value = operators["$eq"]
+        if not in_bounds(value) or value in excluded or value not in operators.get("$in", [value]):
+            return None
+        return {"$eq": value}
+
+    if "$in" in operators:
+        # Tags match when any element is in the list, so an excluded tag can only be dropped from it too
+        values = [value for value in operators["$in"] if in_bounds(value) and value not in excluded]
+        if not values:
+            return None
+        if spec.get("list"):
+            return {"$in": values, **({"$nin": sorted(excluded)} if excluded else {})}
+        return {"$eq": values[0]} if len(values) == 1 else {"$in": values}
+
+    canonical: Dict[str, Any] = {}
+    if low is not None and low == high:
+        return None if low in excluded else {"$eq": low}
+    if low is not None and low > spec["min"]:
+        canonical["$gte"] = low
+    if high is not None and high < spec["max"]:
+        canonical["$lte"] = high
+    if excluded:
+        if spec.get("list"):
+            canonical["$nin"] = sorted(excluded)
+        elif len(excluded) == 1:
+            canonical["$ne"] = next(iter(excluded))
+        else:
+            canonical["$nin"] = sorted(excluded)
+    if not canonical and exists:
+        canonical["$exists"] = True
+    return canonical
+
+
+def canonical_json(pinecone_filter: Dict[str, Any]) -> str:
+    """Compact JSON with sorted keys; the serialization hashed by ``filter_hash``"""
+    return json.dumps(pinecone_filter, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+
+def _compile(pinecone_filter: Dict[str, Any], errors: List[str]) -> Dict[str, Any]:
+    compiled: Dict[str, Any] = {}
+    clauses: List[Dict[str, Any]] = []
+    for key, value in normalize_filter(pinecone_filter).items():
+        if key in ("$and", "$or"):
+            if not isinstance(value, list) or not all(isinstance(clause, dict) for clause in value):
+                errors.append(f"{key} expects a list of filters, got {value!r}")
+                continue
+            compiled_clauses = [_compile(clause, errors) for clause in value]
+            if key == "$or":
+                # A branch without conditions matches everything, and so does the whole $or
+                if compiled_clauses and all(compiled_clauses):
+                    unique = {canonical_json(clause): clause for clause in compiled_clauses}
+                    branches = [unique[text] for text in sorted(unique)]
+                    if len(branches) == 1:
+                        clauses.append(branches[0])
+                    else:
+                        clauses.append({"$or": branches})
+                continue
+            for clause in compiled_clauses:
+                # Flatten nested $and
+                clauses.extend(clause["$and"] if list(clause) == ["$and"] else [clause] if clause else [])
+        elif key == DATE_KEY:
+            try:
+                expression_range(str(value), date.today())
+            except ValueError as e:
+                errors.append(f"$date: {e}")
+                continue
+            compiled[DATE_KEY] = str(value).strip().lower()
+        elif isinstance(value, dict):
+            condition = _compile_field(key, value, errors)
+            if condition:
+                compiled[key] = condition
+        else:
+            errors.append(f"{key}: expected a condition, got {value!r}")
+
+    # Conjunctive clauses move to the top level when their keys are free there
+    remaining: Dict[str, Dict[str, Any]] = {}
+    for clause in sorted(clauses, key=canonical_json):
+        if not set(clause) & set(compiled):
+            compiled.update(clause)
+        else:
+            remaining.setdefault(canonical_json(clause), clause)
+    if remaining:
+        compiled["$and"] = [remaining[text] for text in sorted(remaining)]
+    return dict(sorted(compiled.items()))
+
+
+def compile_filter(pinecone_filter: Any) -> Dict[str, Any]:
+    """Validated normal form of a filter (symbolic ``$date`` allowed); raises FilterValidationError"""
+    if not isinstance(pinecone_filter, dict):
+        raise FilterValidationError([f"A filter must be a JSON object, got {type(pinecone_filter).__name__}"])
+    errors: List[str] = []
+    compiled = _compile(pinecone_filter, errors)
+    if errors:
+        raise FilterValidationError(errors)
+    return compiled
+
+
+def validate_filter(pinecone_filter: Any) -> List[str]:
+    """Validation errors of a filter, empty when it is valid"""
+    try:
+        compile_filter(pinecone_filter)
+    except FilterValidationError as e:
+        return e.errors
+    return []
+
+
+def canonical_form(pinecone_filter: Any) -> Any:
+    """Normal form of a valid filter; invalid ones only get explicit operators, for comparisons"""
+    try:
+        return compile_filter(pinecone_filter)
+    except FilterValidationError:
+        return normalize_filter(pinecone_filter) if isinstance(pinecone_filter, dict) else pinecone_filter
+
+
+def filter_hash(pinecone_filter: Any) -> str:
+    """Stable hash of a filter's normal form; equivalent filters hash alike"""
+    return hashlib.sha256(canonical_json(canonical_form(pinecone_filter)).encode("utf-8")).hexdigest()[:16]
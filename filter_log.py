@@ -0,0 +1,58 @@
+"""
+Append-only log of (query, filter) pairs generated by the LLM in production.
+
+Each line is a JSON record ``{"timestamp", "query", "filter", "backend"}`` with the
+symbolic filter (relative dates as ``$date``) exactly as it was parsed and validated.
+The log is the training set of the distilled local filter model (distilled_model.py).
+"""
+
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+DEFAULT_FILTER_LOG_PATH = "logs/filter_log.jsonl"
+
+
+def get_filter_log_path() -> Optional[str]:
+    """FILTER_LOG_PATH, None when logging is disabled (empty value)"""
+    return os.getenv("FILTER_LOG_PATH", DEFAULT_FILTER_LOG_PATH) or None
+
+
+class FilterLog:
+    """Thread-safe JSONL writer for generated filters"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def append(self, query: str, pinecone_filter: Dict[str, Any], backend: str) -> None:
+        record = {
+            "timestamp": datetime.now().isoformat(),
+            "query": query,
+            "filter": pinecone_filter,
+            "backend": backend,
+        }
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock, open(self.path, 'a', encoding='utf-8') as f:
+            f.write(line + "\n")
+
+
+def load_pairs(path: str) -> List[Dict[str, Any]]:
+    """Logged ``{"query", "output"}`` pairs, one per distinct query (the latest filter wins)"""
+    pairs: Dict[str, Dict[str, Any]] = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A crash mid-write can leave a partial last line
+                continue
+            pairs[" ".join(record["query"].lower().split())] = {"query": record["query"], "output": record["filter"]}
+    return list(pairs.values())
@@ -0,0 +1,294 @@
+"""
+Compact filter schema for constrained Gemini output and a tolerant filter parser.
+
+Gemini is asked for schema-constrained JSON with one-or-two-letter keys instead of
+full Pinecone filters, which roughly halves the output tokens:
+
+    {"a": "Jane Doe", "t": ["IPL 2025"], "dt": "last_year"}
+    → {"author": {"$eq": "Jane Doe"}, "tags": {"$in": ["IPL 2025"]}, "$date": "last_year"}
+
+``parse_filter`` accepts either format and repairs common generation slips locally
+(code fences, text around the object, single quotes, trailing commas, unquoted keys,
+Python literals, truncated closing brackets, bare field values) so that a sloppy
+response does not cost a second LLM call.
+"""
+
+import ast
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+# Compact key → (Pinecone field, operator); "dt" carries a symbolic temporal expression
+COMPACT_KEYS: Dict[str, Tuple[str, Any]] = {
+    "a": ("author", "$eq"),
+    "t": ("tags", "$in"),
+    "nt": ("tags", "$nin"),
+    "y": ("published_year", "$eq"),
+    "y0": ("published_year", "$gte"),
+    "y1": ("published_year", "$lte"),
+    "m": ("published_month", "$eq"),
+    "d": ("published_day", "$eq"),
+    "dt": ("$date", None),
+}
+
+COMPACT_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "a": {"type": "string", "description": "author"},
+        "t": {"type": "array", "items": {"type": "string"}, "description": "tags"},
+        "nt": {"type": "array", "items": {"type": "string"}, "description": "excluded tags"},
+        "y": {"type": "integer", "description": "published_year"},
+        "y0": {"type": "integer", "description": "first published_year"},
+        "y1": {"type": "integer", "description": "last published_year"},
+        "m": {"type": "integer", "description": "published_month"},
+        "d": {"type": "integer", "description": "published_day"},
+        "dt": {"type": "string", "description": "relative date expression"},
+    },
+}
+
+COMPACT_FORMAT_NOTE = (
+    "OUTPUT FORMAT: compact JSON with keys a=author, t=tags, nt=excluded tags, "
+    "y/m/d=published year/month/day, y0/y1=first/last published year, dt=$date expression. "
+    "Omit keys that do not apply."
+)
+
+LIST_OPERATORS = {"$in", "$nin"}
+# List metadata only supports membership operators
+LIST_FIELDS = {"tags": {"$eq": "$in", "$ne": "$nin"}}
+INTEGER_FIELDS = {"published_year", "published_month", "published_day"}
+OPERATORS = {"$eq", "$ne", "$gt", "$gte", "$lt", "$lte", "$in", "$nin", "$exists"}
+
+
+class FilterParseError(ValueError):
+    """Raised when a response cannot be turned into a filter, even after repair"""
+
+    def __init__(self, message: str, text: str):
+        super().__init__(message)
+        self.text = text
+
+
+def _is_empty(value: Any) -> bool:
+    return value is None or value == "" or value == [] or value == {}
+
+
+def expand_compact(compact: Dict[str, Any]) -> Dict[str, Any]:
+    """Pinecone filter of a compact filter"""
+    expanded: Dict[str, Any] = {}
+    for key, value in compact.items():
+        if _is_empty(value):
+            continue
+        field, operator = COMPACT_KEYS[key]
+        # Constrained decoding sometimes fills unused integer keys with 0
+        if field in INTEGER_FIELDS and value == 0:
+            continue
+        if operator is None:
+            expanded[field] = value
+        else:
+            expanded.setdefault(field, {})[operator] = value
+    return expanded
+
+
+def to_compact(pinecone_filter: Dict[str, Any]) -> Dict[str, Any]:
+    """Compact form of a filter; raises ValueError for filters the compact schema cannot express"""
+    keys = {target: key for key, target in COMPACT_KEYS.items()}
+    compact: Dict[str, Any] = {}
+    for field, condition in normalize_filter(pinecone_filter).items():
+        if field == "$date":
+            compact["dt"] = condition
+            continue
+        if not isinstance(condition, dict):
+            raise ValueError(f"Cannot express {field!r} in the compact schema")
+        for operator, operand in condition.items():
+            if (field, operator) not in keys:
+                raise ValueError(f"Cannot express {field} {operator} in the compact schema")
+            compact[keys[(field, operator)]] = operand
+    return compact
+
+
+def is_compact(candidate: Dict[str, Any]) -> bool:
+    return bool(candidate) and all(key in COMPACT_KEYS for key in candidate)
+
+
+def _normalize_operand(field: str, operator: str, operand: Any) -> Any:
+    if operator in LIST_OPERATORS and not isinstance(operand, list):
+        operand = [operand]
+    if field in INTEGER_FIELDS:
+        def as_int(value: Any) -> Any:
+            if isinstance(value, str) and value.strip().isdigit():
+                return int(value)
+            if isinstance(value, float) and value.is_integer():
+                return int(value)
+            return value
+        operand = [as_int(item) for item in operand] if isinstance(operand, list) else as_int(operand)
+    return operand
+
+
+def normalize_filter(pinecone_filter: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Canonical operator form: bare values become ``$eq`` (lists ``$in``), operators missing
+    their ``$`` get it back, scalar ``$in`` operands become lists, numeric strings in date
+    fields become integers, ``$eq``/``$ne`` on tags become ``$in``/``$nin`` and empty
+    conditions are dropped.
+    """
+    normalized: Dict[str, Any] = {}
+    for field, condition in pinecone_filter.items():
+        if field in ("$and", "$or"):
+            clauses = [normalize_filter(clause) for clause in condition if isinstance(clause, dict)]
+            clauses = [clause for clause in clauses if clause]
+            if clauses:
+                normalized[field] = clauses
+            continue
+        if field == "$date" or _is_empty(condition):
+            if not _is_empty(condition):
+                normalized[field] = condition
+            continue
+        if not isinstance(condition, dict):
+            condition = {"$in" if isinstance(condition, list) or field in LIST_FIELDS else "$eq": condition}
+        operators: Dict[str, Any] = {}
+        for operator, operand in condition.items():
+            if not operator.startswith("$") and f"${operator}" in OPERATORS:
+                operator = f"${operator}"
+            operator = LIST_FIELDS.get(field, {}).get(operator, operator)
+            if _is_empty(operand):
+                continue
+            operators[operator] = _normalize_operand(field, operator, operand)
+        if operators:
+            normalized[field] = operators
+    return normalized
+
+
+class JsonObjectScanner:
+    """
+    Incremental scanner for the first top-level {...} in streamed text. ``feed`` returns
+    the object text as soon as its closing brace arrives, so a streamed response can be
+    parsed (and the stream cancelled) without waiting for the model to stop.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.start: Optional[int] = None
+        self.end: Optional[int] = None
+        self.stack: List[str] = []
+        self.quote: Optional[str] = None
+        self._escaped = False
+        self._position = 0
+
+    def feed(self, chunk: str) -> Optional[str]:
+        """Add streamed text; returns the complete object text once it has closed"""
+        self.text += chunk
+        if self.end is not None:
+            return self.text[self.start:self.end]
+        while self._position < len(self.text):
+            char = self.text[self._position]
+            self._position += 1
+            if self.start is None:
+                if char == "{":
+                    self.start = self._position - 1
+                    self.stack.append("}")
+            elif self.quote:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == self.quote:
+                    self.quote = None
+            elif char in "\"'":
+                self.quote = char
+            elif char in "{[":
+                self.stack.append("}" if char == "{" else "]")
+            elif char in "}]":
+                if self.stack and self.stack[-1] == char:
+                    self.stack.pop()
+                if not self.stack:
+                    self.end = self._position
+                    return self.text[self.start:self.end]
+        return None
+
+
+def _extract_object(text: str) -> Tuple[str, List[str]]:
+    """First balanced {...} in a response, closing brackets a truncated response left open"""
+    repairs: List[str] = []
+    fenced = re.search(r"```(?:json)?\s*(.*?)```", text, re.DOTALL)
+    if fenced:
+        text = fenced.group(1)
+        repairs.append("code_fence")
+    scanner = JsonObjectScanner()
+    candidate = scanner.feed(text)
+    if scanner.start is None:
+        raise FilterParseError("No JSON object in response", text)
+    if text[:scanner.start].strip():
+        repairs.append("leading_text")
+    if candidate is not None:
+        if text[scanner.end:].strip():
+            repairs.append("trailing_text")
+        return candidate, repairs
+    # Truncated: close whatever is still open
+    repairs.append("unclosed_brackets")
+    body = text[scanner.start:].rstrip().rstrip(",")
+    if scanner.quote:
+        body += scanner.quote
+    return body + "".join(reversed(scanner.stack)), repairs
+
+
+def _to_json_syntax(candidate: str) -> str:
+    """Rewrite single-quoted strings, Python literals, unquoted keys and trailing commas as JSON"""
+    out: List[str] = []
+    position = 0
+    while position < len(candidate):
+        char = candidate[position]
+        if char in "\"'":
+            end = position + 1
+            while end < len(candidate) and candidate[end] != char:
+                end += 2 if candidate[end] == "\\" else 1
+            content = candidate[position + 1:end]
+            if char == "'":
+                content = content.replace("\\'", "'")
+                out.append(json.dumps(content))
+            else:
+                out.append(f'"{content}"')
+            position = end + 1
+            continue
+        word = re.match(r"[A-Za-z_$][\w$]*", candidate[position:])
+        if word:
+            token = word.group(0)
+            following = candidate[position + len(token):].lstrip()
+            if following.startswith(":"):
+                out.append(json.dumps(token))
+            else:
+                out.append({"True": "true", "False": "false", "None": "null"}.get(token, token))
+            position += len(token)
+            continue
+        out.append(char)
+        position += 1
+    return re.sub(r",\s*([}\]])", r"\1", "".join(out))
+
+
+def parse_filter_with_repairs(text: str) -> Tuple[Dict[str, Any], List[str]]:
+    """Filter in a Gemini response (full or compact format) and the repairs that were needed"""
+    candidate, repairs = _extract_object(text.strip())
+    try:
+        parsed = json.loads(candidate)
+    except json.JSONDecodeError:
+        try:
+            parsed = json.loads(_to_json_syntax(candidate))
+            repairs.append("json_syntax")
+        except json.JSONDecodeError:
+            try:
+                parsed = ast.literal_eval(candidate)
+                repairs.append("python_literal")
+            except (ValueError, SyntaxError) as e:
+                raise FilterParseError(f"Unparseable filter: {e}", text)
+    if not isinstance(parsed, dict):
+        raise FilterParseError("Response is not a JSON object", text)
+
+    if is_compact(parsed):
+        parsed = expand_compact(parsed)
+    normalized = normalize_filter(parsed)
+    if normalized != parsed:
+        repairs.append("normalized")
+    return normalized, repairs
+
+
+def parse_filter(text: str) -> Dict[str, Any]:
+    """Filter in a Gemini response (full or compact format), repaired where needed"""
+    return parse_filter_with_repairs(text)[0]
@@ -0,0 +1,495 @@
+"""
+Gazetteer of the authors and tags that actually exist in the index.
+
+The vocabulary is a JSON snapshot (``VOCABULARY_PATH``) written at ingestion time:
+every populate/sync run adds the authors and normalized tags of the documents it
+upserts, and ``python gazetteer.py rebuild`` rescans the whole index. A sidecar
+(``<vocabulary>.documents.json``) keeps what each document was counted under, so
+re-ingesting a document replaces its counts and deleting it subtracts them.
+
+Matching works on normalized tokens (lowercase, camelCase and letter/digit runs
+split), so "IPL2025", "ipl 2025" and "IPL-2025" all read as ``ipl 2025``:
+
+- ``match`` finds every known entity in a query in one pass of an Aho-Corasick
+  automaton over the query tokens (leftmost-longest, non-overlapping)
+- ``snap`` maps an LLM-produced author or tag to the index value with the same
+  normalized form, or failing that to the closest one by trigram similarity
+  (with a lower bar for entities the query itself mentions). Fuzzy snaps never
+  change a number: "IPL 2026" does not become "IPL 2025", it stays unknown
+
+The document counts per author, tag and year double as selectivity statistics for
+relaxation.py, which estimates how many documents a filter can match. A chunked
+document has one vector per chunk but is counted once, as search results are.
+
+Examples:
+    python gazetteer.py rebuild
+    python gazetteer.py info
+    python gazetteer.py match "Rohit Sharma's form in IPL2025"
+"""
+import argparse
+import json
+import os
+import re
+import threading
+from collections import Counter, deque
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from chunking import parse_chunk_id
+
+DEFAULT_VOCABULARY_PATH = "snapshots/vocabulary.json"
+KINDS = {"author": "author", "tags": "tag"}  # Filter field → entity kind
+FUZZY_THRESHOLD = 0.75  # Dice similarity of trigram sets for a global fuzzy snap
+QUERY_FUZZY_THRESHOLD = 0.5  # Lower bar for entities the query itself mentions
+MIN_FUZZY_LENGTH = 4  # Shorter values ("AI", "MI") are only snapped exactly
+
+# Ingestion pipelines update the vocabulary from several threads
+_update_lock = threading.Lock()
+
+TOKEN_PATTERN = re.compile(r"[A-Z]?[a-z]+|[A-Z]+(?![a-z])|\d+|[^\W\d_A-Za-z]+")
+
+
+def get_vocabulary_path() -> Optional[str]:
+    """VOCABULARY_PATH, None when the gazetteer is disabled (empty value)"""
+    return os.getenv("VOCABULARY_PATH", DEFAULT_VOCABULARY_PATH) or None
+
+
+def normalized_tokens(text: str) -> List[Tuple[str, int, int]]:
+    """Lowercase tokens with their character spans; "RohitSharma" → rohit, sharma"""
+    return [(match.group(0).lower(), match.start(), match.end()) for match in TOKEN_PATTERN.finditer(text)]
+
+
+def normalize_key(text: str) -> str:
+    return " ".join(token for token, _, _ in normalized_tokens(text))
+
+
+def _numbers(key: str) -> List[str]:
+    """Numeric tokens of a normalized key ("ipl 2025" → ["2025"])"""
+    return [token for token in key.split() if token.isdigit()]
+
+
+def _trigrams(key: str) -> set:
+    padded = f" {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class EntityMatcher:
+    """Aho-Corasick automaton over token sequences"""
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[Tuple[int, int]]] = [[]]  # (pattern length, entity id)
+
+    def add(self, tokens: Sequence[str], entity_id: int) -> None:
+        node = 0
+        for token in tokens:
+            if token not in self._goto[node]:
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+                self._goto[node][token] = len(self._goto) - 1
+            node = self._goto[node][token]
+        self._output[node].append((len(tokens), entity_id))
+
+    def build(self) -> None:
+        """Compute failure links (breadth first) once every pattern is added"""
+        queue = deque(self._goto[0].values())  # Children of the root fail to the root
+        while queue:
+            node = queue.popleft()
+            for token, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and token not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(token, 0)
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    def find(self, tokens: Sequence[str]) -> List[Tuple[int, int, int]]:
+        """Every (start, end, entity id) occurrence, end exclusive, in token positions"""
+        found = []
+        node = 0
+        for position, token in enumerate(tokens):
+            while node and token not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(token, 0)
+            for length, entity_id in self._output[node]:
+                found.append((position + 1 - length, position + 1, entity_id))
+        return found
+
+
+class Gazetteer:
+    """Known authors and tags with exact, multi-pattern and fuzzy lookup"""
+
+    def __init__(
+        self,
+        authors: Dict[str, int],
+        tags: Dict[str, int],
+        documents: int = 0,
+        years: Optional[Dict[str, int]] = None,
+    ):
+        self.documents = documents
+        self.years = {int(year): count for year, count in (years or {}).items()}
+        self.entities: List[Tuple[str, str, int]] = []  # (kind, value, documents)
+        self._by_key: Dict[Tuple[str, str], int] = {}
+        self._trigrams: Dict[str, Dict[str, List[int]]] = {"author": {}, "tag": {}}
+        self._gram_sets: List[set] = []
+        self._numbers: List[List[str]] = []
+        self._matcher = EntityMatcher()
+        # Most frequent first, so the common spelling wins when two values normalize alike
+        values = [("author", value, count) for value, count in authors.items()]
+        values += [("tag", value, count) for value, count in tags.items()]
+        for kind, value, count in sorted(values, key=lambda entry: -entry[2]):
+            key = normalize_key(value)
+            if not key or (kind, key) in self._by_key:
+                continue
+            entity_id = len(self.entities)
+            self.entities.append((kind, value, count))
+            self._by_key[(kind, key)] = entity_id
+            self._matcher.add(key.split(), entity_id)
+            self._gram_sets.append(_trigrams(key))
+            self._numbers.append(_numbers(key))
+            for trigram in self._gram_sets[-1]:
+                self._trigrams[kind].setdefault(trigram, []).append(entity_id)
+        self._matcher.build()
+
+    def __len__(self) -> int:
+        return len(self.entities)
+
+    def count(self, kind: str, value: str) -> Optional[int]:
+        """Documents with an author/tag (counted under its normalized form), None for unknown values"""
+        entity_id = self._by_key.get((kind, normalize_key(value)))
+        return self.entities[entity_id][2] if entity_id is not None else None
+
+    def contained(self, kind: str, value: str) -> List[str]:
+        """Known values of a kind found inside a value ("IPL 2025" → "IPL"), excluding the value itself"""
+        key = normalize_key(value)
+        found = []
+        for _, _, entity_id in self._matcher.find(key.split()):
+            entity_kind, entity_value, _ = self.entities[entity_id]
+            if entity_kind == kind and normalize_key(entity_value) != key and entity_value not in found:
+                found.append(entity_value)
+        return found
+
+    def match(self, query: str) -> List[Dict[str, Any]]:
+        """Known entities mentioned in a query, leftmost-longest and non-overlapping"""
+        tokens = normalized_tokens(query)
+        occurrences = self._matcher.find([token for token, _, _ in tokens])
+        occurrences.sort(key=lambda occurrence: (occurrence[0], -(occurrence[1] - occurrence[0])))
+        matches = []
+        covered_until = 0
+        last_span = None
+        for start, end, entity_id in occurrences:
+            kind, value, _ = self.entities[entity_id]
+            if (start, end) == last_span:
+                # The same words can be both an author and a tag
+                matches.append({**matches[-1], "kind": kind, "value": value})
+                continue
+            if start < covered_until:
+                continue
+            matches.append({
+                "kind": kind,
+                "value": value,
+                "text": query[tokens[start][1]:tokens[end - 1][2]],
+                "start": tokens[start][1],
+                "end": tokens[end - 1][2],
+            })
+            covered_until, last_span = end, (start, end)
+        return matches
+
+    def _fuzzy(self, kind: str, key: str, threshold: float, candidates: Optional[Iterable[int]] = None) -> Optional[int]:
+        grams = _trigrams(key)
+        if candidates is None:
+            shared = Counter(entity_id for gram in grams for entity_id in self._trigrams[kind].get(gram, ()))
+        else:
+            shared = Counter({
+                entity_id: len(grams & self._gram_sets[entity_id])
+                for entity_id in candidates if self.entities[entity_id][0] == kind
+            })
+        numbers = _numbers(key)
+        best, best_score = None, threshold
+        for entity_id, common in shared.items():
+            # Years and versions are what the user asked for, never a typo to correct
+            if self._numbers[entity_id] != numbers:
+                continue
+            score = 2 * common / (len(grams) + len(self._gram_sets[entity_id]))
+            if score > best_score:
+                best, best_score = entity_id, score
+        return best
+
+    def snap(self, kind: str, value: str, query_matches: Sequence[Dict[str, Any]] = ()) -> Tuple[Optional[str], str]:
+        """Index value for an author/tag and how it was found: "exact", "fuzzy" or "unknown" (None)"""
+        key = normalize_key(value)
+        entity_id = self._by_key.get((kind, key))
+        if entity_id is not None:
+            return self.entities[entity_id][1], "exact"
+        if len(key) >= MIN_FUZZY_LENGTH:
+            entity_id = self._fuzzy(kind, key, FUZZY_THRESHOLD)
+            if entity_id is None:
+                mentioned = [self._by_key[(match["kind"], normalize_key(match["value"]))]
+                             for match in query_matches if match["kind"] == kind]
+                entity_id = self._fuzzy(kind, key, QUERY_FUZZY_THRESHOLD, mentioned) if mentioned else None
+            if entity_id is not None:
+                return self.entities[entity_id][1], "fuzzy"
+        return None, "unknown"
+
+    def snap_filter(self, pinecone_filter: Dict[str, Any], query: str = "") -> Tuple[Dict[str, Any], Counter]:
+        """
+        Filter with its authors and tags replaced by index values, and counts of exact,
+        fuzzy and unknown values. Unknown values are kept: the vocabulary may be older
+        than the index.
+        """
+        query_matches = self.match(query) if query else []
+        outcomes: Counter = Counter()
+
+        def snap_operand(kind: str, operand: Any) -> Any:
+            if isinstance(operand, list):
+                return list(dict.fromkeys(snap_operand(kind, item) for item in operand))
+            if not isinstance(operand, str):
+                return operand
+            snapped, outcome = self.snap(kind, operand, query_matches)
+            outcomes[outcome] += 1
+            return snapped if snapped is not None else operand
+
+        def snap_clause(clause: Dict[str, Any]) -> Dict[str, Any]:
+            snapped_clause: Dict[str, Any] = {}
+            for field, condition in clause.items():
+                if field in ("$and", "$or") and isinstance(condition, list):
+                    snapped_clause[field] = [snap_clause(item) if isinstance(item, dict) else item for item in condition]
+                elif field in KINDS and isinstance(condition, dict):
+                    snapped_clause[field] = {
+                        operator: snap_operand(KINDS[field], operand) if operator in ("$eq", "$ne", "$in", "$nin") else operand
+                        for operator, operand in condition.items()
+                    }
+                elif field in KINDS:
+                    snapped_clause[field] = snap_operand(KINDS[field], condition)
+                else:
+                    snapped_clause[field] = condition
+            return snapped_clause
+
+        return snap_clause(pinecone_filter), outcomes
+
+    @classmethod
+    def load(cls, path: str) -> "Gazetteer":
+        vocabulary = load_vocabulary(path)
+        return cls(vocabulary["authors"], vocabulary["tags"], vocabulary["documents"], vocabulary["years"])
+
+
+def documents_path(path: str) -> str:
+    """Sidecar with the author, tags and year each document is counted under"""
+    return os.path.splitext(path)[0] + ".documents.json"
+
+
+def load_vocabulary(path: str) -> Dict[str, Any]:
+    with open(path, 'r', encoding='utf-8') as f:
+        vocabulary = json.load(f)
+    vocabulary.setdefault("authors", {})
+    vocabulary.setdefault("tags", {})
+    # Vocabularies written before documents were counted hold chunk counts; ``rebuild`` replaces them
+    vocabulary.pop("records", None)
+    vocabulary.setdefault("documents", 0)
+    vocabulary.setdefault("years", {})
+    return vocabulary
+
+
+def load_documents(path: str) -> Dict[str, Dict[str, Any]]:
+    """Counted documents of a vocabulary, empty when it has no sidecar yet"""
+    try:
+        with open(documents_path(path), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _write_json(data: Any, path: str, indent: Optional[int] = 2) -> None:
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temporary = path + ".tmp"
+    with open(temporary, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=indent, sort_keys=True)
+    os.replace(temporary, path)
+
+
+def save_vocabulary(vocabulary: Dict[str, Any], path: str, documents: Optional[Dict[str, Dict[str, Any]]] = None) -> None:
+    """Write the vocabulary and, when given, its counted documents (the sidecar first)"""
+    if documents is not None:
+        _write_json(documents, documents_path(path), indent=None)
+    vocabulary["updated_at"] = datetime.now().isoformat()
+    _write_json(vocabulary, path)
+
+
+def _document_entry(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """The author, tags and year a document is counted under"""
+    year = metadata.get("published_year")
+    author = metadata.get("author")
+    return {
+        # JSON object keys are strings
+        "year": str(int(year)) if isinstance(year, (int, float)) and not isinstance(year, bool) else None,
+        "author": author.strip() if isinstance(author, str) and author.strip() else None,
+        "tags": list(dict.fromkeys(tag.strip() for tag in metadata.get("tags") or [] if isinstance(tag, str) and tag.strip())),
+    }
+
+
+def _count(vocabulary: Dict[str, Any], entry: Dict[str, Any], delta: int) -> None:
+    """Add (delta 1) or subtract (delta -1) one document's entry; values counted down to zero are dropped"""
+    vocabulary["documents"] += delta
+    for field, key in (("years", entry["year"]), ("authors", entry["author"])) + tuple(("tags", tag) for tag in entry["tags"]):
+        if key is None:
+            continue
+        count = vocabulary[field].get(key, 0) + delta
+        if count > 0:
+            vocabulary[field][key] = count
+        else:
+            vocabulary[field].pop(key, None)
+
+
+def add_records(
+    vocabulary: Dict[str, Any],
+    documents: Dict[str, Dict[str, Any]],
+    records: Iterable[Tuple[str, Dict[str, Any]]],
+) -> None:
+    """
+    Count the documents, authors, tags and years of (id, metadata) records into a
+    vocabulary. Every chunk of a document carries the same metadata, so only its
+    first chunk (or its single vector) is counted; a document already in
+    ``documents`` has its previous counts replaced.
+    """
+    for vector_id, metadata in records:
+        doc_id, chunk_index = parse_chunk_id(vector_id)
+        if chunk_index not in (None, 0):
+            continue
+        if doc_id in documents:
+            _count(vocabulary, documents[doc_id], -1)
+        documents[doc_id] = _document_entry(metadata)
+        _count(vocabulary, documents[doc_id], 1)
+
+
+def remove_records(vocabulary: Dict[str, Any], documents: Dict[str, Dict[str, Any]], removed_ids: Iterable[str]) -> None:
+    """
+    Subtract the counts of removed documents. As in ``add_records`` a document goes
+    with its first chunk: trimming surplus chunks off a changed document keeps it.
+    """
+    for vector_id in removed_ids:
+        doc_id, chunk_index = parse_chunk_id(vector_id)
+        if chunk_index in (None, 0) and doc_id in documents:
+            _count(vocabulary, documents.pop(doc_id), -1)
+
+
+def update_vocabulary(
+    records: Sequence[Tuple[str, Any, Dict[str, Any]]],
+    removed_ids: Iterable[str] = (),
+    path: Optional[str] = None,
+) -> None:
+    """
+    Apply ingestion changes to the vocabulary snapshot: drop the counts of removed
+    documents, then count upserted ones, replacing what a re-ingested document was
+    counted under before.
+    """
+    path = path or get_vocabulary_path()
+    removed_ids = list(removed_ids)
+    if not path or not (records or removed_ids):
+        return
+    with _update_lock:
+        vocabulary = load_vocabulary(path) if os.path.exists(path) else {"authors": {}, "tags": {}, "documents": 0, "years": {}}
+        documents = load_documents(path)
+        before = len(vocabulary["authors"]) + len(vocabulary["tags"])
+        remove_records(vocabulary, documents, removed_ids)
+        add_records(vocabulary, documents, ((vector_id, metadata) for vector_id, _, metadata in records))
+        save_vocabulary(vocabulary, path, documents)
+    change = len(vocabulary["authors"]) + len(vocabulary["tags"]) - before
+    print(f"📖 Vocabulary updated: {change:+d} values "
+          f"({vocabulary['documents']} documents, {len(vocabulary['authors'])} authors, {len(vocabulary['tags'])} tags)")
+
+
+def rebuild(index, path: str, max_workers: int = 8) -> Dict[str, Any]:
+    """Vocabulary of every record in the index"""
+    from concurrent.futures import ThreadPoolExecutor
+    from delete_records import FETCH_BATCH_SIZE, list_ids
+    from snapshot_tool import fetch_records
+
+    vocabulary: Dict[str, Any] = {"authors": {}, "tags": {}, "documents": 0, "years": {}}
+    documents: Dict[str, Dict[str, Any]] = {}
+    ids = list_ids(index)
+    print(f"📋 Scanning {len(ids)} records for authors and tags...")
+    batches = [ids[start:start + FETCH_BATCH_SIZE] for start in range(0, len(ids), FETCH_BATCH_SIZE)]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for batch_ids, _, metadatas in executor.map(lambda batch: fetch_records(index, batch), batches):
+            add_records(vocabulary, documents, zip(batch_ids, metadatas))
+    save_vocabulary(vocabulary, path, documents)
+    return vocabulary
+
+
+class GazetteerCache:
+    """Holds the gazetteer used by the agent, reloads it when the vocabulary file changes and counts snaps"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.gazetteer: Optional[Gazetteer] = None
+        self.loaded_mtime: Optional[float] = None
+        self.outcomes: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def get(self) -> Optional[Gazetteer]:
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return self.gazetteer
+        if mtime != self.loaded_mtime:
+            try:
+                self.gazetteer = Gazetteer.load(self.path)
+                self.loaded_mtime = mtime
+                print(f"📖 Loaded gazetteer: {len(self.gazetteer)} authors and tags")
+            except Exception as e:
+                # Keep the previous vocabulary if a rewrite is in progress
+                print(f"⚠️  Could not load vocabulary from {self.path}: {e}")
+        return self.gazetteer
+
+    def snap_filter(self, pinecone_filter: Dict[str, Any], query: str = "") -> Dict[str, Any]:
+        """Snapped filter, or the filter unchanged while there is no vocabulary"""
+        gazetteer = self.get()
+        if gazetteer is None:
+            return pinecone_filter
+        snapped, outcomes = gazetteer.snap_filter(pinecone_filter, query)
+        with self._lock:
+            self.outcomes.update(outcomes)
+        return snapped
+
+    def stats(self) -> Dict[str, Any]:
+        gazetteer = self.gazetteer
+        with self._lock:
+            outcomes = dict(self.outcomes)
+        return {
+            "path": self.path,
+            "loaded": gazetteer is not None,
+            "authors": sum(kind == "author" for kind, _, _ in gazetteer.entities) if gazetteer else 0,
+            "tags": sum(kind == "tag" for kind, _, _ in gazetteer.entities) if gazetteer else 0,
+            "snapped": {outcome: outcomes.get(outcome, 0) for outcome in ("exact", "fuzzy", "unknown")},
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the vocabulary of known authors and tags")
+    parser.add_argument("command", choices=["rebuild", "info", "match"])
+    parser.add_argument("query", nargs="?", help="Query to match (match)")
+    parser.add_argument("--path", default=get_vocabulary_path() or DEFAULT_VOCABULARY_PATH, help="Vocabulary file")
+    args = parser.parse_args()
+
+    if args.command == "rebuild":
+        from delete_records import get_index
+
+        vocabulary = rebuild(get_index(), args.path)
+        print(f"📖 Vocabulary rebuilt: {len(vocabulary['authors'])} authors, {len(vocabulary['tags'])} tags")
+    elif args.command == "info":
+        vocabulary = load_vocabulary(args.path)
+        print(f"📖 Vocabulary {args.path}: {vocabulary['documents']} documents, "
+              f"{len(vocabulary['authors'])} authors, {len(vocabulary['tags'])} tags, "
+              f"updated {vocabulary.get('updated_at', 'unknown')}")
+    else:
+        if not args.query:
+            parser.error("match needs a query")
+        print(json.dumps(Gazetteer.load(args.path).match(args.query), indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""
+Offline, deterministic synthetic corpus generator for load tests.
+
+Builds on the sample model of populate_pinecone_db.py (its authors, tags and
+random_date range) but needs no network access: authors and tags are drawn from
+Zipfian distributions over extended pools, dates are uniform over the same range,
+content is templated, and vectors are synthetic unit vectors clustered around
+per-tag and per-author centroids so that similarity search behaves realistically.
+
+The same seed always produces the same corpus. Output goes to a binary snapshot
+(see snapshot.py) or straight into the configured Pinecone index.
+
+Examples:
+    python generate_synthetic_corpus.py --count 1000000 --output snapshot --path snapshots/synthetic-1m
+    python generate_synthetic_corpus.py --count 50000 --output pinecone
+"""
+import argparse
+import os
+import time
+from datetime import date
+from typing import Any, Dict, Iterator, List, Tuple
+
+import numpy as np
+
+from populate_pinecone_db import authors as BASE_AUTHORS, tags as BASE_TAGS
+from snapshot import SnapshotWriter
+
+DEFAULT_DIMENSION = 768
+START_YEAR, END_YEAR = 2022, 2025  # Same range as populate_pinecone_db.random_date
+
+FIRST_NAMES = [
+    "Aarav", "Chloe", "Diego", "Fatima", "Hiro", "Ines", "Jonas", "Kavya", "Lucas", "Mei",
+    "Nadia", "Omar", "Sofia", "Tariq", "Uma", "Viktor", "Yara", "Zoe", "Rahul", "Elena",
+]
+LAST_NAMES = [
+    "Sharma", "Nguyen", "Okafor", "Rossi", "Tanaka", "Silva", "Muller", "Haddad", "Kowalski", "Chen",
+    "Fischer", "Iyer", "Dubois", "Larsen", "Moreno", "Novak", "Park", "Reyes", "Singh", "Walker",
+]
+TOPIC_WORDS = [
+    "cricket", "IPL", "football", "tennis", "Olympics", "elections", "economy", "startups",
+    "climate", "health", "cloud computing", "robotics", "quantum computing", "cybersecurity",
+    "space", "energy", "education", "film", "music", "travel",
+]
+TEMPLATES = [
+    "{author} examines {topics}, looking at what changed in {month_name} {year} and what comes next.",
+    "In this {year} piece, {author} covers {topics} with interviews, data and analysis.",
+    "A practical guide to {topics} by {author}, published {month_name} {day}, {year}.",
+    "{author} reports on the latest developments in {topics} and their wider impact.",
+]
+MONTH_NAMES = [
+    "January", "February", "March", "April", "May", "June",
+    "July", "August", "September", "October", "November", "December",
+]
+
+
+def build_pool(base: List[str], size: int, extra: List[str]) -> List[str]:
+    """Extend a base pool with deterministic extra values; base values take the top ranks"""
+    pool = list(dict.fromkeys(base))
+    for value in extra:
+        if len(pool) >= size:
+            break
+        if value not in pool:
+            pool.append(value)
+    return pool[:size]
+
+
+def zipf_weights(size: int, exponent: float) -> np.ndarray:
+    """Normalized Zipf weights 1 / rank**exponent"""
+    weights = 1.0 / np.arange(1, size + 1) ** exponent
+    return weights / weights.sum()
+
+
+def random_dates(rng: np.random.Generator, count: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Vectorized equivalent of populate_pinecone_db.random_date: uniform days in the range"""
+    start = date(START_YEAR, 1, 1)
+    days = (date(END_YEAR, 12, 31) - start).days
+    offsets = rng.integers(0, days + 1, size=count)
+    dates = np.datetime64(start) + offsets.astype('timedelta64[D]')
+    years = dates.astype('datetime64[Y]').astype(int) + 1970
+    months = dates.astype('datetime64[M]').astype(int) % 12 + 1
+    day_numbers = (dates - dates.astype('datetime64[M]')).astype(int) + 1
+    return years, months, day_numbers
+
+
+class SyntheticCorpus:
+    """
+    Deterministic generator of (ids, vectors, metadatas) batches.
+
+    Args:
+        seed: Random seed; the same seed yields the same corpus
+        dimension: Vector dimension
+        num_authors / num_tags: Pool sizes (the sample authors/tags come first)
+        author_exponent / tag_exponent: Zipf exponents of the author and tag distributions
+        max_tags: Maximum number of tags per document
+    """
+
+    def __init__(
+        self,
+        seed: int = 42,
+        dimension: int = DEFAULT_DIMENSION,
+        num_authors: int = 200,
+        num_tags: int = 500,
+        author_exponent: float = 1.1,
+        tag_exponent: float = 1.0,
+        max_tags: int = 3,
+        noise: float = 0.6,
+    ):
+        self.seed = seed
+        self.dimension = dimension
+        self.max_tags = max_tags
+        self.noise = noise
+        self.authors = build_pool(
+            BASE_AUTHORS, num_authors, [f"{f} {l}" for l in LAST_NAMES for f in FIRST_NAMES]
+        )
+        self.tags = build_pool(
+            BASE_TAGS, num_tags,
+            TOPIC_WORDS + [f"{a} {b}" for a in TOPIC_WORDS for b in TOPIC_WORDS if a != b]
+        )
+        self.author_weights = zipf_weights(len(self.authors), author_exponent)
+        self.tag_weights = zipf_weights(len(self.tags), tag_exponent)
+
+        centroid_rng = np.random.default_rng(seed + 1)
+        self.tag_centroids = self._unit(centroid_rng.standard_normal((len(self.tags), dimension)))
+        self.author_centroids = self._unit(centroid_rng.standard_normal((len(self.authors), dimension)))
+
+    @staticmethod
+    def _unit(vectors: np.ndarray) -> np.ndarray:
+        return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+    def batches(self, count: int, batch_size: int = 10000) -> Iterator[Tuple[List[str], np.ndarray, List[Dict[str, Any]]]]:
+        """Yield the corpus in batches; the same seed and batch size always yield the same output"""
+        for start in range(0, count, batch_size):
+            size = min(batch_size, count - start)
+            # Seed per batch so any batch can be regenerated independently
+            rng = np.random.default_rng([self.seed, start])
+            author_codes = rng.choice(len(self.authors), size=size, p=self.author_weights)
+            tag_counts = rng.integers(1, self.max_tags + 1, size=size)
+            tag_codes = rng.choice(len(self.tags), size=(size, self.max_tags), p=self.tag_weights)
+            years, months, days = random_dates(rng, size)
+            templates = rng.integers(0, len(TEMPLATES), size=size)
+
+            # Vector = tag centroids + author centroid + noise, normalized
+            mask = np.arange(self.max_tags)[None, :] < tag_counts[:, None]
+            vectors = (self.tag_centroids[tag_codes] * mask[:, :, None]).sum(axis=1)
+            vectors += 0.3 * self.author_centroids[author_codes]
+            noise = rng.standard_normal((size, self.dimension)).astype(np.float32) / np.sqrt(self.dimension)
+            vectors += self.noise * noise
+            vectors = self._unit(vectors)
+
+            ids = [f"synthetic-{start + i}" for i in range(size)]
+            metadatas = []
+            for i in range(size):
+                doc_tags = list(dict.fromkeys(self.tags[c] for c in tag_codes[i, :tag_counts[i]]))
+                author = self.authors[author_codes[i]]
+                year, month, day = int(years[i]), int(months[i]), int(days[i])
+                metadatas.append({
+                    "author": author,
+                    "tags": doc_tags,
+                    "published_year": year,
+                    "published_month": month,
+                    "published_day": day,
+                    "content": TEMPLATES[templates[i]].format(
+                        author=author, topics=", ".join(doc_tags),
+                        year=year, month_name=MONTH_NAMES[month - 1], day=day,
+                    ),
+                })
+            yield ids, vectors, metadatas
+
+
+def write_snapshot(corpus: SyntheticCorpus, count: int, path: str, batch_size: int) -> None:
+    with SnapshotWriter(path, corpus.dimension) as writer:
+        for ids, vectors, metadatas in corpus.batches(count, batch_size):
+            writer.append(ids, vectors, metadatas)
+            print(f"✅ Wrote {writer.count}/{count} documents")
+
+
+def write_pinecone(corpus: SyntheticCorpus, count: int, batch_size: int) -> None:
+    from delete_records import get_index
+    from upsert_engine import UpsertEngine
+
+    engine = UpsertEngine(get_index(), max_workers=int(os.getenv("UPSERT_WORKERS", 4)), verbose=False)
+    records = (
+        (vector_id, vector, metadata)
+        for ids, vectors, metadatas in corpus.batches(count, batch_size)
+        for vector_id, vector, metadata in zip(ids, vectors, metadatas)
+    )
+    stats = engine.upsert(records)
+    print(f"📈 Upsert throughput: {stats.summary()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a deterministic synthetic corpus for load tests")
+    parser.add_argument("--count", type=int, default=100000, help="Number of documents")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    parser.add_argument("--dimension", type=int, default=int(os.getenv("EMBED_DIMENSION") or DEFAULT_DIMENSION),
+                        help="Vector dimension")
+    parser.add_argument("--authors", type=int, default=200, help="Number of distinct authors")
+    parser.add_argument("--tags", type=int, default=500, help="Number of distinct tags")
+    parser.add_argument("--output", choices=["snapshot", "pinecone"], default="snapshot", help="Where to write")
+    parser.add_argument("--path", default="snapshots/synthetic", help="Snapshot directory")
+    parser.add_argument("--batch-size", type=int, default=10000, help="Documents generated per batch")
+    args = parser.parse_args()
+
+    corpus = SyntheticCorpus(
+        seed=args.seed, dimension=args.dimension, num_authors=args.authors, num_tags=args.tags
+    )
+    print(f"🧪 Generating {args.count} synthetic documents (seed {args.seed}, dimension {args.dimension}, "
+          f"{len(corpus.authors)} authors, {len(corpus.tags)} tags) -> {args.output}")
+
+    start = time.perf_counter()
+    if args.output == "snapshot":
+        write_snapshot(corpus, args.count, args.path, args.batch_size)
+    else:
+        write_pinecone(corpus, args.count, args.batch_size)
+    elapsed = time.perf_counter() - start
+    print(f"🎉 Generated {args.count} documents in {elapsed:.1f}s ({args.count / elapsed:.0f} docs/s)")
+
+
+if __name__ == "__main__":
+    main()
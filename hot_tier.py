@@ -0,0 +1,443 @@
+"""
+Local hot tier for recent articles, with Pinecone as the cold tier.
+
+Holds the vectors and metadata of every chunk published within the last
+``HOT_TIER_DAYS`` days in memory, indexed with a NumPy IVF (inverted file) index:
+vectors are clustered with spherical k-means and a query only scores the clusters
+whose centroids are nearest to it. Metadata filters are evaluated locally as NumPy
+masks over columns of the metadata (metadata_filter.MetadataColumns).
+
+A query is answered locally only when its date filter guarantees that every
+matching article lies inside the window the tier is complete for; everything else
+falls through to Pinecone. The tier is persisted as a snapshot (see snapshot.py)
+under ``HOT_TIER_PATH``: ``python hot_tier.py rebuild`` seeds it from the index,
+ingestion keeps it updated and ages old documents out, and the API reloads it when
+the files change.
+
+Examples:
+    python hot_tier.py rebuild --days 30
+    python hot_tier.py age
+    python hot_tier.py info
+"""
+import argparse
+import json
+import os
+import shutil
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from gazetteer import update_vocabulary
+from metadata_filter import MetadataColumns
+from snapshot import SnapshotReader, SnapshotWriter
+from vector_types import VECTOR_DTYPE, VectorLike, normalize, to_matrix, to_vector
+
+DEFAULT_WINDOW_DAYS = 30
+DEFAULT_HOT_TIER_PATH = "snapshots/hot"
+STATE_FILE = "hot_tier.json"
+IVF_MIN_VECTORS = 4096  # Below this an exact scan is faster than probing clusters
+DATE_FIELDS = ("published_year", "published_month", "published_day")
+
+
+def get_hot_tier_path() -> str:
+    return os.getenv("HOT_TIER_PATH", DEFAULT_HOT_TIER_PATH)
+
+
+def get_window_days() -> int:
+    return int(os.getenv("HOT_TIER_DAYS") or DEFAULT_WINDOW_DAYS)
+
+
+def metadata_date(metadata: Dict[str, Any]) -> Optional[date]:
+    """Publication date of a record, None if it has no complete date"""
+    try:
+        return date(*(int(metadata[field]) for field in DATE_FIELDS))
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def _lower_bound(condition: Any) -> Optional[int]:
+    """Smallest value a numeric field condition admits, None if it has no lower bound"""
+    if not isinstance(condition, dict):
+        return int(condition) if isinstance(condition, (int, float)) else None
+    bounds = []
+    for operator, operand in condition.items():
+        if operator == "$eq":
+            bounds.append(int(operand))
+        elif operator == "$gte":
+            bounds.append(int(operand))
+        elif operator == "$gt":
+            bounds.append(int(operand) + 1)
+        elif operator == "$in" and operand:
+            bounds.append(int(min(operand)))
+    return max(bounds) if bounds else None
+
+
+def earliest_filter_date(pinecone_filter: Dict[str, Any]) -> Optional[date]:
+    """
+    Earliest publication date any record matching the filter can have, or None
+    when the filter does not bound dates from below.
+    """
+    if not pinecone_filter:
+        return None
+    bounds: List[date] = []
+    fields: Dict[str, Optional[int]] = {}
+    for key, condition in pinecone_filter.items():
+        if key == "$and":
+            bounds.extend(d for d in (earliest_filter_date(clause) for clause in condition) if d)
+        elif key == "$or":
+            # Every branch must be bounded; the filter is bounded by the earliest branch
+            branches = [earliest_filter_date(clause) for clause in condition]
+            if branches and all(branches):
+                bounds.append(min(branches))
+        elif key in DATE_FIELDS:
+            fields[key] = _lower_bound(condition)
+    year = fields.get("published_year")
+    if year is not None:
+        month = min(max(fields.get("published_month") or 1, 1), 12)
+        day = fields.get("published_day") or 1
+        last_day = (date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)).day
+        bounds.append(date(year, month, min(max(day, 1), last_day)))
+    return max(bounds) if bounds else None
+
+
+class HotTier:
+    """
+    In-memory IVF index over recent records.
+
+    Args:
+        window_days: Records published within this many days are kept
+        complete_since: First date for which the tier holds every record of the index
+            (set by a rebuild); queries reaching earlier go to Pinecone
+        nprobe: Number of clusters scored per query
+    """
+
+    def __init__(self, window_days: int = DEFAULT_WINDOW_DAYS, complete_since: Optional[date] = None, nprobe: int = 8):
+        self.window_days = window_days
+        self.complete_since = complete_since
+        self.nprobe = nprobe
+        self.ids: List[str] = []
+        self.metadatas: List[Dict[str, Any]] = []
+        self.vectors = np.empty((0, 0), dtype=VECTOR_DTYPE)
+        self.centroids: Optional[np.ndarray] = None
+        self.assignments: Optional[np.ndarray] = None
+        self._trained_size = 0
+        # Filter columns and date keys of the current records, built on first use
+        self._columns: Optional[MetadataColumns] = None
+        self._date_keys: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def window_start(self, today: Optional[date] = None) -> date:
+        return (today or date.today()) - timedelta(days=self.window_days)
+
+    def in_window(self, metadata: Dict[str, Any], today: Optional[date] = None) -> bool:
+        published = metadata_date(metadata)
+        return published is not None and published >= self.window_start(today)
+
+    def covers(self, pinecone_filter: Dict[str, Any]) -> bool:
+        """True when every record matching the filter is guaranteed to be in the tier"""
+        if self.complete_since is None or not self.ids:
+            return False
+        earliest = earliest_filter_date(pinecone_filter)
+        return earliest is not None and earliest >= self.complete_since
+
+    # ----- updates -----
+
+    def _changed(self) -> None:
+        self._columns = self._date_keys = None
+
+    def _keep(self, rows: np.ndarray) -> None:
+        self._changed()
+        self.ids = [self.ids[i] for i in rows]
+        self.metadatas = [self.metadatas[i] for i in rows]
+        self.vectors = self.vectors[rows]
+        if self.assignments is not None:
+            self.assignments = self.assignments[rows]
+
+    def remove(self, ids: Iterable[str]) -> int:
+        """Drop records by id; returns how many were removed"""
+        drop = set(ids)
+        rows = np.array([i for i, vector_id in enumerate(self.ids) if vector_id not in drop], dtype=np.int64)
+        removed = len(self.ids) - len(rows)
+        if removed:
+            self._keep(rows)
+        return removed
+
+    def add(self, records: Iterable[Tuple[str, VectorLike, Dict[str, Any]]], today: Optional[date] = None) -> int:
+        """Add (or replace) in-window records; records outside the window are ignored"""
+        records = list(records)
+        # Replaced records are dropped even when their new date falls outside the window
+        self.remove(vector_id for vector_id, _, _ in records)
+        fresh = [(vector_id, values, metadata) for vector_id, values, metadata in records
+                 if self.in_window(metadata, today)]
+        if not fresh:
+            return 0
+        vectors = normalize(to_matrix([values for _, values, _ in fresh]))
+        self._changed()
+        self.vectors = vectors if not len(self.ids) else np.concatenate([self.vectors, vectors])
+        self.ids.extend(vector_id for vector_id, _, _ in fresh)
+        self.metadatas.extend(dict(metadata) for _, _, metadata in fresh)
+        if self.centroids is not None:
+            self.assignments = np.concatenate([self.assignments, np.argmax(vectors @ self.centroids.T, axis=1)])
+        # Retrain once the tier has doubled since the clusters were built
+        if len(self.ids) >= 2 * max(self._trained_size, IVF_MIN_VECTORS // 2):
+            self.train()
+        return len(fresh)
+
+    def age_out(self, today: Optional[date] = None) -> int:
+        """Drop records older than the window; returns how many were removed"""
+        start = self.window_start(today)
+        rows = np.array([i for i, metadata in enumerate(self.metadatas) if self.in_window(metadata, today)],
+                        dtype=np.int64)
+        removed = len(self.ids) - len(rows)
+        if removed:
+            self._keep(rows)
+        if self.complete_since is not None:
+            self.complete_since = max(self.complete_since, start)
+        return removed
+
+    def train(self, iterations: int = 10, seed: int = 0) -> None:
+        """Cluster the vectors with spherical k-means (exact search below IVF_MIN_VECTORS)"""
+        count = len(self.ids)
+        self._trained_size = count
+        if count < IVF_MIN_VECTORS:
+            self.centroids = self.assignments = None
+            return
+        nlist = int(np.sqrt(count))
+        rng = np.random.default_rng(seed)
+        sample = self.vectors[rng.choice(count, size=min(count, nlist * 64), replace=False)]
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assignments = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            empty = np.bincount(assignments, minlength=nlist) == 0
+            sums[empty] = centroids[empty]
+            centroids = normalize(sums)
+        self.centroids = centroids
+        self.assignments = np.argmax(self.vectors @ centroids.T, axis=1)
+
+    # ----- search -----
+
+    def _filter_rows(self, pinecone_filter: Optional[Dict[str, Any]]) -> np.ndarray:
+        """Rows matching a filter, evaluated on the metadata columns"""
+        if not pinecone_filter:
+            return np.arange(len(self.ids))
+        columns = self._columns
+        if columns is None:
+            columns = self._columns = MetadataColumns(self.metadatas)
+        return np.flatnonzero(columns.mask(pinecone_filter))
+
+    def _newest_first(self, rows: np.ndarray) -> np.ndarray:
+        """Rows ordered by publication date, newest first (undated last, ties in row order)"""
+        keys = self._date_keys
+        if keys is None:
+            keys = self._date_keys = np.array(
+                [(metadata_date(metadata) or date.min).toordinal() for metadata in self.metadatas], dtype=np.int64
+            )
+        return rows[np.argsort(-keys[rows], kind="stable")]
+
+    def query(
+        self,
+        vector: VectorLike,
+        top_k: int,
+        pinecone_filter: Optional[Dict[str, Any]] = None,
+        include_metadata: bool = True,
+    ) -> List[Dict[str, Any]]:
+        """Cosine top-k among records matching the filter, as Pinecone-style matches"""
+        if not self.ids:
+            return []
+        query = normalize(to_vector(vector))
+        if query.shape[0] != self.vectors.shape[1]:
+            raise ValueError(f"Query dimension {query.shape[0]} does not match hot tier dimension {self.vectors.shape[1]}")
+        candidates = self._filter_rows(pinecone_filter)
+        if self.centroids is not None and len(candidates) > top_k:
+            probe = np.argsort(-(self.centroids @ query))[:self.nprobe]
+            probed = candidates[np.isin(self.assignments[candidates], probe)]
+            # Selective filters can leave the probed clusters short: scan all candidates then
+            if len(probed) >= top_k:
+                candidates = probed
+        if not len(candidates):
+            return []
+        scores = self.vectors[candidates] @ query
+        best = np.argsort(-scores)[:top_k]
+        return [
+            {
+                "id": self.ids[candidates[i]],
+                "score": float(scores[i]),
+                "metadata": self.metadatas[candidates[i]] if include_metadata else {},
+            }
+            for i in best
+        ]
+
+    def scan(self, pinecone_filter: Optional[Dict[str, Any]] = None, limit: int = 1000) -> List[Dict[str, Any]]:
+        """Records matching the filter, newest first, as Pinecone-style matches without a score"""
+        rows = self._newest_first(self._filter_rows(pinecone_filter))[:limit]
+        return [{"id": self.ids[i], "score": 0.0, "metadata": self.metadatas[i]} for i in rows]
+
+    # ----- persistence -----
+
+    def save(self, path: str) -> None:
+        """Write the tier as a snapshot, replacing the previous one in a single rename"""
+        tmp_path = path.rstrip("/") + ".tmp"
+        old_path = path.rstrip("/") + ".old"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        with SnapshotWriter(tmp_path, self.vectors.shape[1] if len(self.ids) else 0) as writer:
+            if self.ids:
+                writer.append(self.ids, self.vectors, self.metadatas)
+        with open(os.path.join(tmp_path, STATE_FILE), 'w', encoding='utf-8') as f:
+            json.dump({
+                "window_days": self.window_days,
+                "complete_since": self.complete_since.isoformat() if self.complete_since else None,
+                "updated_at": datetime.now().isoformat(),
+            }, f, indent=2)
+        shutil.rmtree(old_path, ignore_errors=True)
+        if os.path.exists(path):
+            os.rename(path, old_path)
+        os.rename(tmp_path, path)
+        shutil.rmtree(old_path, ignore_errors=True)
+
+    @classmethod
+    def load(cls, path: str) -> "HotTier":
+        with open(os.path.join(path, STATE_FILE), 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        complete_since = state.get("complete_since")
+        tier = cls(
+            window_days=state.get("window_days", DEFAULT_WINDOW_DAYS),
+            complete_since=date.fromisoformat(complete_since) if complete_since else None,
+        )
+        reader = SnapshotReader(path)
+        if reader.count:
+            tier.ids = reader.ids()
+            tier.vectors = np.array(reader.vectors, dtype=VECTOR_DTYPE)
+            tier.metadatas = [reader.metadata(i) for i in range(reader.count)]
+        tier.train()
+        return tier
+
+
+class HotTierCache:
+    """Holds the hot tier loaded by the API and reloads it when the files on disk change"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.tier: Optional[HotTier] = None
+        self.loaded_mtime: Optional[float] = None
+        self.hits = 0
+        self.misses = 0
+
+    def get(self) -> Optional[HotTier]:
+        try:
+            mtime = os.path.getmtime(os.path.join(self.path, STATE_FILE))
+        except OSError:
+            return self.tier
+        if mtime != self.loaded_mtime:
+            try:
+                self.tier = HotTier.load(self.path)
+                self.loaded_mtime = mtime
+                print(f"🔥 Loaded hot tier: {len(self.tier)} vectors since {self.tier.complete_since}")
+            except Exception as e:
+                # Keep serving the previous tier if a rewrite is in progress
+                print(f"⚠️  Could not load hot tier from {self.path}: {e}")
+        return self.tier
+
+    def stats(self) -> Dict[str, Any]:
+        tier = self.tier
+        return {
+            "path": self.path,
+            "loaded": tier is not None,
+            "vectors": len(tier) if tier else 0,
+            "window_days": tier.window_days if tier else None,
+            "complete_since": tier.complete_since.isoformat() if tier and tier.complete_since else None,
+            "clusters": len(tier.centroids) if tier is not None and tier.centroids is not None else 0,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+def update_hot_tier(
+    records: Sequence[Tuple[str, VectorLike, Dict[str, Any]]],
+    removed_ids: Iterable[str] = (),
+    path: Optional[str] = None,
+) -> None:
+    """
+    Apply ingestion changes to the persisted hot tier: add in-window records, drop
+    removed ids and age out old records. Does nothing until a tier has been built.
+    """
+    path = path or get_hot_tier_path()
+    if not os.path.exists(os.path.join(path, STATE_FILE)):
+        return
+    tier = HotTier.load(path)
+    removed = tier.remove(removed_ids)
+    added = tier.add(records)
+    aged = tier.age_out()
+    tier.save(path)
+    print(f"🔥 Hot tier updated: {added} added, {removed} removed, {aged} aged out ({len(tier)} vectors)")
+
+
+def update_local_indexes(
+    records: Sequence[Tuple[str, VectorLike, Dict[str, Any]]],
+    failed_ids: Iterable[str] = (),
+    removed_ids: Iterable[str] = (),
+) -> None:
+    """
+    Apply ingestion changes to the local state derived from the index, the hot tier
+    and the vocabulary, leaving out records whose upsert failed. Every ingestion
+    pipeline goes through here so the two stay in step with the index.
+    """
+    failed = set(failed_ids)
+    upserted = [record for record in records if record[0] not in failed]
+    removed_ids = list(removed_ids)
+    update_hot_tier(upserted, removed_ids=removed_ids)
+    update_vocabulary(upserted, removed_ids=removed_ids)
+
+
+def rebuild(index, path: str, window_days: int, max_workers: int = 8) -> HotTier:
+    """Seed the tier with every in-window record of the index"""
+    from concurrent.futures import ThreadPoolExecutor
+    from delete_records import FETCH_BATCH_SIZE, list_ids
+    from snapshot_tool import fetch_records
+
+    tier = HotTier(window_days=window_days)
+    ids = list_ids(index)
+    print(f"📋 Scanning {len(ids)} records for documents published since {tier.window_start()}...")
+    batches = [ids[start:start + FETCH_BATCH_SIZE] for start in range(0, len(ids), FETCH_BATCH_SIZE)]
+    records = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for found, vectors, metadatas in executor.map(lambda batch: fetch_records(index, batch), batches):
+            records.extend(record for record in zip(found, vectors, metadatas) if tier.in_window(record[2]))
+    # One add: each call rescans the tier for replaced ids and copies its vectors
+    tier.add(records)
+    tier.complete_since = tier.window_start()
+    tier.train()
+    tier.save(path)
+    return tier
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the local hot tier of recent articles")
+    parser.add_argument("command", choices=["rebuild", "age", "info"])
+    parser.add_argument("--path", default=get_hot_tier_path(), help="Hot tier directory")
+    parser.add_argument("--days", type=int, default=get_window_days(), help="Window size in days (rebuild)")
+    args = parser.parse_args()
+
+    if args.command == "rebuild":
+        from delete_records import get_index
+
+        tier = rebuild(get_index(), args.path, args.days)
+        print(f"🔥 Hot tier rebuilt: {len(tier)} vectors published since {tier.complete_since}")
+    elif args.command == "age":
+        tier = HotTier.load(args.path)
+        aged = tier.age_out()
+        tier.save(args.path)
+        print(f"🔥 Aged out {aged} vectors ({len(tier)} left, complete since {tier.complete_since})")
+    else:
+        tier = HotTier.load(args.path)
+        print(f"🔥 Hot tier {args.path}: {len(tier)} vectors, window {tier.window_days} days, "
+              f"complete since {tier.complete_since}, "
+              f"{len(tier.centroids) if tier.centroids is not None else 0} clusters")
+
+
+if __name__ == "__main__":
+    main()
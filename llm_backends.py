@@ -0,0 +1,251 @@
+"""
+LLM backends for filter generation.
+
+Every backend turns a prompt into a stream of ``(text, usage)`` chunks; ``usage`` is
+``{"prompt_tokens", "output_tokens"}`` on the chunk that carries it and None otherwise.
+Non-streaming calls yield a single chunk. Closing the generator early cancels the
+underlying request, which the agent does as soon as the filter JSON is complete.
+
+Backends:
+    gemini  - Google Gemini (GEMINI_API_KEY, GEMINI_MODEL)
+    ollama  - any local Ollama model via /api/generate (OLLAMA_LLM_MODEL, OLLAMA_GENERATE_URL)
+    replay  - deterministic responses recorded earlier (LLM_REPLAY_PATH), for benchmarks
+              and tests without external services
+    distilled - the local model trained from logged filters (DISTILLED_MODEL_PATH), whatever
+              its confidence
+
+Set ``LLM_RECORD_PATH`` to record every response of the live backends for later replay.
+"""
+
+import itertools
+import json
+import os
+import threading
+from typing import Any, Dict, Iterator, Optional, Tuple
+from urllib.parse import urlparse, urlunparse
+
+import requests
+from dotenv import load_dotenv
+
+from embedding_client import get_ollama_url
+
+load_dotenv(override=True)
+
+DEFAULT_GEMINI_MODEL = "gemini-2.5-flash-lite-preview-06-17"
+DEFAULT_OLLAMA_MODEL = "llama3.2"
+DEFAULT_REPLAY_PATH = "llm_responses.jsonl"
+
+Chunk = Tuple[str, Optional[Dict[str, int]]]
+
+
+class LLMBackend:
+    """Base class: a named model that streams generated text"""
+
+    name = "base"
+
+    def generate(
+        self,
+        prompt: str,
+        query: str,
+        schema: Optional[Dict[str, Any]] = None,
+        stream: bool = False,
+    ) -> Iterator[Chunk]:
+        """
+        Generate a response to ``prompt`` (``query`` is the user query it ends with).
+        ``schema`` constrains the output to JSON matching it; without one the output
+        is still requested as JSON where the backend supports it.
+        """
+        raise NotImplementedError
+
+
+class GeminiBackend(LLMBackend):
+    name = "gemini"
+
+    def __init__(self, model: Optional[str] = None, api_key: Optional[str] = None):
+        import google.generativeai as genai
+
+        api_key = api_key or os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            raise ValueError("GEMINI_API_KEY must be set in the environment.")
+        genai.configure(api_key=api_key)
+        self.model_name = model or os.getenv("GEMINI_MODEL", DEFAULT_GEMINI_MODEL)
+        self.model = genai.GenerativeModel(self.model_name)
+
+    @staticmethod
+    def _usage(usage_metadata) -> Optional[Dict[str, int]]:
+        if not usage_metadata or not getattr(usage_metadata, "prompt_token_count", 0):
+            return None
+        return {
+            "prompt_tokens": usage_metadata.prompt_token_count,
+            "output_tokens": getattr(usage_metadata, "candidates_token_count", 0) or 0,
+        }
+
+    def generate(self, prompt, query, schema=None, stream=False):
+        generation_config: Dict[str, Any] = {"response_mime_type": "application/json"}
+        if schema:
+            generation_config["response_schema"] = schema
+        response = self.model.generate_content(prompt, generation_config=generation_config, stream=stream)
+        if not stream:
+            yield response.text, self._usage(getattr(response, "usage_metadata", None))
+            return
+
+        # Iterating the SDK response reads one chunk ahead, which would delay every
+        # chunk, so the underlying stream is read directly
+        first = getattr(response, "_result", None)
+        iterator = getattr(response, "_iterator", None)
+        if first is None or iterator is None:
+            for chunk in response:
+                yield chunk.text, self._usage(getattr(chunk, "usage_metadata", None))
+            return
+        try:
+            for chunk in itertools.chain([first], iterator):
+                text = "".join(part.text for candidate in chunk.candidates[:1] for part in candidate.content.parts)
+                yield text, self._usage(getattr(chunk, "usage_metadata", None))
+        finally:
+            # Stop the request when the consumer is done early (gRPC calls are cancelled, REST generators closed)
+            for method in ("cancel", "close"):
+                stop = getattr(iterator, method, None)
+                if callable(stop):
+                    try:
+                        stop()
+                    except Exception:
+                        pass
+                    break
+
+
+def get_ollama_generate_url() -> str:
+    """OLLAMA_GENERATE_URL, or /api/generate on the host of the embedding endpoint"""
+    url = os.getenv("OLLAMA_GENERATE_URL")
+    if url:
+        return url
+    parsed = urlparse(get_ollama_url())
+    return urlunparse(parsed._replace(path="/api/generate", query="", fragment=""))
+
+
+class OllamaBackend(LLMBackend):
+    """Local generation through Ollama's /api/generate; keeps queries on-prem"""
+
+    name = "ollama"
+
+    def __init__(self, model: Optional[str] = None, url: Optional[str] = None, timeout: float = 60):
+        self.model_name = model or os.getenv("OLLAMA_LLM_MODEL", DEFAULT_OLLAMA_MODEL)
+        self.url = url or get_ollama_generate_url()
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def generate(self, prompt, query, schema=None, stream=False):
+        payload = {
+            "model": self.model_name,
+            "prompt": prompt,
+            "stream": stream,
+            "format": schema or "json",
+            "options": {"temperature": 0},
+        }
+        response = self.session.post(self.url, json=payload, stream=stream, timeout=self.timeout)
+        try:
+            response.raise_for_status()
+            lines = response.iter_lines() if stream else [response.content]
+            for line in lines:
+                if not line:
+                    continue
+                message = json.loads(line)
+                if message.get("error"):
+                    raise RuntimeError(f"Ollama generation failed: {message['error']}")
+                usage = None
+                if message.get("done"):
+                    usage = {
+                        "prompt_tokens": message.get("prompt_eval_count", 0),
+                        "output_tokens": message.get("eval_count", 0),
+                    }
+                yield message.get("response", ""), usage
+        finally:
+            # Closing the response drops the connection, which stops generation on the server
+            response.close()
+
+
+def _replay_key(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+class ReplayBackend(LLMBackend):
+    """Serves responses recorded by RecordingBackend, keyed by query; no network access"""
+
+    name = "replay"
+
+    def __init__(self, path: Optional[str] = None, chunk_size: int = 16):
+        self.path = path or os.getenv("LLM_REPLAY_PATH", DEFAULT_REPLAY_PATH)
+        self.chunk_size = chunk_size
+        self.responses: Dict[str, str] = {}
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    # Later recordings of the same query win
+                    self.responses[_replay_key(record["query"])] = record["response"]
+
+    def generate(self, prompt, query, schema=None, stream=False):
+        try:
+            text = self.responses[_replay_key(query)]
+        except KeyError:
+            raise KeyError(f"No recorded response for query: {query!r}")
+        pieces = [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)] if stream else [text]
+        for position, piece in enumerate(pieces):
+            usage = None
+            if position == len(pieces) - 1:
+                usage = {"prompt_tokens": len(prompt) // 4, "output_tokens": len(text) // 4}
+            yield piece, usage
+
+
+class DistilledBackend(LLMBackend):
+    """The distilled local filter model (distilled_model.py); ignores the prompt"""
+
+    name = "distilled"
+
+    def __init__(self, path: Optional[str] = None):
+        from distilled_model import DistilledModelCache, get_model_path
+
+        self.cache = DistilledModelCache(path or get_model_path())
+        if self.cache.get() is None:
+            raise ValueError(f"No distilled filter model at {self.cache.path}; run distilled_model.py train")
+
+    def generate(self, prompt, query, schema=None, stream=False):
+        pinecone_filter, _ = self.cache.get().predict(query)
+        yield json.dumps(pinecone_filter), {"prompt_tokens": 0, "output_tokens": 0}
+
+
+class RecordingBackend(LLMBackend):
+    """Wraps a backend and appends every complete response to a JSONL file for replay"""
+
+    def __init__(self, backend: LLMBackend, path: str):
+        self.backend = backend
+        self.name = backend.name
+        self.path = path
+        self._lock = threading.Lock()
+
+    def generate(self, prompt, query, schema=None, stream=False):
+        # Read the whole response even if the consumer stops early, so the recording is complete
+        chunks = list(self.backend.generate(prompt, query, schema, stream))
+        response = "".join(text for text, _ in chunks)
+        with self._lock, open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({"backend": self.name, "query": query, "response": response}) + "\n")
+        yield from chunks
+
+
+BACKENDS = {
+    "gemini": GeminiBackend,
+    "ollama": OllamaBackend,
+    "replay": ReplayBackend,
+    "distilled": DistilledBackend,
+}
+
+
+def create_backend(name: str) -> LLMBackend:
+    """Backend by name, recording its responses when LLM_RECORD_PATH is set"""
+    try:
+        backend = BACKENDS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown LLM backend {name!r}; choose one of {sorted(BACKENDS)}")
+    record_path = os.getenv("LLM_RECORD_PATH")
+    if record_path and name not in ("replay", "distilled"):
+        backend = RecordingBackend(backend, record_path)
+    return backend
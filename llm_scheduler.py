@@ -0,0 +1,253 @@
+"""
+Quota-aware scheduling of Gemini calls across priority lanes.
+
+Every scheduled LLM call waits for a slot from one shared RateLimiter (GEMINI_RPM /
+GEMINI_TPM), so the API stays inside its quota instead of discovering it through 429
+responses. Callers queue in one of three lanes:
+
+    interactive - /query, /results and /refine
+    batch       - /batch-query and /batch-results
+    background  - semantic cache audits
+
+Slots go to the lanes by weighted fair queuing (LLM_LANE_WEIGHTS, default 8:3:1): each
+grant advances its lane's virtual time by the call's estimated tokens over the lane
+weight, and the waiting lane with the lowest virtual time goes next, interactive first
+on ties. A lane that was idle rejoins at the current virtual time, so it gets no burst
+for the time it spent idle. Batch and background calls also leave an
+LLM_INTERACTIVE_RESERVE fraction of both buckets untouched, and interactive calls do
+not queue behind a lane waiting for the buckets to refill, so an interactive call
+arriving during a batch job finds a slot at once.
+
+A 429 that still gets through pauses the limiter and halves its rate (see
+rate_limiter.py), and the call is queued again in its lane.
+"""
+import os
+import threading
+import time
+from collections import Counter, deque
+from typing import Any, Dict, Iterable, Optional
+
+import numpy as np
+
+from llm_backends import LLMBackend
+from rate_limiter import RateLimiter, estimate_tokens, is_rate_limit_error
+
+LANES = ("interactive", "batch", "background")
+DEFAULT_WEIGHTS = {"interactive": 8, "batch": 3, "background": 1}
+DEFAULT_INTERACTIVE_RESERVE = 0.2
+DEFAULT_MAX_ATTEMPTS = 3
+# Filters are short; the estimate is reconciled with the real usage after the call
+OUTPUT_TOKENS_ESTIMATE = 64
+WAIT_WINDOW = 1000
+
+
+def get_scheduling_enabled() -> bool:
+    return os.getenv("LLM_SCHEDULING", "true").strip().lower() in ("1", "true", "yes")
+
+
+def get_lane_weights() -> Dict[str, float]:
+    """LLM_LANE_WEIGHTS as ``lane=weight`` pairs ("interactive=8,batch=3,background=1")"""
+    weights = dict(DEFAULT_WEIGHTS)
+    for pair in os.getenv("LLM_LANE_WEIGHTS", "").split(","):
+        if not pair.strip():
+            continue
+        lane, _, weight = pair.partition("=")
+        lane = lane.strip().lower()
+        if lane not in LANES or not weight.strip():
+            raise ValueError(f"LLM_LANE_WEIGHTS expects lane=weight pairs for lanes {LANES}, got {pair!r}")
+        weights[lane] = float(weight)
+    return weights
+
+
+def get_interactive_reserve() -> float:
+    return float(os.getenv("LLM_INTERACTIVE_RESERVE", DEFAULT_INTERACTIVE_RESERVE))
+
+
+class LLMScheduler:
+    """
+    Hands out rate limiter slots to LLM calls queued in priority lanes.
+
+    Args:
+        limiter: Shared requests/tokens-per-minute limiter
+        weights: Share of the slots each lane gets while all of them are waiting
+        interactive_reserve: Fraction of both buckets batch and background calls leave unused
+        backends: Names of the backends whose calls are scheduled (those with a quota)
+        max_attempts: Attempts per call when the LLM still answers with a 429
+    """
+
+    def __init__(
+        self,
+        limiter: RateLimiter,
+        weights: Optional[Dict[str, float]] = None,
+        interactive_reserve: float = DEFAULT_INTERACTIVE_RESERVE,
+        backends: Iterable[str] = ("gemini",),
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+    ):
+        self.weights = {**DEFAULT_WEIGHTS, **(weights or {})}
+        if set(self.weights) != set(LANES) or min(self.weights.values()) <= 0:
+            raise ValueError(f"Lane weights must be positive numbers for lanes {LANES}, got {self.weights}")
+        if not 0 <= interactive_reserve < 1:
+            raise ValueError(f"The interactive reserve must be in [0, 1), got {interactive_reserve}")
+        self.limiter = limiter
+        self.interactive_reserve = interactive_reserve
+        self.backends = set(backends)
+        self.max_attempts = max_attempts
+        self._condition = threading.Condition()
+        self._queues = {lane: deque() for lane in LANES}
+        self._virtual_time = {lane: 0.0 for lane in LANES}
+        self._clock = 0.0
+        # Lane whose turn it is but whose call waits for the limiter to refill
+        self._limited: Optional[str] = None
+        self.granted: Counter = Counter()
+        self.max_queued: Counter = Counter()
+        self.retries = 0
+        self.waits = {lane: deque(maxlen=WAIT_WINDOW) for lane in LANES}
+
+    def _next_lane(self) -> Optional[str]:
+        """Waiting lane with the lowest virtual time; ``min`` keeps the lane order on ties"""
+        waiting = [lane for lane in LANES if self._queues[lane]]
+        return min(waiting, key=self._virtual_time.__getitem__) if waiting else None
+
+    def acquire(self, lane: str, estimated_tokens: float) -> float:
+        """Block until the lane's turn comes and the limiter grants a slot; returns seconds waited"""
+        if lane not in LANES:
+            raise ValueError(f"Unknown lane {lane!r}; choose one of {LANES}")
+        headroom = 0.0 if lane == "interactive" else self.interactive_reserve
+        ticket = object()
+        start = time.monotonic()
+        with self._condition:
+            queue = self._queues[lane]
+            if not queue:
+                self._virtual_time[lane] = max(self._virtual_time[lane], self._clock)
+            queue.append(ticket)
+            self.max_queued[lane] = max(self.max_queued[lane], len(queue))
+            try:
+                while True:
+                    turn = self._next_lane() == lane
+                    # Interactive calls do not queue behind a lane waiting for the limiter: the reserve is theirs
+                    if queue[0] is ticket and (turn or (lane == "interactive" and self._limited is not None)):
+                        wait = self.limiter.reserve(estimated_tokens, headroom)
+                        if wait <= 0:
+                            break
+                        if turn:
+                            self._limited = lane
+                        self._condition.wait(wait)
+                    else:
+                        self._condition.wait()
+            except BaseException:
+                if queue[0] is ticket and self._limited == lane:
+                    self._limited = None
+                queue.remove(ticket)
+                self._condition.notify_all()
+                raise
+            if self._limited == lane:
+                self._limited = None
+            self._clock = min(self._virtual_time[waiting] for waiting in LANES if self._queues[waiting])
+            queue.popleft()
+            self._virtual_time[lane] += estimated_tokens / self.weights[lane]
+            waited = time.monotonic() - start
+            self.granted[lane] += 1
+            self.waits[lane].append(waited)
+            self._condition.notify_all()
+        return waited
+
+    def throttled(self) -> float:
+        """Report a 429 that got through: the limiter pauses and slows down; returns the pause"""
+        with self._condition:
+            self.retries += 1
+        return self.limiter.on_throttled()
+
+    def completed(self, estimated_tokens: float, usage: Optional[Dict[str, int]]) -> None:
+        """Reconcile the token estimate of a finished call with its real usage"""
+        actual = sum(usage.values()) if usage else None
+        self.limiter.reconcile(estimated_tokens, actual)
+        self.limiter.on_success()
+
+    def wrap(self, backend: LLMBackend, lane: str) -> LLMBackend:
+        """The backend with its calls scheduled in ``lane``, unchanged if it has no quota"""
+        if backend.name not in self.backends:
+            return backend
+        return ScheduledBackend(backend, self, lane)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._condition:
+            lanes = {
+                lane: (len(self._queues[lane]), self.max_queued[lane], self.granted[lane], list(self.waits[lane]))
+                for lane in LANES
+            }
+            retries = self.retries
+
+        def summary(samples):
+            if not samples:
+                return {}
+            millis = np.asarray(samples) * 1000
+            return {
+                "avg_ms": float(millis.mean()),
+                "p50_ms": float(np.percentile(millis, 50)),
+                "p99_ms": float(np.percentile(millis, 99)),
+                "max_ms": float(millis.max()),
+            }
+
+        return {
+            "enabled": True,
+            "backends": sorted(self.backends),
+            "requests_per_minute": self.limiter.requests_per_minute,
+            "tokens_per_minute": self.limiter.tokens_per_minute,
+            "rate_fraction": self.limiter.rate_fraction,
+            "throttled": self.limiter.throttled,
+            "retries": retries,
+            "interactive_reserve": self.interactive_reserve,
+            "lanes": {
+                lane: {
+                    "weight": self.weights[lane],
+                    "queued": queued,
+                    "max_queued": max_queued,
+                    "granted": granted,
+                    "wait": summary(waits),
+                }
+                for lane, (queued, max_queued, granted, waits) in lanes.items()
+            },
+        }
+
+
+class ScheduledBackend(LLMBackend):
+    """Wraps a backend so that each call first waits for its slot in a scheduler lane"""
+
+    def __init__(self, backend: LLMBackend, scheduler: LLMScheduler, lane: str):
+        self.backend = backend
+        self.name = backend.name
+        self.scheduler = scheduler
+        self.lane = lane
+
+    def generate(self, prompt, query, schema=None, stream=False):
+        estimate = estimate_tokens(prompt) + OUTPUT_TOKENS_ESTIMATE
+        attempt = 1
+        while True:
+            self.scheduler.acquire(self.lane, estimate)
+            chunks = self.backend.generate(prompt, query, schema, stream)
+            try:
+                # Quota errors surface with the first chunk, before anything reaches the caller
+                first = next(chunks, None)
+            except Exception as e:
+                chunks.close()
+                if not is_rate_limit_error(e) or attempt >= self.scheduler.max_attempts:
+                    raise
+                pause = self.scheduler.throttled()
+                print(f"⏳ {self.name} rate limit hit ({self.lane} lane), pausing {pause:.1f}s before retrying")
+                attempt += 1
+                continue
+            break
+
+        usage = None
+        try:
+            if first is None:
+                return
+            usage = first[1]
+            yield first
+            for text, chunk_usage in chunks:
+                usage = chunk_usage or usage
+                yield text, chunk_usage
+        finally:
+            # A stream stopped early keeps its estimate, having no usage to reconcile with
+            chunks.close()
+            self.scheduler.completed(estimate, usage)
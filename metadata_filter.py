@@ -0,0 +1,206 @@
+"""
+Local evaluation of Pinecone metadata filters.
+
+Implements the subset of the Pinecone filter language used by this project so that
+vectors fetched from the index (or held locally) can be matched without a query.
+``matches_filter`` checks one metadata dict; ``MetadataColumns`` evaluates a filter
+over many records at once, with the same semantics, as a NumPy mask.
+"""
+
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+
+COMPARISON_OPERATORS = {"$eq", "$ne", "$gt", "$gte", "$lt", "$lte", "$in", "$nin", "$exists"}
+LOGICAL_OPERATORS = {"$and", "$or"}
+
+
+def _compare(value: Any, operator: str, operand: Any) -> bool:
+    """Apply a single comparison operator to a scalar metadata value"""
+    if operator == "$eq":
+        return value == operand
+    if operator == "$ne":
+        return value != operand
+    if operator == "$in":
+        return value in operand
+    if operator == "$nin":
+        return value not in operand
+    if value is None:
+        return False
+    try:
+        if operator == "$gt":
+            return value > operand
+        if operator == "$gte":
+            return value >= operand
+        if operator == "$lt":
+            return value < operand
+        if operator == "$lte":
+            return value <= operand
+    except TypeError:
+        return False
+    raise ValueError(f"Unsupported filter operator: {operator}")
+
+
+def _match_field(metadata: Dict[str, Any], field: str, condition: Any) -> bool:
+    """Match one field condition; list-valued fields match if any element matches"""
+    if not isinstance(condition, dict):
+        condition = {"$eq": condition}
+
+    present = field in metadata
+    value = metadata.get(field)
+    for operator, operand in condition.items():
+        if operator not in COMPARISON_OPERATORS:
+            raise ValueError(f"Unsupported filter operator: {operator}")
+        if operator == "$exists":
+            if present != bool(operand):
+                return False
+            continue
+        if isinstance(value, list):
+            # Negative operators must hold for every element, positive ones for any
+            if operator in ("$ne", "$nin"):
+                if not all(_compare(item, operator, operand) for item in value):
+                    return False
+            elif not any(_compare(item, operator, operand) for item in value):
+                return False
+        elif not present and operator not in ("$ne", "$nin"):
+            return False
+        elif not _compare(value, operator, operand):
+            return False
+    return True
+
+
+def matches_filter(metadata: Dict[str, Any], pinecone_filter: Dict[str, Any]) -> bool:
+    """
+    Check whether a metadata dict satisfies a Pinecone metadata filter.
+
+    Args:
+        metadata: Vector metadata as stored in the index
+        pinecone_filter: Filter such as ``{"author": "Jane Doe", "published_year": {"$lt": 2024}}``
+
+    Returns:
+        True if the metadata matches; an empty filter matches everything
+    """
+    if not pinecone_filter:
+        return True
+    metadata = metadata or {}
+    for key, condition in pinecone_filter.items():
+        if key == "$and":
+            if not all(matches_filter(metadata, sub) for sub in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_filter(metadata, sub) for sub in condition):
+                return False
+        elif key.startswith("$"):
+            raise ValueError(f"Unsupported logical operator: {key}")
+        elif not _match_field(metadata, key, condition):
+            return False
+    return True
+
+
+ABSENT = -1  # Scalar code of a record without the field
+LIST = -2  # Scalar code of a record whose value is a list
+
+
+class _FieldColumn:
+    """
+    One metadata field of many records: scalar values as codes into their distinct
+    values, list values as an inverted index from each distinct item to its rows.
+    Conditions are evaluated once per distinct value, not once per record.
+    """
+
+    def __init__(self, metadatas: Sequence[Dict[str, Any]], field: str):
+        self.size = len(metadatas)
+        self.values: List[Any] = []
+        self.items: List[Any] = []
+        codes: Dict[Any, int] = {}
+        item_codes: Dict[Any, int] = {}
+        item_rows: List[List[int]] = []
+        self.codes = np.full(self.size, ABSENT, dtype=np.int64)
+        for row, metadata in enumerate(metadatas):
+            if not metadata or field not in metadata:
+                continue
+            value = metadata[field]
+            if isinstance(value, list):
+                self.codes[row] = LIST
+                for item in value:
+                    code = item_codes.setdefault(item, len(self.items))
+                    if code == len(self.items):
+                        self.items.append(item)
+                        item_rows.append([])
+                    item_rows[code].append(row)
+            else:
+                code = codes.setdefault(value, len(self.values))
+                if code == len(self.values):
+                    self.values.append(value)
+                self.codes[row] = code
+        self.item_rows = [np.array(rows, dtype=np.int64) for rows in item_rows]
+        self.is_list = self.codes == LIST
+
+    def _item_mask(self, accepted: np.ndarray) -> np.ndarray:
+        """Rows holding at least one of the accepted list items"""
+        mask = np.zeros(self.size, dtype=bool)
+        for code in np.flatnonzero(accepted):
+            mask[self.item_rows[code]] = True
+        return mask
+
+    def mask(self, operator: str, operand: Any) -> np.ndarray:
+        """Rows whose value satisfies one comparison, as ``_match_field`` decides it"""
+        if operator not in COMPARISON_OPERATORS:
+            raise ValueError(f"Unsupported filter operator: {operator}")
+        present = self.codes != ABSENT
+        if operator == "$exists":
+            return present == bool(operand)
+        accepted = np.array([_compare(value, operator, operand) for value in self.values] + [False], dtype=bool)
+        # Code -1 (absent) and -2 (list) both index the trailing False
+        mask = accepted[np.where(self.codes >= 0, self.codes, len(self.values))]
+        items = np.array([_compare(item, operator, operand) for item in self.items], dtype=bool)
+        if operator in ("$ne", "$nin"):
+            # Negative operators hold for absent fields and must hold for every list element
+            mask |= ~present & _compare(None, operator, operand)
+            mask |= self.is_list & ~self._item_mask(~items)
+        else:
+            mask |= self._item_mask(items)
+        return mask
+
+
+class MetadataColumns:
+    """
+    Columnar view of the metadata of many records for vectorized filtering. Columns
+    are built on first use of a field and cached, so the metadata must not change
+    afterwards (build a new instance instead).
+    """
+
+    def __init__(self, metadatas: Sequence[Dict[str, Any]]):
+        self.metadatas = metadatas
+        self._columns: Dict[str, _FieldColumn] = {}
+
+    def __len__(self) -> int:
+        return len(self.metadatas)
+
+    def column(self, field: str) -> _FieldColumn:
+        column = self._columns.get(field)
+        if column is None:
+            column = self._columns[field] = _FieldColumn(self.metadatas, field)
+        return column
+
+    def mask(self, pinecone_filter: Dict[str, Any]) -> np.ndarray:
+        """Boolean mask of the records matching a filter (an empty filter matches all)"""
+        mask = np.ones(len(self.metadatas), dtype=bool)
+        for key, condition in (pinecone_filter or {}).items():
+            if key == "$and":
+                for sub in condition:
+                    mask &= self.mask(sub)
+            elif key == "$or":
+                branches = np.zeros(len(self.metadatas), dtype=bool)
+                for sub in condition:
+                    branches |= self.mask(sub)
+                mask &= branches
+            elif key.startswith("$"):
+                raise ValueError(f"Unsupported logical operator: {key}")
+            else:
+                if not isinstance(condition, dict):
+                    condition = {"$eq": condition}
+                column = self.column(key)
+                for operator, operand in condition.items():
+                    mask &= column.mask(operator, operand)
+        return mask
@@ -1,49 +1,70 @@
 """
-Natural Language to Pinecone Query Agent using Google Gemini
+Natural Language to Pinecone Query Agent using Google Gemini (or another LLM backend, see llm_backends.py)
 """
 
 import os
-import re
-import json
-from datetime import datetime
-from typing import Dict, Any
+import threading
+import time
+from collections import deque
+from datetime import date
+from typing import Dict, Any, Iterable, List, Optional, Tuple
 
-import google.generativeai as genai
+import numpy as np
 from dotenv import load_dotenv
 
+from distilled_model import DEFAULT_THRESHOLD, DistilledModelCache, get_model_path
+from example_bank import BUILTIN_EXAMPLES, DEFAULT_K, ExampleBank, format_example
+from filter_compiler import FilterValidationError, compile_filter
+from filter_parser import (
+    COMPACT_FORMAT_NOTE, COMPACT_SCHEMA, FilterParseError, JsonObjectScanner, parse_filter_with_repairs
+)
+from filter_log import FilterLog, get_filter_log_path
+from gazetteer import GazetteerCache, get_vocabulary_path
+from llm_backends import LLMBackend, create_backend
+from llm_scheduler import LLMScheduler
+from rate_limiter import estimate_tokens
+from temporal import resolve_temporal
+from vector_types import VectorLike, to_matrix
+
 # Load .env before anything else
 load_dotenv(override=True)
 
 # Load environment variables
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini")
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 PINECONE_ENV = os.getenv("PINECONE_ENV")
 PINECONE_INDEX = os.getenv("PINECONE_INDEX")
 PINECONE_HOST = os.getenv("PINECONE_HOST")
 
-
-
-
-class NL2PineconeAgent:
-    """
-    Agent to convert natural language queries into Pinecone metadata filters using Google Gemini (no fallback).
-    """
-    def __init__(self):
-        if not GEMINI_API_KEY:
-            raise ValueError("GEMINI_API_KEY must be set in the environment.")
-        genai.configure(api_key=GEMINI_API_KEY)
-        self.model = genai.GenerativeModel('gemini-2.5-flash-lite-preview-06-17')
-        self.current_year = datetime.now().year
-        self.current_month = datetime.now().month
-        self.current_day = datetime.now().day
-
-    def _create_system_prompt(self) -> str:
-        # Use string concatenation instead of .format() to avoid curly brace issues
-        return f"""
+# "dynamic" sends the condensed rules plus the FEW_SHOT_K most similar examples,
+# "full" sends every rule and every built-in example
+PROMPT_MODES = ("dynamic", "full")
+PROMPT_MODE = os.getenv("PROMPT_MODE", "dynamic")
+FEW_SHOT_K = int(os.getenv("FEW_SHOT_K", DEFAULT_K))
+
+# "compact" constrains Gemini to the compact filter schema (fewer output tokens),
+# "full" asks for JSON Pinecone filters without a schema
+OUTPUT_FORMATS = ("compact", "full")
+FILTER_OUTPUT = os.getenv("FILTER_OUTPUT", "compact")
+
+# Stream responses and stop reading as soon as the filter object is complete
+GEMINI_STREAMING = os.getenv("GEMINI_STREAMING", "true").lower() in ("1", "true", "yes")
+LATENCY_WINDOW = 1000
+
+# The distilled local model (distilled_model.py) answers when its calibrated confidence
+# reaches DISTILLED_THRESHOLD; the LLM handles the rest. Inactive until a model is trained.
+DISTILLED_MODEL_PATH = get_model_path()
+DISTILLED_THRESHOLD = float(os.getenv("DISTILLED_THRESHOLD", DEFAULT_THRESHOLD))
+# LLM-generated filters are logged here as training data for the distilled model
+FILTER_LOG_PATH = get_filter_log_path()
+# Authors and tags are snapped to values that exist in the index (gazetteer.py)
+VOCABULARY_PATH = get_vocabulary_path()
+
+# The prompt is date-independent: relative dates are emitted symbolically
+# and resolved per request, so generated filters can be cached across days
+FULL_RULES = """
 You are an expert at converting natural language queries into Pinecone metadata filters for article search.
 
-Today's date: {self.current_year}-{self.current_month:02d}-{self.current_day:02d}
-
 METADATA SCHEMA:
   - author: string (e.g., "John Doe") - WHO wrote the article
   - tags: list of strings (e.g., ["sports", "AI"]) - WHAT the article covers/discusses
@@ -53,6 +74,8 @@ METADATA SCHEMA:
 
 OPERATORS: $eq, $ne, $gt, $gte, $lt, $lte, $in, $nin
 
+RELATIVE DATES: "$date": one of today, yesterday, this_week, last_week, this_month, last_month, this_year, last_year, last_n_days:N, last_n_weeks:N, last_n_months:N, last_n_years:N
+
 CRITICAL RULES:
 1. AUTHOR IDENTIFICATION: Only use "author" field when query explicitly mentions WHO WROTE the article with phrases like "by [name]", "written by [name]", "articles by [name]", "posts by [name]".
 
@@ -67,7 +90,7 @@ CRITICAL RULES:
 
 5. TECHNICAL TERM PRESERVATION: Keep established technical terms intact only when they are widely recognized as single concepts: "machine learning", "web development", "cloud computing", "user experience".
 
-6. DATE PARSING: Use published_year/month/day for temporal filters. "last year" = current_year-1, "this month" = current_month, "May 2024" = year:2024, month:5.
+6. DATE PARSING: Use published_year/month/day for explicit dates: "May 2024" = year:2024, month:5. Never compute relative dates yourself; express them with the "$date" key instead: "last year" = {"$date": "last_year"}, "this month" = {"$date": "this_month"}, "past 30 days" = {"$date": "last_n_days:30"}. A month combined with a relative year keeps its month field: "June last year" = {"$date": "last_year", "published_month": {"$eq": 6}}.
 
 7. EXPLICIT CONJUNCTION SEPARATION: When query uses explicit "and" between concepts, always treat as separate tags: "technology and business" → ["technology", "business"].
 
@@ -76,43 +99,342 @@ CRITICAL RULES:
 9. PROPER NAME HANDLING: Always keep proper names, brand names, and established technical terms intact as single tags.
 
 10. SEARCH OPTIMIZATION: Prioritize breaking down general terms into components for better search recall, unless they form well-established technical or proper noun phrases.
+"""
 
-EXAMPLES:
-Query: articles by Dr. Smith about web development from 2023
-Output: {{"author": "Dr. Smith", "tags": {{"$in": ["web development"]}}, "published_year": {{"$eq": 2023}}}}
-
-Query: find posts about World Cup 2022
-Output: {{"tags": {{"$in": ["World Cup 2022"]}}}}
-
-Query: show me posts about Lakers from December
-Output: {{"tags": {{"$in": ["Lakers"]}}, "published_month": {{"$eq": 12}}}}
-
-Query: articles about basketball training methods
-Output: {{"tags": {{"$in": ["basketball", "training", "methods"]}}}}
-
-Query: posts about business news
-Output: {{"tags": {{"$in": ["business", "news"]}}}}
-
-Query: find all articles by Sarah Wilson
-Output: {{"author": "Sarah Wilson"}}
-
-Query: show me articles from January 15th, 2023
-Output: {{"published_year": {{"$eq": 2023}}, "published_month": {{"$eq": 1}}, "published_day": {{"$eq": 15}}}}
-
-Query: posts about Tom Brady and Patriots history
-Output: {{"tags": {{"$in": ["Tom Brady", "Patriots", "history"]}}}}
-
-Convert the following query to a Pinecone metadata filter. Return ONLY valid JSON, no explanations.
+# The same rules in a few lines; the selected examples carry the rest
+CONDENSED_RULES = """
+Convert article search queries into Pinecone metadata filters.
+Fields: author (string), tags (list of strings, use $in), published_year, published_month (1-12), published_day (integers, use $eq).
+Rules:
+- author only for who wrote it ("by X", "written by X"); topics, subjects and people mentioned go in tags.
+- Years that belong to a topic stay in the tag ("IPL 2025"); "from 2023"/"in 2024" is published_year.
+- Split general phrases and "and"-joined concepts into separate tags; keep proper names and established terms ("machine learning") intact.
+- Relative dates use "$date": today, yesterday, this_week, last_week, this_month, last_month, this_year, last_year, last_n_days:N, last_n_weeks:N, last_n_months:N, last_n_years:N. Never compute them yourself.
+- Only include fields the query mentions.
 """
 
+INSTRUCTION = "Convert the following query to a Pinecone metadata filter. Return ONLY valid JSON, no explanations."
+
 
-    def generate_pinecone_filter(self, natural_language_query: str) -> Dict[str, Any]:
-        prompt = self._create_system_prompt() + f"\n\nQuery: {natural_language_query}"
-        response = self.model.generate_content(prompt)
-        response_text = response.text.strip()
-        # Use a raw string for the regex to avoid escape sequence issues
-        json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-        if json_match:
-            return json.loads(json_match.group(0))
-        raise ValueError("Gemini did not return a valid JSON filter.")
+class NL2PineconeAgent:
+    """
+    Agent to convert natural language queries into Pinecone metadata filters using Google Gemini (no fallback)
+    or another LLM backend chosen per deployment (LLM_BACKEND) or per call.
+    """
+    def __init__(
+        self,
+        example_bank: Optional[ExampleBank] = None,
+        prompt_mode: str = PROMPT_MODE,
+        few_shot_k: int = FEW_SHOT_K,
+        output_format: str = FILTER_OUTPUT,
+        streaming: bool = GEMINI_STREAMING,
+        backend: str = LLM_BACKEND,
+        distilled_model_path: Optional[str] = DISTILLED_MODEL_PATH,
+        distilled_threshold: float = DISTILLED_THRESHOLD,
+        filter_log_path: Optional[str] = FILTER_LOG_PATH,
+        vocabulary_path: Optional[str] = VOCABULARY_PATH,
+        scheduler: Optional[LLMScheduler] = None,
+    ):
+        if prompt_mode not in PROMPT_MODES:
+            raise ValueError(f"PROMPT_MODE must be one of {PROMPT_MODES}, got {prompt_mode!r}")
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"FILTER_OUTPUT must be one of {OUTPUT_FORMATS}, got {output_format!r}")
+        self.default_backend = backend
+        self.backends: Dict[str, LLMBackend] = {}
+        self._backends_lock = threading.Lock()
+        # Create the default backend now so a misconfigured deployment fails at startup
+        self.get_backend(backend)
+        if example_bank is None and prompt_mode == "dynamic":
+            from embedding_client import EmbeddingClient
+            example_bank = ExampleBank.default(EmbeddingClient().embed_batch)
+        self.example_bank = example_bank
+        self.prompt_mode = prompt_mode
+        self.few_shot_k = few_shot_k
+        self.output_format = output_format
+        self.response_schema = COMPACT_SCHEMA if output_format == "compact" else None
+        self.prompt_stats: Dict[str, Dict[str, int]] = {}
+        self.parse_stats: Dict[str, Any] = {"parsed": 0, "repaired": 0, "failed": 0, "invalid": 0, "repairs": {}}
+        self.streaming = streaming
+        self.latency_stats: Dict[str, Dict[str, Any]] = {}
+        self.distilled = DistilledModelCache(distilled_model_path) if distilled_model_path else None
+        self.distilled_threshold = distilled_threshold
+        self.distilled_stats = {"lookups": 0, "served": 0, "fallbacks": 0}
+        self.filter_log = FilterLog(filter_log_path) if filter_log_path else None
+        self.gazetteer = GazetteerCache(vocabulary_path) if vocabulary_path else None
+        # Calls to backends with a quota wait for a slot in their priority lane (llm_scheduler.py)
+        self.scheduler = scheduler
+        self._stats_lock = threading.Lock()
+
+    def get_backend(self, name: Optional[str] = None) -> LLMBackend:
+        """Backend by name (default: LLM_BACKEND), created on first use"""
+        name = name or self.default_backend
+        with self._backends_lock:
+            if name not in self.backends:
+                self.backends[name] = create_backend(name)
+            return self.backends[name]
+
+    def _render_examples(self, examples: Iterable[Dict[str, Any]]) -> str:
+        compact = self.output_format == "compact"
+        rendered = "\n\n".join(format_example(example, compact) for example in examples)
+        return f"{COMPACT_FORMAT_NOTE}\n\nEXAMPLES:\n{rendered}" if compact else f"EXAMPLES:\n{rendered}"
 
+    def _create_system_prompt(self) -> str:
+        """Full prompt: every rule and every built-in example"""
+        return f"{FULL_RULES}\n{self._render_examples(BUILTIN_EXAMPLES)}\n\n{INSTRUCTION}\n"
+
+    def _create_dynamic_prompt(self, examples: List[Dict[str, Any]]) -> str:
+        """Condensed rules plus the examples selected for this query"""
+        return f"{CONDENSED_RULES}\n{self._render_examples(examples)}\n\n{INSTRUCTION}\n"
+
+    def build_prompt(
+        self,
+        natural_language_query: str,
+        query_vector: Optional[VectorLike] = None,
+        prompt_mode: Optional[str] = None,
+        exclude_examples: Iterable[str] = (),
+    ) -> Tuple[str, str]:
+        """
+        Prompt for a query and the mode actually used. Dynamic prompts select examples by
+        ``query_vector`` (embedded here if not given) and fall back to the full prompt when
+        the example bank cannot be embedded.
+        """
+        mode = prompt_mode or self.prompt_mode
+        if mode == "dynamic" and self.example_bank is not None:
+            try:
+                if query_vector is None:
+                    query_vector = to_matrix(self.example_bank.embed_batch([natural_language_query]))[0]
+                examples = self.example_bank.select(query_vector, self.few_shot_k, exclude_examples)
+                return self._create_dynamic_prompt(examples) + f"\n\nQuery: {natural_language_query}", "dynamic"
+            except Exception as e:
+                print(f"⚠️  Example selection failed, using the full prompt: {e}")
+        return self._create_system_prompt() + f"\n\nQuery: {natural_language_query}", "full"
+
+    def _record_usage(self, mode: str, prompt: str, usage: Optional[Dict[str, int]], output_text: str = "") -> None:
+        # A stream cancelled before its last chunk never receives usage; fall back to estimates
+        usage = usage or {}
+        prompt_tokens = usage.get("prompt_tokens") or estimate_tokens(prompt)
+        output_tokens = usage.get("output_tokens") or estimate_tokens(output_text)
+        with self._stats_lock:
+            stats = self.prompt_stats.setdefault(mode, {"calls": 0, "prompt_tokens": 0, "output_tokens": 0})
+            stats["calls"] += 1
+            stats["prompt_tokens"] += prompt_tokens
+            stats["output_tokens"] += output_tokens
+
+    def _record_parse(self, repairs: List[str]) -> None:
+        # Normalizing bare values is routine, not a repair of a broken response
+        repairs = [repair for repair in repairs if repair != "normalized"]
+        with self._stats_lock:
+            self.parse_stats["parsed"] += 1
+            if repairs:
+                self.parse_stats["repaired"] += 1
+            for repair in repairs:
+                self.parse_stats["repairs"][repair] = self.parse_stats["repairs"].get(repair, 0) + 1
+
+    def get_prompt_stats(self) -> Dict[str, Any]:
+        """Calls and average prompt/output tokens per prompt mode"""
+        with self._stats_lock:
+            return {
+                "prompt_mode": self.prompt_mode,
+                "few_shot_k": self.few_shot_k,
+                "output_format": self.output_format,
+                "examples": len(self.example_bank.examples) if self.example_bank is not None else 0,
+                "modes": {
+                    mode: {
+                        **stats,
+                        "avg_prompt_tokens": stats["prompt_tokens"] / stats["calls"],
+                        "avg_output_tokens": stats["output_tokens"] / stats["calls"],
+                    }
+                    for mode, stats in self.prompt_stats.items()
+                },
+                "parser": {**self.parse_stats, "repairs": dict(self.parse_stats["repairs"])},
+                "distilled": {
+                    **self.distilled_stats,
+                    "model_loaded": self.distilled is not None and self.distilled.model is not None,
+                    "threshold": self.distilled_threshold,
+                },
+            }
+
+    def generate_symbolic_filter(
+        self,
+        natural_language_query: str,
+        query_vector: Optional[VectorLike] = None,
+        prompt_mode: Optional[str] = None,
+        exclude_examples: Iterable[str] = (),
+        backend: Optional[str] = None,
+        lane: str = "interactive",
+    ) -> Dict[str, Any]:
+        """
+        Filter as generated by the LLM, relative dates still symbolic (``$date``); safe to cache.
+        When streaming, the response is fed into an incremental JSON scanner and the call
+        returns as soon as the top-level object closes and parses; the rest of the stream is cancelled.
+
+        Without an explicit ``backend``, the distilled local model answers first and the
+        LLM is only called when the model's confidence is below DISTILLED_THRESHOLD.
+        Authors and tags are then snapped to the values known to exist in the index, and the
+        result is compiled to its canonical form; filters that do not fit the metadata schema
+        raise FilterValidationError.
+
+        With a scheduler, calls to quota-limited backends first wait for a slot in ``lane``
+        ("interactive", "batch" or "background").
+        """
+        if backend is None:
+            distilled_filter = self.distilled_filter(natural_language_query)
+            if distilled_filter is not None:
+                return distilled_filter
+
+        prompt, mode = self.build_prompt(natural_language_query, query_vector, prompt_mode, exclude_examples)
+        llm = self.get_backend(backend)
+        if self.scheduler is not None:
+            llm = self.scheduler.wrap(llm, lane)
+        start = time.perf_counter()
+        chunks = llm.generate(prompt, natural_language_query, self.response_schema, stream=self.streaming)
+        scanner = JsonObjectScanner()
+        first_token: Optional[float] = None
+        pinecone_filter: Optional[Dict[str, Any]] = None
+        usage = None
+        attempted = False
+        try:
+            for text, chunk_usage in chunks:
+                usage = chunk_usage or usage
+                if first_token is None:
+                    first_token = time.perf_counter() - start
+                candidate = scanner.feed(text)
+                if candidate is None or attempted or not self.streaming:
+                    continue
+                attempted = True
+                try:
+                    pinecone_filter, repairs = parse_filter_with_repairs(candidate)
+                except FilterParseError:
+                    # Not a usable object; read the whole response and let the repair parser try
+                    continue
+                self._record_parse(repairs)
+                break
+        finally:
+            chunks.close()
+
+        self._record_usage(mode, prompt, usage, scanner.text)
+        early_stop = pinecone_filter is not None
+        if pinecone_filter is None:
+            pinecone_filter = self._parse(scanner.text)
+        try:
+            pinecone_filter = compile_filter(pinecone_filter)
+        except FilterValidationError:
+            with self._stats_lock:
+                self.parse_stats["invalid"] += 1
+            raise
+        self._record_latency(llm.name, first_token if self.streaming else None, time.perf_counter() - start, early_stop)
+        if self.filter_log is not None and llm.name not in ("replay", "distilled"):
+            try:
+                self.filter_log.append(natural_language_query, pinecone_filter, llm.name)
+            except OSError as e:
+                print(f"⚠️  Could not log generated filter: {e}")
+        return compile_filter(self._snap(natural_language_query, pinecone_filter))
+
+    def _snap(self, natural_language_query: str, pinecone_filter: Dict[str, Any]) -> Dict[str, Any]:
+        if self.gazetteer is None:
+            return pinecone_filter
+        return self.gazetteer.snap_filter(pinecone_filter, natural_language_query)
+
+    def distilled_filter(self, natural_language_query: str) -> Optional[Dict[str, Any]]:
+        """
+        The distilled model's filter, snapped and compiled, when it is confident enough;
+        None when the LLM has to answer. Callers that report the filter's source use this
+        and then call ``generate_symbolic_filter`` with an explicit backend.
+        """
+        distilled_filter = self._try_distilled(natural_language_query)
+        if distilled_filter is None:
+            return None
+        return compile_filter(self._snap(natural_language_query, distilled_filter))
+
+    def _try_distilled(self, natural_language_query: str) -> Optional[Dict[str, Any]]:
+        """The distilled model's filter if it is confident enough, None to fall back to the LLM"""
+        model = self.distilled.get() if self.distilled is not None else None
+        if model is None:
+            return None
+        start = time.perf_counter()
+        pinecone_filter, confidence = model.predict(natural_language_query)
+        # Without a calibration the confidence is a raw sequence probability, not a chance of being right
+        served = model.calibration is not None and confidence >= self.distilled_threshold
+        if served:
+            try:
+                pinecone_filter = compile_filter(pinecone_filter)
+            except FilterValidationError:
+                # A confident but invalid prediction falls back like an unsure one
+                served = False
+        with self._stats_lock:
+            self.distilled_stats["lookups"] += 1
+            self.distilled_stats["served" if served else "fallbacks"] += 1
+        if not served:
+            return None
+        self._record_latency("distilled", None, time.perf_counter() - start, False)
+        return pinecone_filter
+
+    def _parse(self, text: str) -> Dict[str, Any]:
+        try:
+            pinecone_filter, repairs = parse_filter_with_repairs(text)
+        except FilterParseError:
+            with self._stats_lock:
+                self.parse_stats["failed"] += 1
+            raise
+        self._record_parse(repairs)
+        return pinecone_filter
+
+    def _record_latency(self, backend: str, ttft: Optional[float], time_to_filter: float, early_stop: bool) -> None:
+        with self._stats_lock:
+            stats = self.latency_stats.setdefault(backend, {
+                "calls": 0,
+                "early_stops": 0,
+                "ttft": deque(maxlen=LATENCY_WINDOW),
+                "time_to_filter": deque(maxlen=LATENCY_WINDOW),
+            })
+            stats["calls"] += 1
+            stats["early_stops"] += early_stop
+            if ttft is not None:
+                stats["ttft"].append(ttft)
+            stats["time_to_filter"].append(time_to_filter)
+
+    def get_latency_stats(self) -> Dict[str, Any]:
+        """Time to first token and time to a valid filter (ms) over the recent calls, per backend"""
+        def summary(samples: List[float]) -> Dict[str, float]:
+            if not samples:
+                return {}
+            millis = np.asarray(samples) * 1000
+            return {
+                "avg_ms": float(millis.mean()),
+                "p50_ms": float(np.percentile(millis, 50)),
+                "p95_ms": float(np.percentile(millis, 95)),
+                "max_ms": float(millis.max()),
+            }
+
+        with self._stats_lock:
+            snapshot = {
+                backend: (stats["calls"], stats["early_stops"], list(stats["ttft"]), list(stats["time_to_filter"]))
+                for backend, stats in self.latency_stats.items()
+            }
+        return {
+            "streaming": self.streaming,
+            "default_backend": self.default_backend,
+            "backends": {
+                backend: {
+                    "calls": calls,
+                    "early_stops": early_stops,
+                    "ttft": summary(ttft),
+                    "time_to_filter": summary(time_to_filter),
+                }
+                for backend, (calls, early_stops, ttft, time_to_filter) in snapshot.items()
+            },
+        }
+
+    def generate_pinecone_filter(
+        self,
+        natural_language_query: str,
+        today: Optional[date] = None,
+        backend: Optional[str] = None,
+        prompt_mode: Optional[str] = None,
+        lane: str = "interactive",
+    ) -> Dict[str, Any]:
+        """Concrete Pinecone filter, with relative dates resolved for ``today`` (default: the current date)"""
+        symbolic_filter = self.generate_symbolic_filter(
+            natural_language_query, prompt_mode=prompt_mode, backend=backend, lane=lane
+        )
+        return compile_filter(resolve_temporal(symbolic_filter, today))
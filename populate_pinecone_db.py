@@ -1,30 +1,22 @@
 """
 Script to generate and upsert 100 sample documents into Pinecone using Gemini for content and metadata generation.
+
+Gemini calls run concurrently under a token-bucket rate limiter (GEMINI_RPM / GEMINI_TPM),
+and finished samples are embedded and upserted while generation is still in flight.
 """
 import os
 import random
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
-from typing import List
+from typing import Any, Dict, List, Tuple
 import google.generativeai as genai
 from pinecone import Pinecone
 from dotenv import load_dotenv
-
-
-def is_running_in_docker() -> bool:
-    """Check if the application is running inside a Docker container"""
-    return os.path.exists('/.dockerenv')
-
-
-def get_ollama_url() -> str:
-    """Get the appropriate Ollama URL based on the environment"""
-    base_url = os.getenv("OLLAMA_EMBED_URL", "http://localhost:11434/api/embeddings")
-    
-    if is_running_in_docker():
-        # Replace localhost with host.docker.internal for Docker environment
-        base_url = base_url.replace("localhost", "host.docker.internal")
-    
-    return base_url
+from upsert_engine import UpsertEngine, UpsertStats
+from embedding_client import EmbeddingClient
+from hot_tier import update_local_indexes
+from rate_limiter import RateLimiter, estimate_tokens, is_rate_limit_error
 
 
 # Load environment variables
@@ -35,17 +27,39 @@ PINECONE_ENV = os.getenv("PINECONE_ENV")
 PINECONE_INDEX = os.getenv("PINECONE_INDEX")
 PINECONE_HOST = os.getenv("PINECONE_HOST")
 
-assert GEMINI_API_KEY, "GEMINI_API_KEY not set"
-assert PINECONE_API_KEY, "PINECONE_API_KEY not set"
-assert PINECONE_INDEX, "PINECONE_INDEX not set"
+# Gemini quota (free tier defaults) and generation concurrency
+GEMINI_RPM = float(os.getenv("GEMINI_RPM", 15))
+GEMINI_TPM = float(os.getenv("GEMINI_TPM", 1000000))
+GEMINI_CONCURRENCY = int(os.getenv("GEMINI_CONCURRENCY", 8))
+EXPECTED_OUTPUT_TOKENS = 200  # A 3-5 sentence summary
+UPSERT_FLUSH_SIZE = 15  # Finished samples embedded and upserted together
 
-# Configure Gemini
-genai.configure(api_key=GEMINI_API_KEY)
-gemini = genai.GenerativeModel('gemini-2.0-flash-001')
+# Clients are configured in main() so that the sample model below (authors, tags,
+# random_date) can be imported without credentials, e.g. by the synthetic corpus generator
+gemini = None
+index = None
+upsert_engine = None
 
-# Configure Pinecone (new SDK)
-pc = Pinecone(api_key=PINECONE_API_KEY)
-index = pc.Index(PINECONE_INDEX)
+
+def configure_clients():
+    """Configure the Gemini model, the Pinecone index and the upsert engine"""
+    global gemini, index, upsert_engine
+    
+    assert GEMINI_API_KEY, "GEMINI_API_KEY not set"
+    assert PINECONE_API_KEY, "PINECONE_API_KEY not set"
+    assert PINECONE_INDEX, "PINECONE_INDEX not set"
+    
+    # Configure Gemini
+    genai.configure(api_key=GEMINI_API_KEY)
+    gemini = genai.GenerativeModel('gemini-2.0-flash-001')
+    
+    # Configure Pinecone (new SDK)
+    pc = Pinecone(api_key=PINECONE_API_KEY)
+    index = pc.Index(PINECONE_INDEX)
+    upsert_engine = UpsertEngine(index, max_workers=int(os.getenv("UPSERT_WORKERS", 4)))
+
+# Ollama embeddings, load-balanced across OLLAMA_EMBED_URLS
+embedding_client = EmbeddingClient()
 
 # Sample authors and tags
 authors = [
@@ -65,82 +79,94 @@ def random_date(start_year=2022, end_year=2025):
     d = start + timedelta(days=random_days)
     return d.year, d.month, d.day
 
-def generate_sample(i: int):
+def plan_sample(i: int) -> Dict[str, Any]:
+    """Pick the author, tags and date of a sample (done up front so generation order does not matter)"""
     author = random.choice(authors)
     tag_sample = random.sample(tags, k=random.randint(1, 3))
     year, month, day = random_date()
-    prompt = (
-        f"Write a 3-5 sentence article summary about {', '.join(tag_sample)} "
-        f"by {author} published on {year}-{month:02d}-{day:02d}. "
-        f"Do not include any metadata, just the summary."
-    )
-    try:
-        response = gemini.generate_content(prompt)
-        content = response.text.strip()
-        print(f"Generated content for sample {i}: {content[:50]}...")
-    except Exception as e:
-        print(f"Gemini API failed for sample {i}: {e}")
-        content = f"Sample article about {', '.join(tag_sample)} by {author}."
-    # Use Ollama embedding model to generate a real vector
-    import requests
-    ollama_url = get_ollama_url()
-    emb_response = requests.post(
-        ollama_url,
-        json={"model": "nomic-embed-text", "prompt": content}
-    )
-    emb_response.raise_for_status()
-    emb_json = emb_response.json()
-    vector = emb_json.get("embedding")
-    if not vector or not isinstance(vector, list):
-        raise ValueError(f"Ollama returned invalid embedding: {emb_json}")
-    print(f"Embedding dimension: {len(vector)}")
-    
-    # Store content in metadata as a separate field
-    metadata = {
+    return {
+        "id": f"sample-{i}",
         "author": author,
         "tags": tag_sample,
         "published_year": year,
         "published_month": month,
         "published_day": day,
-        "content": content  # Store the generated content in metadata
-    }
-    
-    return {
-        "id": f"sample-{i}",
-        "values": vector,
-        "metadata": metadata
     }
 
+def generate_content(plan: Dict[str, Any], limiter: RateLimiter, max_attempts: int = 5) -> str:
+    """Generate the article summary of a sample with Gemini, within the rate limiter's budget"""
+    prompt = (
+        f"Write a 3-5 sentence article summary about {', '.join(plan['tags'])} "
+        f"by {plan['author']} published on "
+        f"{plan['published_year']}-{plan['published_month']:02d}-{plan['published_day']:02d}. "
+        f"Do not include any metadata, just the summary."
+    )
+    estimate = estimate_tokens(prompt) + EXPECTED_OUTPUT_TOKENS
+    for attempt in range(1, max_attempts + 1):
+        limiter.acquire(estimate)
+        try:
+            response = gemini.generate_content(prompt)
+            content = response.text.strip()
+        except Exception as e:
+            if is_rate_limit_error(e) and attempt < max_attempts:
+                pause = limiter.on_throttled()
+                print(f"⏳ Rate limited on {plan['id']} (attempt {attempt}), backing off {pause:.1f}s")
+                continue
+            print(f"Gemini API failed for {plan['id']}: {e}")
+            break
+        usage = getattr(response, "usage_metadata", None)
+        limiter.reconcile(estimate, getattr(usage, "total_token_count", None))
+        limiter.on_success()
+        print(f"Generated content for {plan['id']}: {content[:50]}...")
+        return content
+    return f"Sample article about {', '.join(plan['tags'])} by {plan['author']}."
+
+def embed_and_upsert(samples: List[Tuple[Dict[str, Any], str]]) -> UpsertStats:
+    """Embed finished samples with Ollama and upsert them to Pinecone"""
+    vectors = embedding_client.embed_batch([content for _, content in samples])
+    records = []
+    for (plan, content), vector in zip(samples, vectors):
+        # Store content in metadata as a separate field
+        metadata = {key: value for key, value in plan.items() if key != "id"}
+        metadata["content"] = content
+        records.append((plan["id"], vector, metadata))
+    stats = upsert_engine.upsert(records)
+    print(f"Upserted {len(records)} samples to Pinecone: {stats.summary()}")
+    update_local_indexes(records, failed_ids=stats.failed_ids)
+    return stats
+
 def main():
+    configure_clients()
+    
     total_samples = 100
-    batch_size = 15  # Gemini rate limit: 15 requests per minute
-    samples = []
+    limiter = RateLimiter(GEMINI_RPM, GEMINI_TPM)
+    plans = [plan_sample(i) for i in range(total_samples)]
     
-    print(f"Generating {total_samples} samples in batches of {batch_size} (rate limit: 15/min)")
+    print(f"Generating {total_samples} samples with up to {GEMINI_CONCURRENCY} concurrent Gemini calls "
+          f"(budget: {GEMINI_RPM:.0f} requests/min, {GEMINI_TPM:.0f} tokens/min)")
     
-    for batch_start in range(0, total_samples, batch_size):
-        batch_end = min(batch_start + batch_size, total_samples)
-        batch_samples = []
-        
-        print(f"\n--- Processing batch {batch_start//batch_size + 1}: samples {batch_start+1}-{batch_end} ---")
-        
-        for i in range(batch_start, batch_end):
-            sample = generate_sample(i)
-            batch_samples.append((sample["id"], sample["values"], sample["metadata"]))
-            samples.append((sample["id"], sample["values"], sample["metadata"]))
-            print(f"Prepared sample {i+1}/{total_samples} (id: {sample['id']})")
-        
-        # Upsert this batch to Pinecone
-        if batch_samples:
-            index.upsert(vectors=batch_samples)
-            print(f"Upserted batch of {len(batch_samples)} samples to Pinecone")
-        
-        # Wait 60 seconds before next batch (except for the last batch)
-        if batch_end < total_samples:
-            print(f"Waiting 60 seconds for rate limit reset...")
-            time.sleep(60)
+    start = time.perf_counter()
+    finished: List[Tuple[Dict[str, Any], str]] = []
+    upserts = []
+    upserted = 0
+    # Generation runs in the pool below while a single pipeline thread embeds and
+    # upserts finished samples, so Pinecone writes overlap with calls still in flight
+    with ThreadPoolExecutor(max_workers=1) as pipeline, \
+            ThreadPoolExecutor(max_workers=GEMINI_CONCURRENCY) as generators:
+        futures = {generators.submit(generate_content, plan, limiter): plan for plan in plans}
+        for future in as_completed(futures):
+            finished.append((futures[future], future.result()))
+            if len(finished) >= UPSERT_FLUSH_SIZE:
+                upserts.append(pipeline.submit(embed_and_upsert, finished))
+                finished = []
+        if finished:
+            upserts.append(pipeline.submit(embed_and_upsert, finished))
+        for future in upserts:
+            upserted += future.result().vectors
     
-    print(f"\n✅ Successfully generated and upserted all {len(samples)} samples to Pinecone index '{PINECONE_INDEX}'")
+    elapsed = time.perf_counter() - start
+    print(f"\n✅ Successfully generated and upserted {upserted} samples to Pinecone index '{PINECONE_INDEX}' "
+          f"in {elapsed:.1f}s ({limiter.throttled} rate-limit backoffs)")
     print(f"Database now contains fresh content generated by Gemini!")
 
 if __name__ == "__main__":
@@ -6,6 +6,7 @@ import os
 import csv
 import time
 import json
+import hashlib
 import requests
 from datetime import datetime
 from typing import List, Dict, Any
@@ -13,23 +14,19 @@ from urllib.parse import urlparse
 from pinecone import Pinecone
 from dotenv import load_dotenv
 import re
+import numpy as np
 from bs4 import BeautifulSoup
+from upsert_engine import UpsertEngine
+from hot_tier import update_local_indexes
+from dedup import NearDuplicateIndex, DEFAULT_THRESHOLD
+from embedding_client import EmbeddingClient
+from tag_normalization import parse_tags
+from chunking import split_into_chunks, make_chunk_id, parse_chunk_id, DEFAULT_CHUNK_SIZE, DEFAULT_CHUNK_OVERLAP
 
+CSV_ID_PREFIX = "csv-"
+DEFAULT_MANIFEST_PATH = "ingestion_manifest.json"
 
-def is_running_in_docker() -> bool:
-    """Check if the application is running inside a Docker container"""
-    return os.path.exists('/.dockerenv')
-
-
-def get_ollama_url() -> str:
-    """Get the appropriate Ollama URL based on the environment"""
-    base_url = os.getenv("OLLAMA_EMBED_URL", "http://localhost:11434/api/embeddings")
-    
-    if is_running_in_docker():
-        # Replace localhost with host.docker.internal for Docker environment
-        base_url = base_url.replace("localhost", "host.docker.internal")
-    
-    return base_url
+embedding_client = EmbeddingClient()
 
 
 def clean_text(text: str) -> str:
@@ -156,131 +153,14 @@ def scrape_content_from_url(url: str) -> str:
         return ""
 
 
-def generate_embedding(text: str) -> List[float]:
-    """Generate embedding for text using Ollama"""
-    if not text.strip():
-        raise ValueError("Cannot generate embedding for empty text")
-    
-    try:
-        ollama_url = get_ollama_url()
-        response = requests.post(
-            ollama_url,
-            json={"model": "nomic-embed-text", "prompt": text},
-            timeout=30
-        )
-        response.raise_for_status()
-        emb_json = response.json()
-        vector = emb_json.get("embedding")
-        
-        if not vector or not isinstance(vector, list):
-            raise ValueError(f"Ollama returned invalid embedding: {emb_json}")
-        
-        print(f"✅ Generated embedding with dimension: {len(vector)}")
-        return vector
-        
-    except Exception as e:
-        raise Exception(f"Error generating embedding: {str(e)}")
-
-
-def parse_tags(tags_str: str) -> List[str]:
-    """Parse tags from various formats in CSV and normalize them"""
-    if not tags_str:
-        return []
-    
-    # Handle JSON array format like ["tag1", "tag2"]
-    if tags_str.startswith('[') and tags_str.endswith(']'):
-        try:
-            parsed_tags = json.loads(tags_str)
-            if isinstance(parsed_tags, list):
-                # Clean up hashtags and quotes
-                cleaned_tags = []
-                for tag in parsed_tags:
-                    if isinstance(tag, str):
-                        tag = tag.strip().replace('#', '').replace('"', '')
-                        if tag:
-                            cleaned_tags.extend(normalize_tag(tag))
-                return cleaned_tags
-        except json.JSONDecodeError:
-            pass
-    
-    # Handle comma-separated format
-    tags = [tag.strip().replace('#', '').replace('"', '') for tag in tags_str.split(',')]
-    normalized_tags = []
-    for tag in tags:
-        if tag:
-            normalized_tags.extend(normalize_tag(tag))
-    return normalized_tags
-
-
-def normalize_tag(tag: str) -> List[str]:
+def generate_embeddings(texts: List[str], batch_size: int = 16) -> np.ndarray:
     """
-    Normalize tags according to specific rules:
-    - Keep event names with years intact (e.g., IPL2025 -> IPL 2025)
-    - Separate combined words (e.g., RohitSharma -> Rohit Sharma)
-    - Handle special cases like IPLInjuries -> ["IPL", "injuries"]
-    - Keep abbreviations and specific terms intact
+    Generate float32 embeddings (one row per text) for several texts, ``batch_size`` per Ollama request.
+    Requests are load-balanced across all configured Ollama endpoints.
     """
-    if not tag:
-        return []
-    
-    # Special case mappings for compound tags
-    special_cases = {
-        'IPLInjuries': ['IPL', 'injuries'],
-        'IPLRecords': ['IPL', 'records'],
-        'CricketForm': ['cricket', 'form'],
-        'CricketHealth': ['cricket', 'health'],
-        'SportsPolitics': ['sports', 'politics'],
-        'IndiaSports': ['India', 'sports'],
-        'CelebrityNews': ['celebrity', 'news'],
-        'BangladeshCricket': ['Bangladesh', 'cricket'],
-        'IPLHistory': ['IPL', 'history'],
-        'RRvsMI': ['RR', 'MI']  # Team vs team should split to separate teams
-    }
-    
-    # Terms that should NOT be split (abbreviations, brand names, etc.)
-    no_split_terms = {
-        'BallonDor', 'RCB', 'DRS', 'IPL', 'CSK', 'MI', 'RR', 'SRH', 'KKR', 
-        'GT', 'LSG', 'DC', 'PBKS', 'Barcelona', 'Pickleball', 'Chattogram'
-    }
-    
-    # Check special cases first
-    if tag in special_cases:
-        return special_cases[tag]
-    
-    # Check if it's just a standalone year (skip these)
-    if re.match(r'^20\d{2}$', tag):
-        return []
-    
-    # Handle event names with years (e.g., IPL2025 -> IPL 2025)
-    # Look for pattern: word followed directly by year
-    year_pattern = r'([A-Za-z]+)(20\d{2})$'
-    year_match = re.match(year_pattern, tag)
-    if year_match:
-        event_name = year_match.group(1)
-        year = year_match.group(2)
-        # If the event name is in no-split terms, keep it with the year
-        if event_name in no_split_terms:
-            return [f"{event_name} {year}"]
-        # Otherwise, apply normal processing to the event name and add year
-        processed_event = normalize_tag(event_name)
-        if processed_event:
-            return [f"{processed_event[0]} {year}"]
-        return [f"{event_name} {year}"]
-    
-    # If it's in no-split list, return as-is
-    if tag in no_split_terms:
-        return [tag]
-    
-    # Handle camelCase/PascalCase splitting for names and compound words
-    # Only split when we have a lowercase letter followed by uppercase letter
-    # This preserves abbreviations like "RRvsMI" while splitting "RohitSharma"
-    spaced_tag = re.sub(r'([a-z])([A-Z])', r'\1 \2', tag)
-    
-    # Clean up and return
-    result = spaced_tag.strip()
-    if result:
-        return [result]
-    return []
+    vectors = embedding_client.embed_batch(texts, batch_size=batch_size)
+    print(f"✅ Generated {len(vectors)} embeddings with dimension: {vectors.shape[1] if len(vectors) else 0}")
+    return vectors
 
 
 def parse_date(date_str: str) -> Dict[str, int]:
@@ -308,24 +188,63 @@ def parse_date(date_str: str) -> Dict[str, int]:
         }
 
 
-def truncate_for_embedding(text: str, max_length: int = 8000) -> str:
+def make_doc_id(page_url: str) -> str:
     """
-    Truncate content specifically for embedding generation.
-    Tries to cut at sentence boundaries when possible.
+    Build a stable document id from the page URL.
+    Unlike a row number, the id survives rows being added, removed or reordered.
     """
-    if len(text) <= max_length:
-        return text
-    
-    # Try to cut at a sentence boundary
-    sentences = text[:max_length].split('. ')
-    if len(sentences) > 1:
-        return '. '.join(sentences[:-1]) + '.'
-    else:
-        return text[:max_length]
+    return CSV_ID_PREFIX + hashlib.sha1(page_url.encode('utf-8')).hexdigest()[:16]
+
+
+def compute_source_hash(row: Dict[str, str]) -> str:
+    """Hash the CSV fields of a row so that changed rows can be detected on sync"""
+    fields = [row.get(name, '').strip() for name in ('pageURL', 'title', 'publishedDate', 'author', 'tags')]
+    return hashlib.sha1('\x1f'.join(fields).encode('utf-8')).hexdigest()
 
 
-def process_csv_row(row: Dict[str, str], row_index: int) -> Dict[str, Any]:
-    """Process a single CSV row and return a Pinecone vector"""
+def load_manifest(path: str = DEFAULT_MANIFEST_PATH) -> Dict[str, Dict[str, Any]]:
+    """Load the ingestion manifest mapping doc ids to their source hash and chunk ids"""
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_manifest(manifest: Dict[str, Dict[str, Any]], path: str = DEFAULT_MANIFEST_PATH) -> None:
+    """Write the ingestion manifest"""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+
+def update_manifest(
+    manifest: Dict[str, Dict[str, Any]],
+    vectors: List[tuple],
+    failed_ids: List[str],
+) -> Dict[str, Dict[str, Any]]:
+    """Record successfully upserted documents (all chunks written) in the manifest"""
+    failed_docs = {parse_chunk_id(vector_id)[0] for vector_id in failed_ids}
+    for vector_id, _, metadata in vectors:
+        doc_id = metadata['doc_id']
+        if doc_id in failed_docs:
+            continue
+        entry = manifest.get(doc_id)
+        if entry is None or entry.get('source_hash') != metadata['source_hash']:
+            entry = manifest[doc_id] = {
+                'source_hash': metadata['source_hash'],
+                'pageURL': metadata['pageURL'],
+                'alternate_urls': metadata.get('alternate_urls', []),
+                'chunk_ids': [],
+            }
+        if vector_id not in entry['chunk_ids']:
+            entry['chunk_ids'].append(vector_id)
+    return manifest
+
+
+def scrape_csv_row(row: Dict[str, str], row_index: int) -> Dict[str, Any]:
+    """
+    Scrape the page of a single CSV row and build its document (id, content, metadata).
+    Embedding is a separate step so that near-duplicates can be dropped before it.
+    """
     
     page_url = row.get('pageURL', '').strip()
     title = row.get('title', '').strip()
@@ -349,27 +268,54 @@ def process_csv_row(row: Dict[str, str], row_index: int) -> Dict[str, Any]:
     # Parse tags
     tags = parse_tags(tags_str)
     
-    # Generate embedding from scraped content
-    # Truncate content for embedding to avoid exceeding length limits (8000 chars ~ 2048 tokens)
-    truncated_content = truncate_for_embedding(content, max_length=8000)
-    vector = generate_embedding(truncated_content)
+    doc_id = make_doc_id(page_url)
     
-    # Create metadata (including fields not used for querying)
-    # Store the FULL untruncated content in metadata
+    # Create document metadata (including fields not used for querying)
     metadata = {
         'author': author,
         'tags': tags,
         **date_components,  # published_year, published_month, published_day
         'title': title,     # Not used for querying but stored for reference
         'pageURL': page_url,  # Not used for querying but stored for reference
-        'content': content  # Store full untruncated content
+        'doc_id': doc_id,
+        'source_hash': compute_source_hash(row),
     }
     
-    return {
-        'id': f"csv-{row_index + 1}",
-        'values': vector,
-        'metadata': metadata
-    }
+    return {'id': doc_id, 'content': content, 'metadata': metadata}
+
+
+def embed_document(document: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Split a scraped document into chunks and return one Pinecone vector per chunk.
+    Chunk ids have the form ``<doc_id>#<chunk_index>`` and share the document metadata.
+    """
+    # Split content into overlapping sentence-aware chunks and embed them in batches.
+    # Short inputs embed faster than one long input and keep the tail of long stories.
+    chunk_size = int(os.getenv("CHUNK_SIZE", DEFAULT_CHUNK_SIZE))
+    chunk_overlap = int(os.getenv("CHUNK_OVERLAP", DEFAULT_CHUNK_OVERLAP))
+    embed_batch_size = int(os.getenv("EMBED_BATCH_SIZE", 16))
+    chunks = split_into_chunks(document['content'], max_chars=chunk_size, overlap_chars=chunk_overlap)
+    vectors = generate_embeddings(chunks, batch_size=embed_batch_size)
+    
+    doc_metadata = {**document['metadata'], 'chunk_count': len(chunks)}
+    
+    return [
+        {
+            'id': make_chunk_id(document['id'], chunk_index),
+            'values': vector,
+            'metadata': {
+                **doc_metadata,
+                'chunk_index': chunk_index,
+                'content': chunk  # Store the chunk text the vector was built from
+            }
+        }
+        for chunk_index, (chunk, vector) in enumerate(zip(chunks, vectors))
+    ]
+
+
+def process_csv_row(row: Dict[str, str], row_index: int) -> List[Dict[str, Any]]:
+    """Scrape and embed a single CSV row, returning one Pinecone vector per content chunk"""
+    return embed_document(scrape_csv_row(row, row_index))
 
 
 def main():
@@ -397,9 +343,11 @@ def main():
     print(f"🚀 Starting CSV-based Pinecone population from: {csv_file_path}")
     print(f"📊 Target Pinecone index: {PINECONE_INDEX}")
     
-    # Read and process CSV
-    processed_rows = []
+    # Read and scrape CSV rows, collapsing near-duplicates before paying for embeddings
+    documents = []
+    duplicates = 0
     failed_rows = []
+    dedup_index = NearDuplicateIndex(threshold=float(os.getenv("DEDUP_THRESHOLD", DEFAULT_THRESHOLD)))
     
     with open(csv_file_path, 'r', encoding='utf-8') as csvfile:
         reader = csv.DictReader(csvfile)
@@ -409,16 +357,22 @@ def main():
         
         print(f"📋 Found {total_rows} rows to process")
         
+        documents_by_id = {}
         for row_index, row in enumerate(reader):
             try:
-                vector_data = process_csv_row(row, row_index)
-                processed_rows.append((
-                    vector_data['id'],
-                    vector_data['values'],
-                    vector_data['metadata']
-                ))
+                document = scrape_csv_row(row, row_index)
                 
-                print(f"✅ Processed row {row_index + 1}/{total_rows}: {vector_data['id']}")
+                duplicate = dedup_index.add_or_match(document['id'], document['content'])
+                if duplicate:
+                    canonical_id, similarity = duplicate
+                    canonical = documents_by_id[canonical_id]['metadata']
+                    canonical.setdefault('alternate_urls', []).append(document['metadata']['pageURL'])
+                    duplicates += 1
+                    print(f"♻️  Row {row_index + 1} is a near-duplicate of {canonical_id} "
+                          f"(similarity {similarity:.2f}); stored as alternate URL")
+                elif document['id'] not in documents_by_id:
+                    documents_by_id[document['id']] = document
+                    documents.append(document)
                 
                 # Add a small delay to be respectful to websites
                 time.sleep(1)
@@ -428,30 +382,49 @@ def main():
                 failed_rows.append(row_index + 1)
                 continue
     
-    # Upsert to Pinecone in batches
+    # Embed canonical documents chunk by chunk
+    processed_rows = []
+    processed_docs = 0
+    for document in documents:
+        try:
+            chunk_vectors = embed_document(document)
+            for vector_data in chunk_vectors:
+                processed_rows.append((
+                    vector_data['id'],
+                    vector_data['values'],
+                    vector_data['metadata']
+                ))
+            processed_docs += 1
+            print(f"✅ Embedded {document['id']}: {len(chunk_vectors)} chunks")
+        except Exception as e:
+            print(f"❌ Failed to embed {document['id']}: {e}")
+            failed_rows.append(document['id'])
+    
+    # Upsert to Pinecone in byte-sized parallel batches with retry
+    failed_vectors = []
     if processed_rows:
-        batch_size = 50  # Pinecone batch limit
-        total_batches = (len(processed_rows) + batch_size - 1) // batch_size
+        print(f"\n🔄 Upserting {len(processed_rows)} vectors to Pinecone...")
+        engine = UpsertEngine(index, max_workers=int(os.getenv("UPSERT_WORKERS", 4)))
+        stats = engine.upsert(processed_rows)
+        failed_vectors = stats.failed_ids
+        print(f"📈 Upsert throughput: {stats.summary()}")
         
-        print(f"\n🔄 Upserting {len(processed_rows)} vectors to Pinecone in {total_batches} batches...")
+        # Record what was written so later runs can sync incrementally
+        manifest_path = os.getenv("INGESTION_MANIFEST", DEFAULT_MANIFEST_PATH)
+        save_manifest(update_manifest(load_manifest(manifest_path), processed_rows, failed_vectors), manifest_path)
+        print(f"🗂️  Ingestion manifest updated: {manifest_path}")
         
-        for batch_num in range(total_batches):
-            start_idx = batch_num * batch_size
-            end_idx = min(start_idx + batch_size, len(processed_rows))
-            batch = processed_rows[start_idx:end_idx]
-            
-            try:
-                index.upsert(vectors=batch)
-                print(f"✅ Upserted batch {batch_num + 1}/{total_batches} ({len(batch)} vectors)")
-            except Exception as e:
-                print(f"❌ Failed to upsert batch {batch_num + 1}: {e}")
+        update_local_indexes(processed_rows, failed_ids=failed_vectors)
     
     # Summary
     print(f"\n📊 Summary:")
-    print(f"✅ Successfully processed: {len(processed_rows)} rows")
+    print(f"✅ Successfully processed: {processed_docs} rows ({len(processed_rows)} chunk vectors)")
+    print(f"♻️  Near-duplicates collapsed: {duplicates} rows")
     print(f"❌ Failed to process: {len(failed_rows)} rows")
     if failed_rows:
-        print(f"💥 Failed row numbers: {failed_rows}")
+        print(f"💥 Failed rows: {failed_rows}")
+    if failed_vectors:
+        print(f"💥 Vectors that could not be upserted: {failed_vectors}")
     
     print(f"\n🎉 CSV-based population complete!")
     print(f"💾 Database '{PINECONE_INDEX}' now contains {len(processed_rows)} new vectors from CSV data")
@@ -0,0 +1,159 @@
+"""
+Query intent router: filter-only, semantic-only or hybrid.
+
+Many queries carry nothing beyond their filter ("find all articles by Sarah Wilson",
+"articles from January 15th, 2023"), and others carry no filter at all ("how do
+rate cuts affect startups"). The router tells them apart with cheap lexical cues,
+before any embedding or LLM call:
+
+- filter cues: dates (years, months, days next to a month, relative dates), "by"
+  followed by a name, topic wording ("tagged with", "about", "covering", ...) and
+  the authors and tags of the gazetteer
+- framing words ("find", "all", "articles", "from", ...) that describe a listing
+  rather than its content
+
+A query whose words are all filter cues or framing is **filter-only**: its filter is
+generated without a query embedding and served by a metadata listing, newest first.
+A query with no filter cues and no names is **semantic-only**: it skips the LLM and is
+served by vector search without a filter. Lowercase topics ("machine learning") are
+only recognized through the gazetteer, so without a vocabulary no query is
+semantic-only. Everything else, including any capitalized name the cues do not
+explain, is **hybrid** and takes the full path.
+
+Examples:
+    python query_router.py "find all articles by Sarah Wilson"
+    python query_router.py "how do rate cuts affect startups"
+"""
+import argparse
+import json
+import os
+import re
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from gazetteer import Gazetteer, GazetteerCache, get_vocabulary_path
+from semantic_cache import MONTHS, NAME_STOPWORDS, RELATIVE_DATE_PATTERN, YEAR_PATTERN
+
+ROUTES = ("filter_only", "semantic_only", "hybrid")
+
+_MONTH_NAMES = "|".join(sorted(MONTHS, key=len, reverse=True))
+# Month names and abbreviations, with a day before or after ("January 15th", "15 Jan")
+DATE_PATTERN = re.compile(
+    rf"\b(?:(?:\d{{1,2}}(?:st|nd|rd|th)?\s+(?:of\s+)?)?(?:{_MONTH_NAMES})\.?(?:\s+\d{{1,2}}(?:st|nd|rd|th)?\b)?)\b",
+    re.IGNORECASE,
+)
+AUTHOR_CUE_PATTERN = re.compile(r"\bby\s+([A-Z][\w.\-']*(?:\s+[A-Z][\w.\-']*)*)")
+LOWERCASE_AUTHOR_PATTERN = re.compile(r"\bby\s+[a-z][\w.\-']*(?:\s+[a-z][\w.\-']*)?")
+# Wording that introduces a topic; the topic words themselves stay content
+TAG_CUE_PATTERN = re.compile(
+    r"\b(?:tagged(?:\s+(?:with|as|under))?|about|regarding|covering|mentioning|related\s+to|on\s+the\s+topic\s+of)\b",
+    re.IGNORECASE,
+)
+WORD_PATTERN = re.compile(r"[A-Za-z][\w'’.\-]*|\d+")
+# Words that frame a listing ("show me everything published in ...") rather than describe content
+FRAMING_WORDS = NAME_STOPWORDS | {
+    "and", "or", "for", "with", "to", "at", "during", "between", "since", "before", "after",
+    "until", "every", "everything", "each", "content", "pieces", "piece", "posted", "authored",
+    "author", "authors", "tag", "tags", "month", "months", "year", "years", "day", "days", "week",
+    "weeks", "can", "you", "do", "have", "has", "we", "our", "my", "that", "were", "was", "this",
+    "those", "these", "related", "regarding", "covering", "mentioning", "st", "nd", "rd", "th",
+}
+
+
+def get_routing_enabled() -> bool:
+    return os.getenv("QUERY_ROUTING", "true").strip().lower() in ("1", "true", "yes")
+
+
+def _cue_spans(query: str, gazetteer: Optional[Gazetteer]) -> List[Tuple[int, int, str]]:
+    """Character spans of the filter cues in a query, with the field they hint at"""
+    spans = [(match.start(), match.end(), "date") for match in RELATIVE_DATE_PATTERN.finditer(query)]
+    spans += [(match.start(), match.end(), "date") for match in YEAR_PATTERN.finditer(query)]
+    for match in DATE_PATTERN.finditer(query):
+        # "may" and "mar" are words too: short lowercase names need a day or a year next to them
+        name = next((token for token in re.findall(r"[A-Za-z]+", match.group(0)) if token.lower() in MONTHS), "")
+        dated = any(char.isdigit() for char in match.group(0)) or YEAR_PATTERN.match(query[match.end():].lstrip())
+        if len(name) > 3 or name[:1].isupper() or dated:
+            spans.append((match.start(), match.end(), "date"))
+    spans += [(match.start(), match.end(), "author") for match in AUTHOR_CUE_PATTERN.finditer(query)]
+    spans += [(match.start(), match.end(), "author") for match in LOWERCASE_AUTHOR_PATTERN.finditer(query)]
+    spans += [(match.start(), match.end(), "tag") for match in TAG_CUE_PATTERN.finditer(query)]
+    if gazetteer is not None:
+        spans += [(match["start"], match["end"], match["kind"]) for match in gazetteer.match(query)]
+    return spans
+
+
+def classify(query: str, gazetteer: Optional[Gazetteer] = None) -> Dict[str, Any]:
+    """
+    Route of a query with the evidence for it: ``cues`` (filter fields hinted at),
+    ``content`` (words left once cues and framing are removed) and ``names``
+    (capitalized content words, which may still be authors or tags).
+    """
+    spans = _cue_spans(query, gazetteer)
+    covered = [False] * len(query)
+    for start, end, _ in spans:
+        covered[start:end] = [True] * (end - start)
+    content = []
+    names = []
+    for position, match in enumerate(WORD_PATTERN.finditer(query)):
+        if any(covered[match.start():match.end()]):
+            continue
+        word = re.sub(r"(?:'s|’s|[.'’\-])$", "", match.group(0))
+        if not word or word.lower() in FRAMING_WORDS:
+            continue
+        content.append(word)
+        # A capitalized first word is just the start of the sentence
+        if word[0].isupper() and position > 0:
+            names.append(word)
+    names += re.findall(r"['\"]([^'\"]+)['\"]", query)
+
+    cues = sorted({field for _, _, field in spans})
+    if cues and not content:
+        route = "filter_only"
+    elif not cues and not names and gazetteer is not None:
+        # Without a vocabulary a lowercase topic cannot be told from content
+        route = "semantic_only"
+    else:
+        route = "hybrid"
+    return {"route": route, "cues": cues, "content": content, "names": names}
+
+
+class QueryRouter:
+    """Classifies queries (when QUERY_ROUTING is on) and counts the routes taken"""
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.routes: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def route(self, query: str, gazetteer: Optional[Gazetteer] = None) -> str:
+        route = classify(query, gazetteer)["route"] if self.enabled else "hybrid"
+        with self._lock:
+            self.routes[route] += 1
+        return route
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            routes = {route: self.routes.get(route, 0) for route in ROUTES}
+        return {
+            "enabled": self.enabled,
+            "routes": routes,
+            # Filter-only queries are never embedded, semantic-only ones never reach the LLM
+            "embeddings_skipped": routes["filter_only"],
+            "llm_calls_skipped": routes["semantic_only"],
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show how queries would be routed")
+    parser.add_argument("queries", nargs="+", help="Queries to classify")
+    parser.add_argument("--vocabulary", default=get_vocabulary_path(), help="Vocabulary file for author/tag cues")
+    args = parser.parse_args()
+
+    gazetteer = GazetteerCache(args.vocabulary).get() if args.vocabulary else None
+    for query in args.queries:
+        print(json.dumps({"query": query, **classify(query, gazetteer)}, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
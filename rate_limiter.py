@@ -0,0 +1,159 @@
+"""
+Token-bucket rate limiting for Gemini requests-per-minute and tokens-per-minute quotas.
+
+A RateLimiter holds one bucket for requests and one for tokens. Callers acquire a
+request plus an estimated token count before each call, reconcile the estimate
+with the actual usage afterwards, and report 429 responses so the limiter backs
+off (pausing all callers and lowering its rate) and then recovers gradually.
+"""
+
+import threading
+import time
+from typing import Optional
+
+
+class TokenBucket:
+    """
+    Classic token bucket: holds up to ``capacity`` tokens, refilled continuously
+    at ``rate`` tokens per second. Thread-safe.
+    """
+
+    def __init__(self, capacity: float, rate: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def time_until(self, amount: float, now: Optional[float] = None) -> float:
+        """Seconds until ``amount`` tokens are available (0 if they are now)"""
+        with self._lock:
+            now = time.monotonic() if now is None else now
+            self._refill(now)
+            amount = min(amount, self.capacity)
+            if self.tokens >= amount:
+                return 0.0
+            return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float, now: Optional[float] = None) -> None:
+        """Take tokens unconditionally; the balance may go negative (debt is repaid by refill)"""
+        with self._lock:
+            self._refill(time.monotonic() if now is None else now)
+            self.tokens -= amount
+
+    def refund(self, amount: float) -> None:
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute limiter with adaptive backoff.
+
+    Args:
+        requests_per_minute: Request quota
+        tokens_per_minute: Token quota (input + output)
+        min_rate_fraction: Lowest fraction of the configured rates backoff may reduce to
+        recovery_step: Fraction of the configured rates regained after each success
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float,
+        tokens_per_minute: float,
+        min_rate_fraction: float = 0.1,
+        recovery_step: float = 0.05,
+    ):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.requests = TokenBucket(requests_per_minute, requests_per_minute / 60.0)
+        self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60.0)
+        self.min_rate_fraction = min_rate_fraction
+        self.recovery_step = recovery_step
+        self.rate_fraction = 1.0
+        self.paused_until = 0.0
+        self.throttled = 0
+        self._lock = threading.Lock()
+
+    def _apply_rate_fraction(self) -> None:
+        self.requests.rate = self.requests_per_minute / 60.0 * self.rate_fraction
+        self.tokens.rate = self.tokens_per_minute / 60.0 * self.rate_fraction
+
+    def reserve(self, estimated_tokens: float, headroom: float = 0.0) -> float:
+        """
+        Try to take one request and ``estimated_tokens`` tokens, leaving at least a
+        ``headroom`` fraction of each bucket for other callers.
+        Returns 0 when the reservation was made, otherwise the seconds to wait before retrying.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now < self.paused_until:
+                return self.paused_until - now
+            wait = max(
+                self.requests.time_until(1 + headroom * self.requests.capacity, now),
+                self.tokens.time_until(estimated_tokens + headroom * self.tokens.capacity, now),
+            )
+            if wait > 0:
+                return wait
+            self.requests.consume(1, now)
+            self.tokens.consume(estimated_tokens, now)
+            return 0.0
+
+    def acquire(self, estimated_tokens: float) -> float:
+        """Block until a request slot and the estimated tokens are available; returns seconds waited"""
+        waited = 0.0
+        while True:
+            wait = self.reserve(estimated_tokens)
+            if wait <= 0:
+                return waited
+            time.sleep(wait)
+            waited += wait
+
+    def reconcile(self, estimated_tokens: float, actual_tokens: Optional[float]) -> None:
+        """Correct the token bucket once the real usage of a call is known"""
+        if actual_tokens is None:
+            return
+        difference = actual_tokens - estimated_tokens
+        if difference > 0:
+            self.tokens.consume(difference)
+        elif difference < 0:
+            self.tokens.refund(-difference)
+
+    def on_success(self) -> None:
+        """Additively recover the rate after a successful call"""
+        with self._lock:
+            if self.rate_fraction < 1.0:
+                self.rate_fraction = min(1.0, self.rate_fraction + self.recovery_step)
+                self._apply_rate_fraction()
+
+    def on_throttled(self, retry_after: Optional[float] = None) -> float:
+        """
+        React to a 429: pause all callers and halve the rate.
+        Returns the pause in seconds.
+        """
+        with self._lock:
+            self.throttled += 1
+            self.rate_fraction = max(self.min_rate_fraction, self.rate_fraction / 2)
+            self._apply_rate_fraction()
+            pause = retry_after if retry_after else 60.0 / max(self.requests_per_minute * self.rate_fraction, 1e-9)
+            self.paused_until = max(self.paused_until, time.monotonic() + pause)
+            return pause
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Detect quota/429 errors from the Gemini SDK or HTTP clients"""
+    code = getattr(error, 'code', None) or getattr(error, 'status_code', None)
+    if code == 429:
+        return True
+    name = type(error).__name__
+    message = str(error).lower()
+    return name in ('ResourceExhausted', 'TooManyRequests') or '429' in message or 'quota' in message
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about 4 characters per token)"""
+    return max(1, len(text) // 4)
@@ -0,0 +1,216 @@
+"""
+Relaxation ladder for filters that match too few documents.
+
+An over-specific filter (an exact day, several split tags, a misattributed author)
+can match nothing, and the client then retries with a rephrased query. Instead the
+filter is relaxed step by step, each tier keeping the relaxations before it:
+
+    strict → drop_day → drop_month → drop_author → broaden_tags → drop_tags
+
+``broaden_tags`` adds the known tags contained in the requested ones ("IPL 2025"
+also matches "IPL"), using the gazetteer; tiers that leave the filter unchanged
+are skipped. The first tier that returns ``top_k`` documents answers the query,
+or, when none does, the tier with the most documents.
+
+The vocabulary counts (documents per author, tag and year) give a selectivity
+estimate. When it predicts fewer than ``top_k`` matches and RELAXATION=speculative,
+all tiers are searched in parallel with the strict query, so a zero-result filter
+costs no extra round trip; otherwise the ladder only runs after the strict search
+comes back short.
+"""
+import os
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from filter_compiler import compile_filter, filter_hash
+from gazetteer import Gazetteer
+
+MODES = ("speculative", "fallback", "off")
+DEFAULT_MODE = "speculative"
+DEFAULT_WORKERS = 4
+# Each tier removes these fields (cumulatively) from every clause of the filter
+FIELD_TIERS = [
+    ("drop_day", ("published_day",)),
+    ("drop_month", ("published_month",)),
+    ("drop_author", ("author",)),
+]
+# Share of a month/day range in an average year/month, for the selectivity estimate
+UNIFORM_FIELDS = {"published_month": 12, "published_day": 31}
+
+Search = Callable[[Dict[str, Any]], Tuple[List[Any], str]]
+
+
+def get_relaxation_mode() -> str:
+    mode = os.getenv("RELAXATION", DEFAULT_MODE).strip().lower()
+    if mode not in MODES:
+        raise ValueError(f"RELAXATION must be one of {MODES}, got {mode!r}")
+    return mode
+
+
+def without_fields(pinecone_filter: Dict[str, Any], fields: Sequence[str]) -> Dict[str, Any]:
+    """Filter with the conditions on ``fields`` removed, inside $and/$or clauses too"""
+    relaxed = {}
+    for key, value in pinecone_filter.items():
+        if key in ("$and", "$or"):
+            relaxed[key] = [without_fields(clause, fields) for clause in value]
+        elif key not in fields:
+            relaxed[key] = value
+    return relaxed
+
+
+def _broaden_tags(pinecone_filter: Dict[str, Any], gazetteer: Optional[Gazetteer]) -> Dict[str, Any]:
+    """Filter whose tags ``$in`` lists also accept the known tags contained in each tag"""
+    broadened = {}
+    for key, value in pinecone_filter.items():
+        if key in ("$and", "$or"):
+            broadened[key] = [_broaden_tags(clause, gazetteer) for clause in value]
+        elif key == "tags" and gazetteer is not None and "$in" in value:
+            tags = list(value["$in"])
+            for tag in value["$in"]:
+                tags += [related for related in gazetteer.contained("tag", tag) if related not in tags]
+            broadened[key] = {**value, "$in": tags}
+        else:
+            broadened[key] = value
+    return broadened
+
+
+def relaxation_ladder(pinecone_filter: Dict[str, Any], gazetteer: Optional[Gazetteer] = None) -> List[Tuple[str, Dict[str, Any]]]:
+    """(tier, filter) pairs from the strict filter to the loosest one, without repeated filters"""
+    ladder = [("strict", pinecone_filter)]
+    seen = {filter_hash(pinecone_filter)}
+    current = pinecone_filter
+    steps = [(tier, lambda f, fields=fields: without_fields(f, fields)) for tier, fields in FIELD_TIERS]
+    steps += [
+        ("broaden_tags", lambda f: _broaden_tags(f, gazetteer)),
+        ("drop_tags", lambda f: without_fields(f, ("tags",))),
+    ]
+    for tier, relax in steps:
+        current = compile_filter(relax(current))
+        key = filter_hash(current)
+        if key not in seen:
+            seen.add(key)
+            ladder.append((tier, current))
+    return ladder
+
+
+def _fraction(pinecone_filter: Dict[str, Any], gazetteer: Gazetteer) -> float:
+    """Estimated share of documents a compiled filter matches, fields assumed independent"""
+    fraction = 1.0
+    for key, value in pinecone_filter.items():
+        if key == "$and":
+            for clause in value:
+                fraction *= _fraction(clause, gazetteer)
+        elif key == "$or":
+            fraction *= min(1.0, sum(_fraction(clause, gazetteer) for clause in value))
+        elif key in ("author", "tags"):
+            values = [value["$eq"]] if "$eq" in value else value.get("$in")
+            if values is not None:
+                kind = "author" if key == "author" else "tag"
+                # Unknown values may be newer than the vocabulary; count them as one document
+                matched = sum(gazetteer.count(kind, item) or 1 for item in values)
+                fraction *= min(1.0, matched / gazetteer.documents)
+        elif key == "published_year":
+            years = [year for year in gazetteer.years if _accepts(value, year)]
+            fraction *= sum(gazetteer.years[year] for year in years) / gazetteer.documents
+        elif key in UNIFORM_FIELDS:
+            size = UNIFORM_FIELDS[key]
+            fraction *= sum(_accepts(value, number) for number in range(1, size + 1)) / size
+    return fraction
+
+
+def _accepts(condition: Dict[str, Any], number: int) -> bool:
+    """Whether a compiled integer condition accepts a value"""
+    return (
+        condition.get("$eq", number) == number
+        and number in condition.get("$in", [number])
+        and number not in condition.get("$nin", [])
+        and condition.get("$ne") != number
+        and condition.get("$gte", number) <= number <= condition.get("$lte", number)
+    )
+
+
+def estimate_matches(pinecone_filter: Dict[str, Any], gazetteer: Optional[Gazetteer]) -> Optional[float]:
+    """Estimated number of documents matching a compiled filter, None without vocabulary counts"""
+    if gazetteer is None or not gazetteer.documents:
+        return None
+    return gazetteer.documents * _fraction(pinecone_filter, gazetteer)
+
+
+class RelaxedSearch:
+    """Runs searches through the relaxation ladder and counts which tier answered"""
+
+    def __init__(self, mode: str = DEFAULT_MODE, max_workers: int = DEFAULT_WORKERS):
+        if mode not in MODES:
+            raise ValueError(f"Relaxation mode must be one of {MODES}, got {mode!r}")
+        self.mode = mode
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="relaxation")
+        self._lock = threading.Lock()
+        self.searches = 0
+        self.speculative = 0
+        self.extra_queries = 0
+        self.tiers: Counter = Counter()
+
+    def search(
+        self,
+        search: Search,
+        pinecone_filter: Dict[str, Any],
+        top_k: int,
+        gazetteer: Optional[Gazetteer] = None,
+        relax: bool = True,
+        allow_unfiltered: bool = True,
+    ) -> Tuple[List[Any], str, str, Dict[str, Any]]:
+        """
+        Results and source of the first tier with ``top_k`` results, plus the tier
+        and the filter it used. ``search`` runs one filtered search; without
+        ``allow_unfiltered`` no tier relaxes the filter away entirely.
+        """
+        if self.mode == "off" or not relax:
+            results, source = search(pinecone_filter)
+            return results, source, "strict", pinecone_filter
+
+        ladder = relaxation_ladder(pinecone_filter, gazetteer)
+        if not allow_unfiltered:
+            ladder = ladder[:1] + [(tier, tier_filter) for tier, tier_filter in ladder[1:] if tier_filter]
+        estimate = estimate_matches(pinecone_filter, gazetteer)
+        speculative = self.mode == "speculative" and len(ladder) > 1 and estimate is not None and estimate < top_k
+        outcomes = []
+        pending = ladder
+        if not speculative:
+            results, source = search(pinecone_filter)
+            outcomes.append((results, source, "strict", pinecone_filter))
+            pending = ladder[1:] if len(results) < top_k else []
+
+        # The remaining tiers run in parallel and are read in ladder order
+        futures = [self._executor.submit(search, tier_filter) for _, tier_filter in pending]
+        for (tier, tier_filter), future in zip(pending, futures):
+            results, source = future.result()
+            outcomes.append((results, source, tier, tier_filter))
+            if len(results) >= top_k:
+                break
+        for future in futures:
+            future.cancel()
+
+        # No tier filled top_k: the one with the most results, the strictest on ties
+        chosen = next(
+            (outcome for outcome in outcomes if len(outcome[0]) >= top_k),
+            max(outcomes, key=lambda outcome: len(outcome[0])),
+        )
+        with self._lock:
+            self.searches += 1
+            self.speculative += speculative
+            self.extra_queries += sum(not future.cancelled() for future in futures) - speculative
+            self.tiers[chosen[2]] += 1
+        return chosen
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "searches": self.searches,
+                "speculative": self.speculative,
+                "extra_queries": self.extra_queries,
+                "tiers": dict(self.tiers),
+                "relaxed_rate": 1 - self.tiers["strict"] / self.searches if self.searches else 0.0,
+            }
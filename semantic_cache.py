@@ -0,0 +1,263 @@
+"""
+Semantic cache of LLM-generated filters keyed by query embedding.
+
+Paraphrases such as "posts by Jane Doe on IPL" and "Jane Doe's IPL articles" miss an
+exact-match cache but embed almost identically. The cache keeps past query
+embeddings in a small in-memory matrix (float16 by default) and, when a new query
+is similar enough, reuses the stored filter after a cheap entity check confirms
+that both queries mention the same names and topics, years, months and relative dates.
+
+A sample of hits can be audited by regenerating the filter with the LLM; mismatches
+are recorded as false hits so the threshold can be tuned.
+"""
+
+import copy
+import json
+import random
+import re
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+import numpy as np
+
+from filter_compiler import canonical_form, filter_hash
+from vector_types import CACHE_DTYPE, VECTOR_DTYPE, VectorLike, to_vector
+
+DEFAULT_THRESHOLD = 0.92
+DEFAULT_CAPACITY = 5000
+DEFAULT_TTL_SECONDS = 0  # Filters keep relative dates symbolic, so they never go stale
+
+MONTHS = {
+    "january": 1, "jan": 1, "february": 2, "feb": 2, "march": 3, "mar": 3, "april": 4, "apr": 4,
+    "may": 5, "june": 6, "jun": 6, "july": 7, "jul": 7, "august": 8, "aug": 8,
+    "september": 9, "sep": 9, "sept": 9, "october": 10, "oct": 10, "november": 11, "nov": 11,
+    "december": 12, "dec": 12,
+}
+RELATIVE_DATE_PATTERN = re.compile(
+    r"\b(today|yesterday|(?:this|last|past|previous|next)\s+(?:\d+\s+)?(?:day|week|month|year)s?|recent(?:ly)?|latest)\b",
+    re.IGNORECASE,
+)
+YEAR_PATTERN = re.compile(r"\b(19\d{2}|20\d{2})\b")
+NAME_PATTERN = re.compile(r"\b[A-Z][\w.\-]*(?:\s+[A-Z][\w.\-]*)*")
+# Lower-case author names still follow "by" ("articles by jane doe")
+AUTHOR_PATTERN = re.compile(r"\bby\s+([a-z][\w.\-]*(?:\s+[a-z][\w.\-]*)?)")
+# Capitalized words that start or decorate queries rather than name anything
+NAME_STOPWORDS = {
+    "show", "find", "get", "give", "list", "search", "any", "anything", "all", "articles", "article",
+    "posts", "post", "stories", "story", "news", "blogs", "blog", "what", "which", "who", "where",
+    "when", "me", "the", "a", "an", "by", "on", "about", "from", "in", "of", "i", "please",
+    "latest", "recent", "looking", "tagged", "written", "published", "is", "are", "there",
+}
+# Topics follow topic wording even in lower case ("articles about ipl", "tagged with ai")
+TOPIC_PATTERN = re.compile(
+    r"\b(?:about|on|regarding|covering|mentioning|related\s+to|tagged(?:\s+(?:with|as|under))?)\s+([^,;:!?()]+)",
+    re.IGNORECASE,
+)
+TOPIC_SEPARATORS = {"and", "or", "&", "/", "topic", "topics", "subject"}
+# Words that end a topic phrase: what follows is a date, an author or another clause
+TOPIC_BOUNDARIES = {
+    "in", "from", "by", "during", "since", "before", "after", "until", "between", "published", "posted",
+    "written", "that", "which", "with", "for", "this", "last", "past", "previous", "next", "today",
+    "yesterday", "recent", "recently", "latest", "to", "at",
+}
+
+
+def _clean_name(name: str) -> Optional[str]:
+    words = [re.sub(r"'s$|’s$", "", word) for word in name.split()]
+    while words and (words[0].lower() in NAME_STOPWORDS or words[0].lower() in MONTHS):
+        words.pop(0)
+    while words and (words[-1].lower() in NAME_STOPWORDS or words[-1].lower() in MONTHS):
+        words.pop()
+    return " ".join(words).lower() or None
+
+
+def _topics(query: str) -> List[str]:
+    """Lowercase topic phrases after topic wording ("posts about cricket in may" → cricket)"""
+    topics = []
+    for match in TOPIC_PATTERN.finditer(query):
+        phrase: List[str] = []
+        for original in match.group(1).split():
+            word = re.sub(r"'s$|’s$|[.'’]$", "", original.lower())
+            if word in TOPIC_BOUNDARIES or word in MONTHS or any(char.isdigit() for char in word):
+                break
+            if word in TOPIC_SEPARATORS or word in NAME_STOPWORDS or original[0].isupper():
+                # Framing ("on the", "about any") is skipped and capitalized words are
+                # names already; either splits the phrase
+                if phrase:
+                    topics.append(" ".join(phrase))
+                    phrase = []
+                continue
+            phrase.append(word)
+        if phrase:
+            topics.append(" ".join(phrase))
+    return topics
+
+
+def extract_entities(query: str) -> Tuple[FrozenSet[str], ...]:
+    """
+    Names (capitalized phrases, quoted terms and topics after "about", "on" or
+    "tagged"), years, months and relative date phrases mentioned in a query. Two
+    queries may share a filter only if these match.
+    """
+    names = {_clean_name(match) for match in NAME_PATTERN.findall(query)}
+    names.update(_topics(query))
+    names.update(term.lower() for term in re.findall(r"['\"]([^'\"]+)['\"]", query))
+    names.update(_clean_name(match) for match in AUTHOR_PATTERN.findall(query))
+    names.discard(None)
+    years = set(YEAR_PATTERN.findall(query))
+    names = {name for name in names if not YEAR_PATTERN.fullmatch(name)}
+    months = {str(MONTHS[word.lower()]) for word in re.findall(r"[A-Za-z]+", query) if word.lower() in MONTHS
+              and (len(word) > 3 or word[0].isupper())}
+    relative = {re.sub(r"\s+", " ", match.lower()) for match in RELATIVE_DATE_PATTERN.findall(query)}
+    return frozenset(names), frozenset(years), frozenset(months), frozenset(relative)
+
+
+def canonical_filter(pinecone_filter: Any) -> str:
+    """Serialization used to compare filters; equivalent filters serialize alike"""
+    def canonical(value: Any) -> Any:
+        if isinstance(value, dict):
+            return {key: canonical(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return sorted((canonical(item) for item in value), key=lambda item: json.dumps(item, sort_keys=True))
+        return value
+    # Invalid filters have no normal form, so their lists are still compared order-insensitively
+    return json.dumps(canonical(canonical_form(pinecone_filter)), sort_keys=True)
+
+
+class SemanticFilterCache:
+    """
+    Nearest-neighbour cache from query embeddings to generated filters.
+
+    Args:
+        threshold: Minimum cosine similarity for a hit
+        capacity: Maximum number of cached queries (oldest entries are overwritten)
+        ttl_seconds: Entries older than this are ignored (0 keeps them indefinitely)
+        audit_rate: Fraction of hits to re-check against the LLM
+        candidates: Nearest entries examined per lookup
+        dtype: Storage precision of the cached embeddings
+    """
+
+    def __init__(
+        self,
+        threshold: float = DEFAULT_THRESHOLD,
+        capacity: int = DEFAULT_CAPACITY,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        audit_rate: float = 0.0,
+        candidates: int = 5,
+        dtype: Any = CACHE_DTYPE,
+    ):
+        self.threshold = threshold
+        self.capacity = capacity
+        self.ttl_seconds = ttl_seconds
+        self.audit_rate = audit_rate
+        self.candidates = candidates
+        self.dtype = dtype
+        self._vectors: Optional[np.ndarray] = None
+        self._entries: List[Optional[Dict[str, Any]]] = [None] * capacity
+        self._size = 0
+        self._next = 0
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+        self.entity_rejections = 0
+        self.audits = 0
+        self.false_hits = 0
+        self.recent_false_hits: deque = deque(maxlen=20)
+
+    @property
+    def enabled(self) -> bool:
+        return self.capacity > 0
+
+    def lookup(self, query: str, vector: VectorLike) -> Optional[Dict[str, Any]]:
+        """
+        Return the cached entry (``query``, ``filter``, ``similarity``) of the most similar
+        past query that passes the threshold and the entity check, or None.
+        """
+        if not self.enabled:
+            return None
+        query_vector = to_vector(vector)
+        entities = extract_entities(query)
+        now = time.time()
+        with self._lock:
+            self.lookups += 1
+            if not self._size:
+                return None
+            norm = float(np.linalg.norm(query_vector)) or 1.0
+            scores = self._vectors[:self._size].astype(VECTOR_DTYPE) @ (query_vector / norm)
+            count = min(self.candidates, self._size)
+            best = np.argpartition(-scores, count - 1)[:count]
+            for row in best[np.argsort(-scores[best])]:
+                similarity = float(scores[row])
+                if similarity < self.threshold:
+                    break
+                entry = self._entries[row]
+                if self.ttl_seconds and now - entry["created"] > self.ttl_seconds:
+                    continue
+                if entry["entities"] != entities:
+                    self.entity_rejections += 1
+                    continue
+                self.hits += 1
+                entry["hits"] += 1
+                return {"query": entry["query"], "filter": copy.deepcopy(entry["filter"]), "similarity": similarity}
+        return None
+
+    def add(self, query: str, vector: VectorLike, pinecone_filter: Dict[str, Any]) -> None:
+        """Remember the filter generated for a query"""
+        if not self.enabled:
+            return
+        query_vector = to_vector(vector)
+        norm = float(np.linalg.norm(query_vector)) or 1.0
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.capacity, len(query_vector)), dtype=self.dtype)
+            row = self._next
+            self._vectors[row] = query_vector / norm
+            self._entries[row] = {
+                "query": query,
+                "filter": pinecone_filter,
+                "filter_hash": filter_hash(pinecone_filter),
+                "entities": extract_entities(query),
+                "created": time.time(),
+                "hits": 0,
+            }
+            self._next = (row + 1) % self.capacity
+            self._size = min(self._size + 1, self.capacity)
+
+    def should_audit(self) -> bool:
+        return self.audit_rate > 0 and random.random() < self.audit_rate
+
+    def record_audit(self, query: str, hit: Dict[str, Any], fresh_filter: Dict[str, Any]) -> bool:
+        """Compare a cached filter with a freshly generated one; returns True if they agree"""
+        agrees = canonical_filter(hit["filter"]) == canonical_filter(fresh_filter)
+        with self._lock:
+            self.audits += 1
+            if not agrees:
+                self.false_hits += 1
+                self.recent_false_hits.append({
+                    "query": query,
+                    "cached_query": hit["query"],
+                    "similarity": round(hit["similarity"], 4),
+                    "cached_filter": hit["filter"],
+                    "generated_filter": fresh_filter,
+                })
+        return agrees
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "entries": self._size,
+                "distinct_filters": len({entry["filter_hash"] for entry in self._entries[:self._size]}),
+                "capacity": self.capacity,
+                "threshold": self.threshold,
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+                "entity_rejections": self.entity_rejections,
+                "audits": self.audits,
+                "false_hits": self.false_hits,
+                "false_hit_rate": self.false_hits / self.audits if self.audits else 0.0,
+                "recent_false_hits": list(self.recent_false_hits),
+            }
@@ -0,0 +1,377 @@
+"""
+Binary snapshot format for vectors, ids and metadata.
+
+A snapshot is a directory that can be written incrementally and read back with
+memory mapping, so millions of vectors can be loaded without parsing or copying:
+
+    manifest.json              count, dimension, dtype and column kinds
+    vectors.npy                (count, dimension) vector matrix
+    ids.offsets.npy, ids.bin   id table (UTF-8 blob addressed by offsets)
+    <column>.*                 one columnar file set per metadata field
+
+Column kinds:
+    int            int64 array; missing values are stored as INT_MISSING
+    str            UTF-8 blob + offsets; missing values are empty strings
+    category       int32 codes + vocabulary (e.g. author); -1 is missing
+    category_list  int32 codes + row offsets + vocabulary (e.g. tags); a missing
+                   value is a row holding the single code -1, an empty list no codes
+    json           JSON-encoded values as a str column
+
+Column kinds are inferred from the first batch. Metadata keys that first appear
+later, and values that do not fit their column's kind (a float in an ``int``
+column, a list in a ``str`` column, an empty string), are kept in a json
+``_extra`` column, so a snapshot round trip returns every record's metadata as it
+was written.
+"""
+
+import json
+import os
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+FORMAT_NAME = "nl2pinecone-snapshot"
+FORMAT_VERSION = 2
+INT_MISSING = np.iinfo(np.int64).min
+CATEGORY_COLUMNS = {"author"}
+EXTRA_COLUMN = "_extra"
+
+# Fixed .npy header size so arrays can be appended to and the shape patched at close
+_NPY_HEADER_BYTES = 128
+
+
+def _npy_header(dtype: np.dtype, shape: Tuple[int, ...]) -> bytes:
+    """Build a version 1.0 .npy header padded to a fixed length"""
+    header = "{'descr': %r, 'fortran_order': False, 'shape': %r, }" % (
+        np.lib.format.dtype_to_descr(dtype), shape
+    )
+    prefix = b'\x93NUMPY\x01\x00'
+    body_len = _NPY_HEADER_BYTES - len(prefix) - 2
+    body = header.ljust(body_len - 1) + '\n'
+    if len(body) != body_len:
+        raise ValueError(f"Shape {shape} does not fit the fixed .npy header")
+    return prefix + body_len.to_bytes(2, 'little') + body.encode('latin1')
+
+
+class _NpyAppender:
+    """Append rows to a .npy file whose shape is written when it is closed"""
+
+    def __init__(self, path: str, dtype: Any, row_shape: Tuple[int, ...] = ()):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.row_shape = row_shape
+        self.count = 0
+        self._file = open(path, 'wb')
+        self._file.write(_npy_header(self.dtype, (0,) + row_shape))
+
+    def append(self, rows: np.ndarray) -> None:
+        rows = np.ascontiguousarray(rows, dtype=self.dtype)
+        if rows.shape[1:] != self.row_shape:
+            raise ValueError(f"Expected rows of shape {self.row_shape}, got {rows.shape[1:]}")
+        self._file.write(rows.tobytes())
+        self.count += rows.shape[0]
+
+    def close(self) -> None:
+        self._file.seek(0)
+        self._file.write(_npy_header(self.dtype, (self.count,) + self.row_shape))
+        self._file.close()
+
+
+class _StringColumnWriter:
+    """UTF-8 blob plus int64 offsets; row i is blob[offsets[i]:offsets[i + 1]]"""
+
+    def __init__(self, base_path: str):
+        self._offsets = _NpyAppender(base_path + '.offsets.npy', np.int64)
+        self._blob = open(base_path + '.bin', 'wb')
+        self._position = 0
+        self._offsets.append(np.zeros(1, dtype=np.int64))
+
+    def append(self, values: Sequence[str]) -> None:
+        offsets = np.empty(len(values), dtype=np.int64)
+        for i, value in enumerate(values):
+            encoded = value.encode('utf-8')
+            self._blob.write(encoded)
+            self._position += len(encoded)
+            offsets[i] = self._position
+        self._offsets.append(offsets)
+
+    def close(self) -> None:
+        self._offsets.close()
+        self._blob.close()
+
+
+class _CategoryColumnWriter:
+    def __init__(self, base_path: str, multi: bool):
+        self.base_path = base_path
+        self.multi = multi
+        self.vocabulary: Dict[str, int] = {}
+        self._codes = _NpyAppender(base_path + '.codes.npy', np.int32)
+        self._offsets = _NpyAppender(base_path + '.offsets.npy', np.int64) if multi else None
+        self._position = 0
+        if self._offsets is not None:
+            self._offsets.append(np.zeros(1, dtype=np.int64))
+
+    def _code(self, value: str) -> int:
+        code = self.vocabulary.get(value)
+        if code is None:
+            code = self.vocabulary[value] = len(self.vocabulary)
+        return code
+
+    def append(self, values: Sequence[Any]) -> None:
+        if not self.multi:
+            self._codes.append(np.array(
+                [self._code(v) if v is not None else -1 for v in values], dtype=np.int32
+            ))
+            return
+        codes: List[int] = []
+        offsets = np.empty(len(values), dtype=np.int64)
+        for i, items in enumerate(values):
+            if items is None:
+                codes.append(-1)
+            else:
+                codes.extend(self._code(item) for item in items)
+            offsets[i] = self._position + len(codes)
+        self._position += len(codes)
+        self._codes.append(np.array(codes, dtype=np.int32))
+        self._offsets.append(offsets)
+
+    def close(self) -> None:
+        self._codes.close()
+        if self._offsets is not None:
+            self._offsets.close()
+        vocabulary = sorted(self.vocabulary, key=self.vocabulary.get)
+        with open(self.base_path + '.vocab.json', 'w', encoding='utf-8') as f:
+            json.dump(vocabulary, f, ensure_ascii=False)
+
+
+def infer_column_kind(name: str, value: Any) -> str:
+    """Choose the storage kind of a metadata column from a sample value"""
+    if isinstance(value, bool):
+        return "json"
+    if isinstance(value, int):
+        return "int"
+    if isinstance(value, str):
+        return "category" if name in CATEGORY_COLUMNS else "str"
+    if isinstance(value, list) and all(isinstance(item, str) for item in value):
+        return "category_list"
+    return "json"
+
+
+def _fits_column(kind: str, value: Any) -> bool:
+    """Whether a value is stored exactly by a column of ``kind`` (None means the key is absent)"""
+    if kind == "int":
+        return isinstance(value, int) and not isinstance(value, bool) and value != INT_MISSING
+    if kind == "str":
+        return isinstance(value, str) and value != ""
+    if kind == "category":
+        return isinstance(value, str)
+    if kind == "category_list":
+        return isinstance(value, list) and all(isinstance(item, str) for item in value)
+    return True
+
+
+class SnapshotWriter:
+    """
+    Write a snapshot incrementally.
+
+    Args:
+        path: Snapshot directory (created if needed)
+        dimension: Vector dimension
+        dtype: Vector storage dtype, ``float32`` or ``float16``
+    """
+
+    def __init__(self, path: str, dimension: int, dtype: str = "float32"):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.dimension = dimension
+        self.dtype = dtype
+        self.count = 0
+        self.columns: Optional[Dict[str, str]] = None
+        self._vectors = _NpyAppender(os.path.join(path, 'vectors.npy'), dtype, (dimension,))
+        self._ids = _StringColumnWriter(os.path.join(path, 'ids'))
+        self._writers: Dict[str, Any] = {}
+
+    def _layout_columns(self, metadatas: Sequence[Dict[str, Any]]) -> None:
+        columns: Dict[str, str] = {}
+        for metadata in metadatas:
+            for name, value in metadata.items():
+                if name not in columns and value is not None:
+                    columns[name] = infer_column_kind(name, value)
+        columns[EXTRA_COLUMN] = "json"
+        self.columns = columns
+        for name, kind in columns.items():
+            base_path = os.path.join(self.path, f"col.{name}")
+            if kind == "int":
+                self._writers[name] = _NpyAppender(base_path + '.npy', np.int64)
+            elif kind in ("str", "json"):
+                self._writers[name] = _StringColumnWriter(base_path)
+            else:
+                self._writers[name] = _CategoryColumnWriter(base_path, multi=kind == "category_list")
+
+    def append(self, ids: Sequence[str], vectors: Any, metadatas: Sequence[Dict[str, Any]]) -> None:
+        """Append a batch of ids, a (batch, dimension) vector array and metadata dicts"""
+        vectors = np.asarray(vectors, dtype=self.dtype)
+        if not (len(ids) == vectors.shape[0] == len(metadatas)):
+            raise ValueError("ids, vectors and metadatas must have the same length")
+        if self.columns is None:
+            self._layout_columns(metadatas)
+
+        self._vectors.append(vectors)
+        self._ids.append(ids)
+        # Keys without a column and values their column cannot store go to _extra
+        extras = [
+            {
+                k: v for k, v in metadata.items()
+                if k not in self.columns or k == EXTRA_COLUMN or not _fits_column(self.columns[k], v)
+            }
+            for metadata in metadatas
+        ]
+        for name, kind in self.columns.items():
+            if name == EXTRA_COLUMN:
+                self._writers[name].append([json.dumps(e) if e else "" for e in extras])
+                continue
+            values = [
+                metadata[name] if name in metadata and name not in extra else None
+                for metadata, extra in zip(metadatas, extras)
+            ]
+            if kind == "int":
+                self._writers[name].append(np.array(
+                    [INT_MISSING if v is None else v for v in values], dtype=np.int64
+                ))
+            elif kind == "str":
+                self._writers[name].append(["" if v is None else v for v in values])
+            elif kind == "json":
+                self._writers[name].append(["" if v is None else json.dumps(v) for v in values])
+            else:
+                self._writers[name].append(values)
+        self.count += len(ids)
+
+    def close(self) -> None:
+        """Finalize array headers and write the manifest"""
+        if self.columns is None:
+            self._layout_columns([])
+        self._vectors.close()
+        self._ids.close()
+        for writer in self._writers.values():
+            writer.close()
+        manifest = {
+            "format": FORMAT_NAME,
+            "version": FORMAT_VERSION,
+            "count": self.count,
+            "dimension": self.dimension,
+            "dtype": self.dtype,
+            "columns": self.columns,
+        }
+        with open(os.path.join(self.path, 'manifest.json'), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+
+    def __enter__(self) -> "SnapshotWriter":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+
+class _StringColumn:
+    def __init__(self, base_path: str):
+        self.offsets = np.load(base_path + '.offsets.npy', mmap_mode='r')
+        size = os.path.getsize(base_path + '.bin')
+        self.blob = np.memmap(base_path + '.bin', dtype=np.uint8, mode='r') if size else np.zeros(0, np.uint8)
+
+    def __getitem__(self, i: int) -> str:
+        return bytes(self.blob[self.offsets[i]:self.offsets[i + 1]]).decode('utf-8')
+
+
+class SnapshotReader:
+    """
+    Memory-mapped view of a snapshot.
+
+    ``vectors`` is a read-only (count, dimension) array backed by the file; ids and
+    metadata are decoded on access.
+    """
+
+    def __init__(self, path: str):
+        with open(os.path.join(path, 'manifest.json'), 'r', encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        if self.manifest.get("format") != FORMAT_NAME:
+            raise ValueError(f"{path} is not a snapshot")
+        if self.manifest.get("version", 1) > FORMAT_VERSION:
+            raise ValueError(f"{path} was written by a newer snapshot format (version {self.manifest['version']})")
+        self.path = path
+        self.count: int = self.manifest["count"]
+        self.dimension: int = self.manifest["dimension"]
+        self.columns: Dict[str, str] = self.manifest["columns"]
+        self.vectors = np.load(os.path.join(path, 'vectors.npy'), mmap_mode='r')
+        self._ids = _StringColumn(os.path.join(path, 'ids'))
+        self._columns: Dict[str, Any] = {}
+        for name, kind in self.columns.items():
+            base_path = os.path.join(path, f"col.{name}")
+            if kind == "int":
+                self._columns[name] = np.load(base_path + '.npy', mmap_mode='r')
+            elif kind in ("str", "json"):
+                self._columns[name] = _StringColumn(base_path)
+            else:
+                with open(base_path + '.vocab.json', 'r', encoding='utf-8') as f:
+                    vocabulary = json.load(f)
+                codes = np.load(base_path + '.codes.npy', mmap_mode='r')
+                offsets = np.load(base_path + '.offsets.npy', mmap_mode='r') if kind == "category_list" else None
+                self._columns[name] = (vocabulary, codes, offsets)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def id(self, i: int) -> str:
+        return self._ids[i]
+
+    def ids(self, start: int = 0, stop: Optional[int] = None) -> List[str]:
+        return [self._ids[i] for i in range(start, self.count if stop is None else stop)]
+
+    def column(self, name: str) -> Any:
+        """
+        Raw column data: an int64 array for ``int`` columns, ``(vocabulary, codes, offsets)``
+        for category columns. Useful for vectorized filtering.
+        """
+        return self._columns[name]
+
+    def metadata(self, i: int) -> Dict[str, Any]:
+        """Decode the metadata dict of row ``i``"""
+        metadata: Dict[str, Any] = {}
+        for name, kind in self.columns.items():
+            column = self._columns[name]
+            if kind == "int":
+                value = int(column[i])
+                if value != INT_MISSING:
+                    metadata[name] = value
+            elif kind == "str":
+                value = column[i]
+                if value:
+                    metadata[name] = value
+            elif kind == "json":
+                value = column[i]
+                if value and name == EXTRA_COLUMN:
+                    metadata.update(json.loads(value))
+                elif value:
+                    metadata[name] = json.loads(value)
+            elif kind == "category":
+                vocabulary, codes, _ = column
+                if codes[i] >= 0:
+                    metadata[name] = vocabulary[codes[i]]
+            else:
+                vocabulary, codes, offsets = column
+                row = codes[offsets[i]:offsets[i + 1]]
+                if len(row) == 1 and row[0] < 0:
+                    continue
+                metadata[name] = [vocabulary[c] for c in row]
+        return metadata
+
+    def iter_batches(
+        self, batch_size: int = 1000
+    ) -> Iterator[Tuple[List[str], np.ndarray, List[Dict[str, Any]]]]:
+        """Yield (ids, vectors, metadatas) batches in order"""
+        for start in range(0, self.count, batch_size):
+            stop = min(start + batch_size, self.count)
+            yield (
+                self.ids(start, stop),
+                self.vectors[start:stop],
+                [self.metadata(i) for i in range(start, stop)],
+            )
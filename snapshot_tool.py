@@ -0,0 +1,162 @@
+"""
+Export the Pinecone index to a local snapshot and import snapshots back.
+
+Export pages through every id (optionally under a prefix), fetches vectors and
+metadata with parallel fetch requests and streams them into a memory-mapped
+snapshot (see snapshot.py). Import bulk-upserts a snapshot through the byte-aware
+upsert engine, e.g. to restore after ``delete_records.py`` or to seed another index.
+
+Examples:
+    python snapshot_tool.py export --path snapshots/index
+    python snapshot_tool.py export --path snapshots/csv --prefix csv-
+    python snapshot_tool.py import --path snapshots/index
+    python snapshot_tool.py info --path snapshots/index
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from delete_records import FETCH_BATCH_SIZE, get_index, list_ids
+from snapshot import SnapshotReader, SnapshotWriter
+from upsert_engine import UpsertEngine
+from vector_types import to_matrix
+
+
+def _plain_metadata(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """Pinecone returns numbers as floats; restore integral values (years, months, ...) to ints"""
+    return {
+        key: int(value) if isinstance(value, float) and value.is_integer() else value
+        for key, value in metadata.items()
+    }
+
+
+def fetch_records(index, ids: List[str]) -> Tuple[List[str], np.ndarray, List[Dict[str, Any]]]:
+    """Fetch vectors and metadata for up to FETCH_BATCH_SIZE ids, in the order given"""
+    vectors = index.fetch(ids=ids).vectors
+    found = [vector_id for vector_id in ids if vector_id in vectors]
+    return (
+        found,
+        to_matrix([vectors[vector_id].values for vector_id in found]),
+        [_plain_metadata(dict(vectors[vector_id].metadata or {})) for vector_id in found],
+    )
+
+
+def export_snapshot(
+    index,
+    path: str,
+    prefix: Optional[str] = None,
+    max_workers: int = 8,
+    dtype: str = "float32",
+) -> int:
+    """Write every record of the index (or under ``prefix``) to a snapshot; returns the count"""
+    print(f"📋 Listing ids{f' with prefix {prefix}' if prefix else ''}...")
+    ids = list_ids(index, prefix)
+    print(f"📦 Exporting {len(ids)} records to {path}")
+
+    writer: Optional[SnapshotWriter] = None
+    missing = 0
+    # Fetch a bounded window of batches at a time so memory stays flat on large indexes
+    window = max_workers * FETCH_BATCH_SIZE * 4
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for start in range(0, len(ids), window):
+            batches = [
+                ids[batch_start:batch_start + FETCH_BATCH_SIZE]
+                for batch_start in range(start, min(start + window, len(ids)), FETCH_BATCH_SIZE)
+            ]
+            for batch, (found, vectors, metadatas) in zip(
+                batches, executor.map(lambda batch: fetch_records(index, batch), batches)
+            ):
+                missing += len(batch) - len(found)
+                if not found:
+                    continue
+                if writer is None:
+                    writer = SnapshotWriter(path, vectors.shape[1], dtype=dtype)
+                writer.append(found, vectors, metadatas)
+            print(f"✅ Exported {writer.count if writer else 0}/{len(ids)} records")
+
+    if writer is None:
+        print("⚠️  Index is empty, nothing exported")
+        return 0
+    writer.close()
+    if missing:
+        print(f"⚠️  {missing} ids disappeared between listing and fetching")
+    return writer.count
+
+
+def _index_dimension(index) -> Optional[int]:
+    try:
+        stats = index.describe_index_stats()
+    except Exception:
+        return None
+    return getattr(stats, 'dimension', None) or (stats.get('dimension') if isinstance(stats, dict) else None)
+
+
+def import_snapshot(index, path: str, max_workers: int = 4, batch_size: int = 1000) -> None:
+    """Bulk-upsert every record of a snapshot into the index"""
+    reader = SnapshotReader(path)
+    dimension = _index_dimension(index)
+    if dimension and dimension != reader.dimension:
+        raise ValueError(f"Snapshot dimension {reader.dimension} does not match index dimension {dimension}")
+
+    print(f"📤 Importing {reader.count} records from {path}")
+    engine = UpsertEngine(index, max_workers=max_workers, verbose=False)
+    records = (
+        record
+        for ids, vectors, metadatas in reader.iter_batches(batch_size)
+        for record in zip(ids, vectors, metadatas)
+    )
+    stats = engine.upsert(records)
+    print(f"📈 Import throughput: {stats.summary()}")
+    if stats.failed_ids:
+        print(f"❌ {len(stats.failed_ids)} records failed to upsert")
+
+
+def print_info(path: str) -> None:
+    reader = SnapshotReader(path)
+    size = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+    print(f"📦 Snapshot {path}: {reader.count} records, dimension {reader.dimension} "
+          f"({reader.manifest['dtype']}), {size / 1024 / 1024:.1f} MB")
+    for name, kind in reader.columns.items():
+        print(f"   - {name}: {kind}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the Pinecone index to a snapshot or import one back")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Write the index to a snapshot")
+    export_parser.add_argument("--path", required=True, help="Snapshot directory")
+    export_parser.add_argument("--prefix", help="Only export ids starting with this prefix")
+    export_parser.add_argument("--workers", type=int, default=8, help="Parallel fetch requests")
+    export_parser.add_argument("--dtype", choices=["float32", "float16"], default="float32",
+                               help="Vector storage precision")
+
+    import_parser = subparsers.add_parser("import", help="Upsert a snapshot into the index")
+    import_parser.add_argument("--path", required=True, help="Snapshot directory")
+    import_parser.add_argument("--workers", type=int, default=int(os.getenv("UPSERT_WORKERS", 4)),
+                               help="Parallel upsert requests")
+
+    info_parser = subparsers.add_parser("info", help="Describe a snapshot")
+    info_parser.add_argument("--path", required=True, help="Snapshot directory")
+    args = parser.parse_args()
+
+    if args.command == "info":
+        print_info(args.path)
+        return
+
+    start = time.perf_counter()
+    index = get_index()
+    if args.command == "export":
+        count = export_snapshot(index, args.path, args.prefix, args.workers, args.dtype)
+        print(f"🎉 Exported {count} records in {time.perf_counter() - start:.1f}s")
+    else:
+        import_snapshot(index, args.path, args.workers)
+        print(f"🎉 Import finished in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
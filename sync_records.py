@@ -0,0 +1,191 @@
+"""
+Incrementally sync the Pinecone index with a source CSV file.
+
+The CSV is diffed against the current index state, read either from the index
+itself (listing ``csv-`` ids and fetching their stored source hash) or from the
+ingestion manifest written by populate_pinecone_db_with_csv.py. Only new or changed
+rows are scraped, embedded and upserted, and only documents that disappeared from
+the CSV are deleted, so a refresh no longer needs a full wipe and re-ingest.
+
+Examples:
+    python sync_records.py sample_data.csv --dry-run
+    python sync_records.py sample_data.csv --state manifest
+"""
+import argparse
+import csv
+import os
+import sys
+import time
+from typing import Any, Dict, List
+
+from chunking import make_chunk_id, parse_chunk_id
+from delete_records import delete_ids, fetch_metadata, get_index, list_ids
+from hot_tier import update_local_indexes
+from populate_pinecone_db_with_csv import (
+    CSV_ID_PREFIX,
+    DEFAULT_MANIFEST_PATH,
+    compute_source_hash,
+    load_manifest,
+    make_doc_id,
+    process_csv_row,
+    save_manifest,
+    update_manifest,
+)
+from upsert_engine import UpsertEngine
+
+
+def read_source_rows(csv_file_path: str) -> Dict[str, Dict[str, Any]]:
+    """Read the CSV and key each row by its stable document id"""
+    rows = {}
+    with open(csv_file_path, 'r', encoding='utf-8') as csvfile:
+        for row_index, row in enumerate(csv.DictReader(csvfile)):
+            page_url = row.get('pageURL', '').strip()
+            if not page_url:
+                print(f"⚠️  Skipping row {row_index + 1}: pageURL is required")
+                continue
+            rows[make_doc_id(page_url)] = {
+                'row': row,
+                'row_index': row_index,
+                'source_hash': compute_source_hash(row),
+            }
+    return rows
+
+
+def index_state(index) -> Dict[str, Dict[str, Any]]:
+    """Read document state (source hash and chunk ids) from the index"""
+    state: Dict[str, Dict[str, Any]] = {}
+    for vector_id in list_ids(index, CSV_ID_PREFIX):
+        doc_id, _ = parse_chunk_id(vector_id)
+        state.setdefault(doc_id, {'source_hash': None, 'alternate_urls': [], 'chunk_ids': []})['chunk_ids'].append(vector_id)
+
+    # Every chunk carries the document's source hash; fetching the first one is enough
+    first_chunks = {doc_id: sorted(entry['chunk_ids'])[0] for doc_id, entry in state.items()}
+    metadata = fetch_metadata(index, list(first_chunks.values()))
+    for doc_id, vector_id in first_chunks.items():
+        state[doc_id]['source_hash'] = metadata.get(vector_id, {}).get('source_hash')
+        state[doc_id]['alternate_urls'] = list(metadata.get(vector_id, {}).get('alternate_urls', []))
+    return state
+
+
+def diff_state(
+    source: Dict[str, Dict[str, Any]],
+    current: Dict[str, Dict[str, Any]],
+) -> Dict[str, List[str]]:
+    """
+    Classify document ids into new, changed, removed, unchanged and duplicate.
+    Rows whose URL is stored as an alternate URL of an indexed document were
+    collapsed as near-duplicates at ingestion and are not re-ingested.
+    """
+    diff: Dict[str, List[str]] = {'new': [], 'changed': [], 'removed': [], 'unchanged': [], 'duplicate': []}
+    alternate_urls = {url for entry in current.values() for url in entry.get('alternate_urls', [])}
+    for doc_id, entry in source.items():
+        if doc_id not in current and entry['row'].get('pageURL', '').strip() in alternate_urls:
+            diff['duplicate'].append(doc_id)
+        elif doc_id not in current:
+            diff['new'].append(doc_id)
+        elif current[doc_id].get('source_hash') != entry['source_hash']:
+            diff['changed'].append(doc_id)
+        else:
+            diff['unchanged'].append(doc_id)
+    diff['removed'] = [doc_id for doc_id in current if doc_id not in source]
+    return diff
+
+
+def print_report(diff: Dict[str, List[str]], source: Dict[str, Dict[str, Any]], current: Dict[str, Dict[str, Any]]) -> None:
+    """Print the sync plan"""
+    print("\n📋 Sync plan:")
+    print(f"   ➕ New:       {len(diff['new'])}")
+    print(f"   ✏️  Changed:   {len(diff['changed'])}")
+    print(f"   ➖ Removed:   {len(diff['removed'])}")
+    print(f"   ✔️  Unchanged: {len(diff['unchanged'])}")
+    print(f"   ♻️  Duplicate: {len(diff['duplicate'])}")
+    for label in ('new', 'changed'):
+        for doc_id in diff[label]:
+            print(f"   {label:>8}: {doc_id} {source[doc_id]['row'].get('pageURL', '').strip()}")
+    for doc_id in diff['removed']:
+        print(f"   {'removed':>8}: {doc_id} ({len(current[doc_id].get('chunk_ids', []))} chunks)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incrementally sync Pinecone with a source CSV")
+    parser.add_argument("csv_file", nargs="?", default="sample_data.csv", help="Source CSV file")
+    parser.add_argument("--state", choices=["index", "manifest"], default="index",
+                        help="Diff against the live index or the ingestion manifest")
+    parser.add_argument("--manifest", default=os.getenv("INGESTION_MANIFEST", DEFAULT_MANIFEST_PATH),
+                        help="Path of the ingestion manifest")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would change")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.csv_file):
+        print(f"❌ CSV file not found: {args.csv_file}")
+        sys.exit(1)
+
+    index = get_index()
+    source = read_source_rows(args.csv_file)
+    manifest = load_manifest(args.manifest)
+    current = manifest if args.state == "manifest" else index_state(index)
+
+    print(f"🔄 Syncing {len(source)} source rows from {args.csv_file} against the {args.state}")
+    diff = diff_state(source, current)
+    print_report(diff, source, current)
+
+    if args.dry_run:
+        print("\n🔍 Dry run: no changes made")
+        return
+
+    # Scrape, embed and upsert new and changed documents
+    vectors = []
+    stale_ids = []
+    failed_docs = []
+    for doc_id in diff['new'] + diff['changed']:
+        entry = source[doc_id]
+        try:
+            chunk_vectors = process_csv_row(entry['row'], entry['row_index'])
+        except Exception as e:
+            print(f"❌ Failed to process {doc_id}: {e}")
+            failed_docs.append(doc_id)
+            continue
+        alternate_urls = current.get(doc_id, {}).get('alternate_urls')
+        for v in chunk_vectors:
+            if alternate_urls:
+                v['metadata']['alternate_urls'] = alternate_urls
+            vectors.append((v['id'], v['values'], v['metadata']))
+        # A changed document may now have fewer chunks than before
+        new_chunk_ids = {make_chunk_id(doc_id, i) for i in range(len(chunk_vectors))}
+        stale_ids.extend(
+            vector_id for vector_id in current.get(doc_id, {}).get('chunk_ids', [])
+            if vector_id not in new_chunk_ids
+        )
+        time.sleep(1)  # Be respectful to websites
+
+    failed_ids: List[str] = []
+    if vectors:
+        print(f"\n🔄 Upserting {len(vectors)} vectors...")
+        stats = UpsertEngine(index, max_workers=int(os.getenv("UPSERT_WORKERS", 4))).upsert(vectors)
+        failed_ids = stats.failed_ids
+        print(f"📈 Upsert throughput: {stats.summary()}")
+
+    # Delete removed documents and leftover chunks of changed documents
+    removed_ids = [
+        vector_id for doc_id in diff['removed'] for vector_id in current[doc_id].get('chunk_ids', [])
+    ]
+    if removed_ids or stale_ids:
+        deleted = delete_ids(index, removed_ids + stale_ids)
+        print(f"🗑️  Deleted {deleted} vectors")
+
+    update_local_indexes(vectors, failed_ids=failed_ids, removed_ids=removed_ids + stale_ids)
+
+    for doc_id in diff['removed'] + diff['changed']:
+        manifest.pop(doc_id, None)
+    save_manifest(update_manifest(manifest, vectors, failed_ids), args.manifest)
+
+    print("\n📊 Summary:")
+    print(f"✅ Upserted documents: {len(diff['new']) + len(diff['changed']) - len(failed_docs)}")
+    print(f"🗑️  Removed documents: {len(diff['removed'])}")
+    if failed_docs or failed_ids:
+        print(f"💥 Failed documents: {failed_docs} / vectors: {failed_ids}")
+    print(f"🗂️  Ingestion manifest updated: {args.manifest}")
+
+
+if __name__ == "__main__":
+    main()
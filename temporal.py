@@ -0,0 +1,167 @@
+"""
+Deterministic resolution of symbolic temporal expressions in generated filters.
+
+The agent expresses relative dates symbolically so that its output does not depend
+on the day it was generated and can be cached indefinitely:
+
+    {"tags": {"$in": ["AI"]}, "$date": "last_year"}
+
+``resolve_temporal`` replaces every ``"$date"`` key with concrete
+published_year/month/day conditions for the request's date. Ranges that cross
+month or year boundaries become an ``$or`` of per-period conditions.
+
+Supported expressions:
+    today, yesterday, this_week, last_week, this_month, last_month, this_year, last_year,
+    last_n_days:N, last_n_weeks:N, last_n_months:N, last_n_years:N
+"""
+
+import calendar
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+DATE_KEY = "$date"
+TEMPORAL_EXPRESSIONS = [
+    "today", "yesterday", "this_week", "last_week", "this_month", "last_month",
+    "this_year", "last_year", "last_n_days:N", "last_n_weeks:N", "last_n_months:N", "last_n_years:N",
+]
+
+
+def _months_before(day: date, months: int) -> date:
+    """Same day ``months`` months earlier, clamped to the end of shorter months"""
+    month_index = day.year * 12 + day.month - 1 - months
+    year, month = divmod(month_index, 12)
+    return date(year, month + 1, min(day.day, calendar.monthrange(year, month + 1)[1]))
+
+
+def expression_range(expression: str, today: date) -> Tuple[date, date]:
+    """
+    Inclusive (start, end) dates of a symbolic expression. Calendar periods
+    (this_week/month/year) span the whole period, since nothing is published later than today.
+    ``last_n_*:N`` spans exactly N periods ending today (last_n_days:7 is 7 days).
+    """
+    name, _, argument = expression.strip().lower().partition(":")
+    if name == "today":
+        return today, today
+    if name == "yesterday":
+        day = today - timedelta(days=1)
+        return day, day
+    if name == "this_week":
+        monday = today - timedelta(days=today.weekday())
+        return monday, monday + timedelta(days=6)
+    if name == "last_week":
+        monday = today - timedelta(days=today.weekday())
+        return monday - timedelta(days=7), monday - timedelta(days=1)
+    if name == "this_month":
+        return today.replace(day=1), today.replace(day=calendar.monthrange(today.year, today.month)[1])
+    if name == "last_month":
+        end = today.replace(day=1) - timedelta(days=1)
+        return end.replace(day=1), end
+    if name == "this_year":
+        return date(today.year, 1, 1), date(today.year, 12, 31)
+    if name == "last_year":
+        return date(today.year - 1, 1, 1), date(today.year - 1, 12, 31)
+    if name.startswith("last_n_"):
+        try:
+            count = int(argument)
+        except ValueError:
+            raise ValueError(f"Temporal expression {expression!r} needs a count, e.g. {name}:30")
+        if count < 1:
+            raise ValueError(f"Temporal expression {expression!r} needs a positive count")
+        # N periods ending today, today included: last_n_days:7 is today and the 6 days before
+        if name == "last_n_days":
+            return today - timedelta(days=count - 1), today
+        if name == "last_n_weeks":
+            return today - timedelta(days=7 * count - 1), today
+        if name == "last_n_months":
+            return _months_before(today, count) + timedelta(days=1), today
+        if name == "last_n_years":
+            return _months_before(today, 12 * count) + timedelta(days=1), today
+    raise ValueError(f"Unsupported temporal expression: {expression!r}")
+
+
+def date_range_filter(start: date, end: date) -> Dict[str, Any]:
+    """Filter on published_year/month/day matching dates from start to end inclusive"""
+    if start > end:
+        raise ValueError(f"Empty date range {start} .. {end}")
+
+    def month_span(year: int, first_month: int, last_month: int) -> Dict[str, Any]:
+        if first_month == 1 and last_month == 12:
+            return {"published_year": {"$eq": year}}
+        if first_month == last_month:
+            return {"published_year": {"$eq": year}, "published_month": {"$eq": first_month}}
+        return {"published_year": {"$eq": year}, "published_month": {"$gte": first_month, "$lte": last_month}}
+
+    def day_span(day_start: date, day_end: date) -> Dict[str, Any]:
+        """Days within a single month"""
+        clause = {"published_year": {"$eq": day_start.year}, "published_month": {"$eq": day_start.month}}
+        last_day = calendar.monthrange(day_start.year, day_start.month)[1]
+        if day_start.day == day_end.day:
+            clause["published_day"] = {"$eq": day_start.day}
+        elif day_start.day > 1 or day_end.day < last_day:
+            day_condition: Dict[str, int] = {}
+            if day_start.day > 1:
+                day_condition["$gte"] = day_start.day
+            if day_end.day < last_day:
+                day_condition["$lte"] = day_end.day
+            clause["published_day"] = day_condition
+        return clause
+
+    if (start.year, start.month) == (end.year, end.month):
+        return day_span(start, end)
+
+    clauses: List[Dict[str, Any]] = []
+    # Partial first month
+    first_full = start
+    if start.day > 1:
+        month_end = date(start.year, start.month, calendar.monthrange(start.year, start.month)[1])
+        clauses.append(day_span(start, month_end))
+        first_full = month_end + timedelta(days=1)
+    # Partial last month
+    last_full = end
+    tail: Optional[Dict[str, Any]] = None
+    if end.day < calendar.monthrange(end.year, end.month)[1]:
+        tail = day_span(end.replace(day=1), end)
+        last_full = end.replace(day=1) - timedelta(days=1)
+    # Whole months in between, grouped per year
+    if first_full <= last_full:
+        for year in range(first_full.year, last_full.year + 1):
+            first_month = first_full.month if year == first_full.year else 1
+            last_month = last_full.month if year == last_full.year else 12
+            clauses.append(month_span(year, first_month, last_month))
+    if tail:
+        clauses.append(tail)
+    return clauses[0] if len(clauses) == 1 else {"$or": clauses}
+
+
+def _combine(base: Dict[str, Any], resolved: Dict[str, Any]) -> Dict[str, Any]:
+    """Conjunction of two filters, merged into one dict when their keys do not collide"""
+    if not base:
+        return resolved
+    if not set(base) & set(resolved):
+        return {**base, **resolved}
+    return {"$and": [base, resolved]}
+
+
+def has_temporal(pinecone_filter: Any) -> bool:
+    """True if a filter still contains symbolic temporal expressions"""
+    if isinstance(pinecone_filter, dict):
+        return DATE_KEY in pinecone_filter or any(has_temporal(value) for value in pinecone_filter.values())
+    if isinstance(pinecone_filter, list):
+        return any(has_temporal(item) for item in pinecone_filter)
+    return False
+
+
+def resolve_temporal(pinecone_filter: Dict[str, Any], today: Optional[date] = None) -> Dict[str, Any]:
+    """Replace symbolic ``$date`` expressions with concrete date conditions for ``today``"""
+    if not has_temporal(pinecone_filter):
+        return pinecone_filter
+    today = today or date.today()
+    resolved: Dict[str, Any] = {}
+    for key, value in pinecone_filter.items():
+        if key in ("$and", "$or"):
+            resolved[key] = [resolve_temporal(clause, today) for clause in value]
+        elif key != DATE_KEY:
+            resolved[key] = value
+    if DATE_KEY not in pinecone_filter:
+        return resolved
+    return _combine(resolved, date_range_filter(*expression_range(pinecone_filter[DATE_KEY], today)))
@@ -10,6 +10,8 @@ import json
 import time
 from typing import Dict, List, Any
 
+from filter_compiler import canonical_form
+
 # Configuration
 API_BASE_URL = "http://localhost:8000"
 BATCH_QUERY_ENDPOINT = f"{API_BASE_URL}/batch-query"
@@ -77,6 +79,8 @@ def process_batch_queries(queries: List[str]) -> Dict[str, Any]:
 
 def compare_filters(expected: Dict[str, Any], actual: Dict[str, Any]) -> Dict[str, Any]:
     """Compare expected and actual filters, returning comparison results."""
+    # Equivalent filters ("author": "X" and {"$eq": "X"}, tags in any order) compare equal
+    expected, actual = canonical_form(expected), canonical_form(actual)
     comparison = {
         "exact_match": expected == actual,
         "missing_fields": [],
@@ -11,6 +11,8 @@ import json
 import time
 from typing import Dict, List, Any
 
+from filter_compiler import canonical_form
+
 # Configuration
 API_BASE_URL = "http://localhost:8000"
 BATCH_QUERY_ENDPOINT = f"{API_BASE_URL}/batch-query"
@@ -317,6 +319,8 @@ def analyze_validation_results(validations: List[Dict[str, Any]]) -> Dict[str, A
 
 def compare_pinecone_filters(expected: Dict[str, Any], actual: Dict[str, Any]) -> Dict[str, Any]:
     """Compare expected and actual Pinecone filters, returning comparison results."""
+    # Equivalent filters ("author": "X" and {"$eq": "X"}, tags in any order) compare equal
+    expected, actual = canonical_form(expected), canonical_form(actual)
     comparison = {
         "exact_match": expected == actual,
         "missing_fields": [],
@@ -0,0 +1,65 @@
+"""
+Test script for conversational refinement (conversation.py)
+
+This script loads follow-up utterances from test_samples-refinements.json, applies each
+to the same base filter locally (no API, LLM or embedding calls) and compares the result
+with the expected filter; an expected filter of null means the utterance must go to the LLM.
+"""
+
+import json
+import sys
+from datetime import date
+from typing import Any, Dict
+
+from conversation import apply_refinement
+from filter_compiler import canonical_form
+
+TEST_SAMPLES_FILE = "test_samples-refinements.json"
+
+
+def load_test_samples() -> Dict[str, Any]:
+    """Load test samples from JSON file."""
+    try:
+        with open(TEST_SAMPLES_FILE, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        print(f"❌ Test samples file not found: {TEST_SAMPLES_FILE}")
+        return {}
+    except json.JSONDecodeError as e:
+        print(f"❌ Error parsing test samples file: {e}")
+        return {}
+
+
+def run_refinement_test() -> bool:
+    """Run every sample; returns whether all of them passed."""
+    print("🧪 Conversational Refinement Test")
+    print("=" * 50)
+
+    test_data = load_test_samples()
+    if not test_data:
+        return False
+    base_filter = test_data["base_filter"]
+    today = date.fromisoformat(test_data["today"])
+    samples = test_data.get("samples", [])
+    print(f"Base filter: {json.dumps(base_filter)}")
+
+    failures = 0
+    for i, sample in enumerate(samples, 1):
+        utterance = sample["utterance"]
+        expected = sample["expected_filter"]
+        actual = apply_refinement(base_filter, utterance, today)
+        passed = actual is None if expected is None else actual is not None and canonical_form(expected) == actual
+        print(f"\n[{i}] {utterance!r} ({sample.get('description', '')})")
+        if passed:
+            print(f"    ✅ {json.dumps(actual) if actual is not None else 'goes to the LLM'}")
+            continue
+        failures += 1
+        print(f"    ❌ Generated: {json.dumps(actual)}")
+        print(f"       Expected:  {json.dumps(expected)}")
+
+    print(f"\nSummary: {len(samples) - failures}/{len(samples)} passed")
+    return failures == 0
+
+
+if __name__ == "__main__":
+    sys.exit(0 if run_refinement_test() else 1)
@@ -0,0 +1,211 @@
+"""
+Adaptive, byte-aware parallel upsert engine for Pinecone writes.
+
+Vectors are packed into batches by serialized request size rather than by a fixed
+count, since full article content is stored in metadata. Batches are sent by a pool
+of workers, throttled or transient failures are retried with exponential backoff,
+and batches rejected as too large are split in half and resent.
+"""
+
+import json
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from threading import Lock
+from typing import Any, Dict, Iterable, List, Sequence, Tuple, Union
+
+from vector_types import VectorLike, to_pinecone
+
+# Pinecone rejects upsert requests above 2MB and batches above 1000 vectors
+MAX_REQUEST_BYTES = 2 * 1024 * 1024
+MAX_BATCH_VECTORS = 1000
+
+VectorRecord = Union[Tuple[str, VectorLike, Dict[str, Any]], Dict[str, Any]]
+
+
+@dataclass
+class UpsertStats:
+    """Counters collected while upserting"""
+    vectors: int = 0
+    bytes: int = 0
+    batches: int = 0
+    retries: int = 0
+    splits: int = 0
+    failed_ids: List[str] = field(default_factory=list)
+    elapsed: float = 0.0
+
+    @property
+    def vectors_per_second(self) -> float:
+        return self.vectors / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def bytes_per_second(self) -> float:
+        return self.bytes / self.elapsed if self.elapsed else 0.0
+
+    def summary(self) -> str:
+        return (
+            f"{self.vectors} vectors in {self.batches} batches, "
+            f"{self.elapsed:.1f}s ({self.vectors_per_second:.1f} vectors/s, "
+            f"{self.bytes_per_second / 1024:.1f} KB/s), "
+            f"{self.retries} retries, {self.splits} splits, {len(self.failed_ids)} failed"
+        )
+
+
+def _as_tuple(record: VectorRecord) -> Tuple[str, VectorLike, Dict[str, Any]]:
+    """Accept both (id, values, metadata) tuples and {'id', 'values', 'metadata'} dicts"""
+    if isinstance(record, dict):
+        return record['id'], record['values'], record.get('metadata') or {}
+    return record[0], record[1], record[2] if len(record) > 2 else {}
+
+
+def estimate_record_bytes(record: Tuple[str, VectorLike, Dict[str, Any]]) -> int:
+    """Approximate serialized request size of a single vector record"""
+    vector_id, values, metadata = record
+    return len(json.dumps(
+        {"id": vector_id, "values": to_pinecone(values), "metadata": metadata},
+        separators=(',', ':'),
+    ).encode('utf-8'))
+
+
+def _error_status(error: Exception) -> int:
+    """Extract an HTTP status code from a Pinecone/requests exception, 0 if unknown"""
+    for attr in ('status', 'status_code', 'code'):
+        value = getattr(error, attr, None)
+        if isinstance(value, int):
+            return value
+    response = getattr(error, 'response', None)
+    status = getattr(response, 'status_code', None)
+    return status if isinstance(status, int) else 0
+
+
+def _is_too_large(error: Exception) -> bool:
+    status = _error_status(error)
+    message = str(error).lower()
+    return status == 413 or 'too large' in message or ('exceeds' in message and 'size' in message)
+
+
+def _is_retryable(error: Exception) -> bool:
+    status = _error_status(error)
+    if status == 429 or status >= 500:
+        return True
+    message = str(error).lower()
+    return status == 0 and any(
+        hint in message for hint in ('timeout', 'timed out', 'connection', 'unavailable', 'too many requests')
+    )
+
+
+class UpsertEngine:
+    """
+    Upsert vectors to a Pinecone index in byte-sized batches using parallel workers.
+
+    Args:
+        index: Pinecone Index (anything with an ``upsert(vectors=...)`` method)
+        max_request_bytes: Target serialized size per request, kept below the 2MB limit
+        max_batch_vectors: Maximum number of vectors per request
+        max_workers: Number of batches sent in parallel
+        max_retries: Attempts per batch on throttling or transient errors
+        base_backoff: Initial backoff in seconds, doubled on every retry
+        verbose: Print a line for every batch
+    """
+
+    def __init__(
+        self,
+        index: Any,
+        max_request_bytes: int = int(MAX_REQUEST_BYTES * 0.9),
+        max_batch_vectors: int = MAX_BATCH_VECTORS,
+        max_workers: int = 4,
+        max_retries: int = 5,
+        base_backoff: float = 1.0,
+        verbose: bool = True,
+    ):
+        self.index = index
+        self.max_request_bytes = max_request_bytes
+        self.max_batch_vectors = max_batch_vectors
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.verbose = verbose
+        self._lock = Lock()
+
+    def make_batches(
+        self, records: Iterable[VectorRecord]
+    ) -> Iterable[Tuple[List[Tuple[str, VectorLike, Dict[str, Any]]], int]]:
+        """Pack records into batches bounded by serialized bytes and vector count"""
+        batch: List[Tuple[str, VectorLike, Dict[str, Any]]] = []
+        batch_bytes = 0
+        for record in records:
+            record = _as_tuple(record)
+            size = estimate_record_bytes(record)
+            if batch and (
+                batch_bytes + size > self.max_request_bytes
+                or len(batch) >= self.max_batch_vectors
+            ):
+                yield batch, batch_bytes
+                batch, batch_bytes = [], 0
+            batch.append(record)
+            batch_bytes += size
+        if batch:
+            yield batch, batch_bytes
+
+    def _send(
+        self,
+        batch: Sequence[Tuple[str, VectorLike, Dict[str, Any]]],
+        batch_bytes: int,
+        stats: UpsertStats,
+    ) -> None:
+        """Send one batch, retrying with backoff and splitting oversized batches"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.index.upsert(vectors=[
+                    (vector_id, to_pinecone(values), metadata) for vector_id, values, metadata in batch
+                ])
+                with self._lock:
+                    stats.vectors += len(batch)
+                    stats.bytes += batch_bytes
+                    stats.batches += 1
+                    batch_number = stats.batches
+                if self.verbose:
+                    print(f"✅ Upserted batch {batch_number} ({len(batch)} vectors, {batch_bytes / 1024:.0f} KB)")
+                return
+            except Exception as e:
+                if _is_too_large(e) and len(batch) > 1:
+                    with self._lock:
+                        stats.splits += 1
+                    middle = len(batch) // 2
+                    for half in (batch[:middle], batch[middle:]):
+                        self._send(half, sum(estimate_record_bytes(r) for r in half), stats)
+                    return
+                if attempt < self.max_retries and _is_retryable(e):
+                    delay = self.base_backoff * (2 ** attempt) * (1 + random.random() * 0.25)
+                    with self._lock:
+                        stats.retries += 1
+                    if self.verbose:
+                        print(f"⏳ Upsert throttled or failed ({e}); retrying in {delay:.1f}s")
+                    time.sleep(delay)
+                    continue
+                print(f"❌ Failed to upsert batch of {len(batch)} vectors: {e}")
+                with self._lock:
+                    stats.failed_ids.extend(vector_id for vector_id, _, _ in batch)
+                return
+
+    def upsert(self, records: Iterable[VectorRecord]) -> UpsertStats:
+        """
+        Upsert all records and return throughput statistics.
+        Failed vectors are reported in ``stats.failed_ids`` instead of raising.
+        """
+        stats = UpsertStats()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = []
+            for batch, batch_bytes in self.make_batches(records):
+                futures.append(executor.submit(self._send, batch, batch_bytes, stats))
+                # Keep a bounded number of batches in flight so large inputs stream
+                if len(futures) >= self.max_workers * 2:
+                    done = next(as_completed(futures))
+                    futures.remove(done)
+                    done.result()
+            for future in as_completed(futures):
+                future.result()
+        stats.elapsed = time.perf_counter() - start
+        return stats
@@ -0,0 +1,69 @@
+"""
+Compact vector representation shared by the embedding client, ingestion scripts and the API.
+
+Embeddings are kept as contiguous NumPy float32 arrays (3KB for a 768-dim vector
+instead of ~25KB as a list of Python floats) from the Ollama response parse to the
+Pinecone boundary, where they are converted to plain lists only when a request is
+serialized. Caches may store them as float16 to halve memory again.
+"""
+
+from typing import Any, Iterable, List, Sequence, Union
+
+import numpy as np
+
+VECTOR_DTYPE = np.float32
+CACHE_DTYPE = np.float16
+
+# A single embedding: 1-D float array (lists are accepted wherever a vector is read)
+Vector = np.ndarray
+VectorLike = Union[np.ndarray, Sequence[float]]
+
+
+def to_vector(values: VectorLike, dtype: Any = VECTOR_DTYPE) -> Vector:
+    """Convert a sequence of floats to a contiguous 1-D array without copying when possible"""
+    vector = np.asarray(values, dtype=dtype)
+    if vector.ndim != 1:
+        raise ValueError(f"Expected a 1-D vector, got shape {vector.shape}")
+    return np.ascontiguousarray(vector)
+
+
+def to_matrix(rows: Union[np.ndarray, Iterable[VectorLike]], dtype: Any = VECTOR_DTYPE) -> np.ndarray:
+    """Stack vectors into a contiguous 2-D array (one row per vector)"""
+    if isinstance(rows, np.ndarray):
+        matrix = rows.astype(dtype, copy=False)
+    else:
+        rows = list(rows)
+        if not rows:
+            return np.empty((0, 0), dtype=dtype)
+        matrix = np.asarray(rows, dtype=dtype)
+    if matrix.ndim != 2:
+        raise ValueError(f"Expected a 2-D matrix, got shape {matrix.shape}")
+    return np.ascontiguousarray(matrix)
+
+
+def to_pinecone(values: VectorLike) -> List[float]:
+    """Plain list of Python floats, as the Pinecone client serializes it"""
+    if isinstance(values, np.ndarray):
+        return values.tolist()
+    return [float(value) for value in values]
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalize a vector or each row of a matrix (zero vectors are left as they are)"""
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return (vectors / np.where(norms == 0, 1, norms)).astype(vectors.dtype, copy=False)
+
+
+def truncate_embeddings(vectors: np.ndarray, dimension: int) -> np.ndarray:
+    """
+    Matryoshka truncation as recommended for nomic-embed-text: layer-normalize the
+    full vector, keep the first ``dimension`` components and L2-normalize again.
+    Works on a single vector or a matrix of rows; vectors that are not wider than
+    ``dimension`` are returned unchanged.
+    """
+    if not dimension or vectors.shape[-1] <= dimension:
+        return vectors
+    full = vectors.astype(VECTOR_DTYPE, copy=False)
+    mean = full.mean(axis=-1, keepdims=True)
+    std = np.sqrt(full.var(axis=-1, keepdims=True) + 1e-5)
+    return np.ascontiguousarray(normalize(((full - mean) / std)[..., :dimension]))